@@ -9,6 +9,7 @@
 #include <arpa/inet.h>
 #include <unistd.h>
 #include <cstring>
+#include <cstddef>
 #include <csignal>
 #include <sys/time.h>
 
@@ -23,11 +24,42 @@
 
 extern sem_t image_sem, temp_sem, image_done_sem, temp_done_sem;
 
+// Э v2: ħ + ԭֶ + /־ + ͷ CRC32 (ǰ 24 ֽ)
+// PC Уʧʱɨħͬö
+#define PACKET_MAGIC "4DP2"
+
+#pragma pack(push, 1)
 struct PacketHeader {
+    char magic[4];
     uint64_t timestamp_us;
     uint32_t data_size;
     uint32_t frame_id;
+    uint16_t payload_type;
+    uint16_t flags;
+    uint32_t header_crc;
 };
+#pragma pack(pop)
+
+//  zlib.crc32 ͬĶʽͷֻ 24 ֽڣλ㼴
+uint32_t crc32(const void* data, size_t len) {
+    const uint8_t* p = (const uint8_t*)data;
+    uint32_t crc = 0xFFFFFFFF;
+    for (size_t i = 0; i < len; i++) {
+        crc ^= p[i];
+        for (int k = 0; k < 8; k++) crc = (crc >> 1) ^ (0xEDB88320 & (0u - (crc & 1)));
+    }
+    return ~crc;
+}
+
+void fill_header(PacketHeader& h, uint64_t ts, uint32_t size, uint32_t fid) {
+    memcpy(h.magic, PACKET_MAGIC, 4);
+    h.timestamp_us = ts;
+    h.data_size = size;
+    h.frame_id = fid;
+    h.payload_type = 0;
+    h.flags = 0;
+    h.header_crc = crc32(&h, offsetof(PacketHeader, header_crc));
+}
 
 // --- 縨 ---
 bool send_all(int sock, const void* data, size_t size) {
@@ -83,9 +115,7 @@ void* video_sender_thread(void* arg) {
         }
 
         if (driver->getLatestRawFrame(packet)) {
-            header.timestamp_us = packet.timestamp_us;
-            header.data_size = packet.data.size();
-            header.frame_id = packet.frame_id;
+            fill_header(header, packet.timestamp_us, packet.data.size(), packet.frame_id);
 
             bool ok = send_all(sock, &header, sizeof(header));
             if (ok) ok = send_all(sock, packet.data.data(), packet.data.size());
@@ -142,9 +172,7 @@ void* thermal_sender_thread(void* arg) {
         }
 
         if (sock >= 0) {
-            header.timestamp_us = now_us;
-            header.data_size = data_len;
-            header.frame_id = frame_id++;
+            fill_header(header, now_us, data_len, frame_id++);
 
             bool ok = send_all(sock, &header, sizeof(header));
             if (ok) ok = send_all(sock, local_buffer.data(), data_len);
@@ -1,26 +1,103 @@
 import cv2
 import numpy as np
 import os
-from config import VIS_W, VIS_H, THERMAL_W, THERMAL_H
+import hashlib
+import threading
+from config import (VIS_W, VIS_H, THERMAL_W, THERMAL_H, ALIGN_MODE,
+                    ALIGN_HOMOGRAPHY_FILE, ALIGN_CAMERA_FILE, ALIGN_DIST_FILE)
+
+
+def _finish_overlay(x1, y1, mx, my):
+    """ 目标区域上的浮点映射 -> (x1, y1, x2, y2, map1, map2, hole) """
+    valid = (mx >= -0.5) & (mx <= THERMAL_W - 0.5) & (my >= -0.5) & (my <= THERMAL_H - 0.5)
+    hole = None if valid.all() else (~valid).astype(np.uint8)
+    map1, map2 = cv2.convertMaps(np.ascontiguousarray(mx, dtype=np.float32),
+                                 np.ascontiguousarray(my, dtype=np.float32), cv2.CV_16SC2)
+    return x1, y1, x1 + mx.shape[1], y1 + mx.shape[0], map1, map2, hole
+
+
+def edge_map(img, blur=1.5):
+    """ 梯度幅值，按均值归一化: 可见光和热成像亮度没有可比性，边缘位置才有 """
+    f = cv2.GaussianBlur(img.astype(np.float32), (0, 0), blur)
+    gx = cv2.Sobel(f, cv2.CV_32F, 1, 0, ksize=3)
+    gy = cv2.Sobel(f, cv2.CV_32F, 0, 1, ksize=3)
+    mag = cv2.magnitude(gx, gy)
+    return mag / max(float(mag.mean()), 1e-6)
+
+
+def estimate_shift(vis, therm, mask=None, width=160, levels=3, iters=30):
+    """
+    [无标定物对齐]: 比较可见光与 (已按当前变换映射到可见光目标区域的) 热成像的边缘图
+    vis / therm 同尺寸，mask 非零处为有热成像覆盖的像素；先缩到 width 宽，再金字塔由粗到细做 ECC 平移估计。
+    返回 (dx, dy, cc): 热成像内容应当平移 (-dx, -dy) 才能和可见光重合 (全分辨率像素)，
+    cc 为最细一层的相关系数；边缘太少或不收敛返回 None。
+    """
+    h, w = vis.shape[:2]
+    f = min(1.0, width / w)
+    size = (max(8, int(w * f)), max(8, int(h * f)))
+    ev = edge_map(cv2.resize(vis, size, interpolation=cv2.INTER_AREA))
+    et = edge_map(cv2.resize(therm, size, interpolation=cv2.INTER_AREA))
+    m = None if mask is None else cv2.resize(mask, size, interpolation=cv2.INTER_NEAREST)
+    # 纹理太少 (白墙、天空) 不做估计
+    if (ev > 2.0).mean() < 0.02 or (et > 2.0).mean() < 0.02: return None
+
+    pyr = [(ev, et, m)]
+    for _ in range(levels - 1):
+        a, b, c = pyr[-1]
+        if min(a.shape) < 32: break
+        a, b = cv2.pyrDown(a), cv2.pyrDown(b)
+        pyr.append((a, b, None if c is None else cv2.resize(c, a.shape[::-1], interpolation=cv2.INTER_NEAREST)))
+
+    warp = np.eye(2, 3, dtype=np.float32)
+    crit = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, iters, 1e-4)
+    cc = 0.0
+    try:
+        for i, (a, b, c) in enumerate(reversed(pyr)):
+            if i: warp[:, 2] *= 2
+            cc, warp = cv2.findTransformECC(a, b, warp, cv2.MOTION_TRANSLATION, crit, c, 3)
+    except cv2.error:
+        return None
+    return float(warp[0, 2] / f), float(warp[1, 2] / f), float(cc)
+
+
+def default_camera_matrix():
+    # 没有标定内参时的近似: f = 图像宽度，主点在中心
+    return np.array([[VIS_W, 0, VIS_W / 2.0], [0, VIS_W, VIS_H / 2.0], [0, 0, 1]], dtype=np.float64)
+
 
 class ImageAligner:
-    def __init__(self):
+    def __init__(self, mode=ALIGN_MODE):
         self.save_path = "matrix_tactical.npy"
+        # affine: 手动 x/y/scale/angle；homography: 畸变校正 + 单应矩阵 (标定文件)
+        self.mode = mode
+        self.calib = None  # (H, K, dist, digest)，整体替换保证原子性
+        self.calib_cache = {}  # (vis_w, vis_h, digest) -> overlay
         self.x = VIS_W // 2
         self.y = VIS_H // 2
         self.scale = 2.5
         self.angle = 0.0
         self.opacity = 0.5
         self.aspect = THERMAL_W / THERMAL_H
+        self._overlay = None  # (key, overlay) 缓存，参数变化时清空
+        # 参数由 UI / AlignRefiner 线程改，SyncEngine 线程读: 改参数时代数 +1，
+        # 用旧参数算出的 overlay 在写回缓存前核对代数，过期的不写
+        self.lock = threading.RLock()
+        self._gen = 0
+        self.dirty = False  # 有没落盘的参数改动 (nudge 不写盘，由 flush() 收尾)
         self.load_params()
+        self.load_matrices()
 
-    def update_params(self, x=None, y=None, scale=None, angle=None, opacity=None):
-        if x is not None: self.x = x
-        if y is not None: self.y = y
-        if scale is not None: self.scale = max(0.1, min(10.0, scale))
-        if angle is not None: self.angle = angle
-        if opacity is not None: self.opacity = max(0.1, min(1.0, opacity))
-        self.save_params()
+    def update_params(self, x=None, y=None, scale=None, angle=None, opacity=None, save=True):
+        with self.lock:
+            if x is not None: self.x = x
+            if y is not None: self.y = y
+            if scale is not None: self.scale = max(0.1, min(10.0, scale))
+            if angle is not None: self.angle = angle
+            if opacity is not None: self.opacity = max(0.1, min(1.0, opacity))
+            self._gen += 1
+            self._overlay = None
+            if save: self.save_params()
+            else: self.dirty = True
 
     def get_transform_params(self):
         w = int(THERMAL_W * self.scale)
@@ -29,8 +106,161 @@ class ImageAligner:
         y = int(self.y - h / 2)
         return x, y, w, h, self.angle, self.opacity
 
+    def get_affine(self):
+        """
+        热成像像素坐标 -> 可见光像素坐标的 2x3 仿射 (缩放 + 绕中心旋转 + 平移)
+        与旧流程 resize(tw, th) -> 绕 (tw//2, th//2) 旋转 -> 放到 (tx, ty) 等价，但合成一次完成
+        """
+        x, y, w, h, angle, _ = self.get_transform_params()
+        sx, sy = w / THERMAL_W, h / THERMAL_H
+        # cv2.resize 的像素中心约定: dst = (src + 0.5) * s - 0.5
+        S = np.array([[sx, 0, 0.5 * sx - 0.5], [0, sy, 0.5 * sy - 0.5], [0, 0, 1]])
+        R = np.vstack([cv2.getRotationMatrix2D((w // 2, h // 2), float(angle), 1.0), [0, 0, 1]])
+        A = (R @ S)[:2]
+        A[:, 2] += (x, y)
+        return A
+
+    def get_overlay(self, vis_w=VIS_W, vis_h=VIS_H):
+        """
+        热成像叠加到可见光所需的全部信息，按参数缓存:
+        (x1, y1, x2, y2, map1, map2, hole)
+          x1..y2     - 可见光上的目标区域 (旋转后外接框，已裁到画面内)
+          map1/map2  - 目标区域 -> 热成像的定点 remap 表 (cv2.convertMaps, CV_16SC2)
+          hole       - 外接框里没有热成像覆盖的部分 (uint8 掩码)，无旋转时为 None
+        区域完全在画面外时返回 None。融合时只需一次 256x192 -> 目标区域的 remap。
+        vis_w / vis_h 小于 VIS_W x VIS_H 时 (缩小解码) 参数仍是全分辨率坐标，这里按比例换算。
+        """
+        calib = self.calib
+        if self.mode == "homography" and calib is not None:
+            return self._calib_overlay(calib, vis_w, vis_h)
+
+        key = (vis_w, vis_h)
+        with self.lock:
+            cached = self._overlay
+            if cached is not None and cached[0] == key: return cached[1]
+            gen, A = self._gen, self.get_affine()
+        if (vis_w, vis_h) != (VIS_W, VIS_H):
+            # 全分辨率像素 -> 缩小后像素，像素中心约定同 get_affine
+            sx, sy = vis_w / VIS_W, vis_h / VIS_H
+            D = np.array([[sx, 0, 0.5 * sx - 0.5], [0, sy, 0.5 * sy - 0.5]])
+            A = D @ np.vstack([A, [0, 0, 1]])
+        corners = A @ np.array([[-0.5, -0.5, 1], [THERMAL_W - 0.5, -0.5, 1],
+                                [-0.5, THERMAL_H - 0.5, 1], [THERMAL_W - 0.5, THERMAL_H - 0.5, 1]]).T
+        x1 = max(0, int(np.floor(corners[0].min() + 0.5)))
+        y1 = max(0, int(np.floor(corners[1].min() + 0.5)))
+        x2 = min(vis_w, int(np.ceil(corners[0].max() + 0.5)))
+        y2 = min(vis_h, int(np.ceil(corners[1].max() + 0.5)))
+
+        ov = None
+        if x2 > x1 and y2 > y1:
+            Ai = cv2.invertAffineTransform(A)
+            us = np.arange(x1, x2, dtype=np.float32)[None, :]
+            vs = np.arange(y1, y2, dtype=np.float32)[:, None]
+            mx = (Ai[0, 0] * us + Ai[0, 1] * vs + Ai[0, 2]).astype(np.float32)
+            my = (Ai[1, 0] * us + Ai[1, 1] * vs + Ai[1, 2]).astype(np.float32)
+            ov = _finish_overlay(x1, y1, mx, my)
+
+        with self.lock:
+            if self._gen == gen: self._overlay = (key, ov)
+        return ov
+
+    # ================= 标定模式: 畸变校正 + 单应 =================
+    def load_matrices(self):
+        """
+        matrix_homography.npy: 去畸变后的可见光像素 -> 热成像像素 (3x3)
+        dist_coeffs.npy:       可见光镜头畸变 (k1, k2[, p1, p2, k3])
+        camera_matrix.npy:     可见光内参；没有时不做去畸变 (畸变系数离开真实内参没有意义)
+        """
+        try:
+            if not os.path.exists(ALIGN_HOMOGRAPHY_FILE): return
+            H = np.load(ALIGN_HOMOGRAPHY_FILE).astype(np.float64)
+            K = dist = None
+            if os.path.exists(ALIGN_CAMERA_FILE):
+                K = np.load(ALIGN_CAMERA_FILE).astype(np.float64)
+                if os.path.exists(ALIGN_DIST_FILE): dist = np.load(ALIGN_DIST_FILE).astype(np.float64)
+            elif os.path.exists(ALIGN_DIST_FILE):
+                print(f"Align: {ALIGN_CAMERA_FILE} not found, ignoring {ALIGN_DIST_FILE} (no undistortion)")
+            self.set_matrices(H, K, dist, save=False)
+        except Exception as e:
+            print(f"Align: load matrices failed: {e}")
+
+    def set_matrices(self, H, K=None, dist=None, save=True, prebuild=(VIS_W, VIS_H)):
+        """
+        更换标定结果。先在调用线程里把映射表建好，再一次性替换 self.calib，
+        SyncEngine 不会看到 "矩阵换了一半" 的状态，也不会在渲染线程里卡一下。
+        K 为 None 表示没有真实内参: 只用单应，不去畸变 (默认内参只作占位，不落盘)
+        """
+        H = np.asarray(H, dtype=np.float64)
+        has_k = K is not None
+        K = np.asarray(K, dtype=np.float64) if has_k else default_camera_matrix()
+        d = np.zeros(5) if dist is None or not has_k else np.asarray(dist, dtype=np.float64).ravel()
+        if len(d) < 4: d = np.concatenate([d, np.zeros(5 - len(d))])
+        digest = hashlib.sha1(H.tobytes() + K.tobytes() + d.tobytes()).hexdigest()
+        calib = (H, K, d, digest)
+        if prebuild: self._calib_overlay(calib, *prebuild)
+        self.calib = calib
+        if save:
+            np.save(ALIGN_HOMOGRAPHY_FILE, H)
+            if has_k:
+                np.save(ALIGN_CAMERA_FILE, K)
+                np.save(ALIGN_DIST_FILE, d)
+
+    def set_mode(self, mode):
+        self.mode = mode
+
+    def nudge(self, dx, dy):
+        """
+        让叠加的热成像在可见光上整体移动 (dx, dy) 像素，用于跟踪机械漂移
+        affine 模式改平移参数；homography 模式右乘一个平移 (近似为去畸变坐标下的平移)
+        """
+        calib = self.calib
+        if self.mode == "homography" and calib is not None:
+            H, K, d, _ = calib
+            T = np.array([[1, 0, -dx], [0, 1, -dy], [0, 0, 1]], dtype=np.float64)
+            self.set_matrices(H @ T, K, d, save=False)
+        else:
+            # 每步都写盘太频繁，只标记 dirty，退出时 flush()
+            with self.lock:
+                self.update_params(x=self.x + dx, y=self.y + dy, save=False)
+
+    def _calib_overlay(self, calib, vis_w, vis_h):
+        H, K, dist, digest = calib
+        key = (vis_w, vis_h, digest)
+        ov = self.calib_cache.get(key)
+        if ov is not None or key in self.calib_cache: return ov
+
+        # 目标像素 (可能是降分辨率的) 在全分辨率下的坐标
+        sx, sy = VIS_W / vis_w, VIS_H / vis_h
+        us = (np.arange(vis_w, dtype=np.float32) + 0.5) * sx - 0.5
+        vs = (np.arange(vis_h, dtype=np.float32) + 0.5) * sy - 0.5
+        grid = np.empty((vis_h, vis_w, 2), dtype=np.float32)
+        grid[..., 0] = us[None, :]
+        grid[..., 1] = vs[:, None]
+
+        # 原始 (带畸变) 可见光像素 -> 去畸变像素 -> 单应 -> 热成像像素，合成为一张映射表
+        und = cv2.undistortPoints(grid.reshape(-1, 1, 2), K, dist, P=K)
+        t = cv2.perspectiveTransform(und, H).reshape(vis_h, vis_w, 2)
+        mx, my = t[..., 0], t[..., 1]
+
+        valid = (mx >= -0.5) & (mx <= THERMAL_W - 0.5) & (my >= -0.5) & (my <= THERMAL_H - 0.5)
+        ov = None
+        if valid.any():
+            rows, cols = np.flatnonzero(valid.any(axis=1)), np.flatnonzero(valid.any(axis=0))
+            y1, y2, x1, x2 = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+            ov = _finish_overlay(int(x1), int(y1), mx[y1:y2, x1:x2], my[y1:y2, x1:x2])
+        # nudge() 会不断产生新矩阵，旧的映射表不留
+        if len(self.calib_cache) >= 8: self.calib_cache.clear()
+        self.calib_cache[key] = ov
+        return ov
+
     def save_params(self):
-        np.save(self.save_path, [self.x, self.y, self.scale, self.angle, self.opacity])
+        with self.lock:
+            np.save(self.save_path, [self.x, self.y, self.scale, self.angle, self.opacity])
+            self.dirty = False
+
+    def flush(self):
+        """ 把 nudge 累积的改动落盘 (引擎停止时调用) """
+        if self.dirty: self.save_params()
 
     def load_params(self):
         if os.path.exists(self.save_path):
@@ -38,4 +268,5 @@ class ImageAligner:
                 p = np.load(self.save_path)
                 if len(p) == 5: self.x, self.y, self.scale, self.angle, self.opacity = p
                 else: self.x, self.y, self.scale = p[:3]
+                self._overlay = None
             except: pass
\ No newline at end of file
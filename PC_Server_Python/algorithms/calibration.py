@@ -0,0 +1,118 @@
+import cv2
+import numpy as np
+from config import VIS_W, VIS_H, CALIB_DEPTH_BAND, CALIB_BAND_MIN_VIEWS
+
+# 本模块只依赖 cv2 / numpy，供 AutoCalibrator 在子进程里调用 (进程池需要能按名字 import)
+
+# 热成像分辨率太低，放大后再找角点
+THERMAL_UPSCALE = 3
+VIS_DETECT_W = 640  # 可见光先在缩小图上快速判断有没有棋盘
+
+
+def _canonical(corners):
+    """ findChessboardCorners 的起点可能在左上也可能在右下，统一成左上开始，两路才能一一对应 """
+    c = corners.reshape(-1, 2)
+    if c[0].sum() > c[-1].sum(): c = c[::-1]
+    return np.ascontiguousarray(c, dtype=np.float32)
+
+
+def thermal_to_u8(raw, clip=(1.0, 99.0)):
+    """ uint16 原始值按百分位拉伸到 8 位，加热的铜板格子会比背景亮很多 """
+    lo, hi = np.percentile(raw, clip)
+    return cv2.convertScaleAbs(raw, alpha=255.0 / max(hi - lo, 1.0), beta=-lo * 255.0 / max(hi - lo, 1.0))
+
+
+def find_board_visible(img, pattern):
+    """ 可见光灰度图 -> (N, 2) 角点 (全分辨率坐标)，找不到返回 None """
+    h, w = img.shape[:2]
+    s = min(1.0, VIS_DETECT_W / w)
+    small = cv2.resize(img, (int(w * s), int(h * s)), interpolation=cv2.INTER_AREA) if s < 1.0 else img
+    flags = cv2.CALIB_CB_ADAPTIVE_THRESH | cv2.CALIB_CB_NORMALIZE_IMAGE | cv2.CALIB_CB_FAST_CHECK
+    ok, c = cv2.findChessboardCorners(small, pattern, flags=flags)
+    if not ok: return None
+    c = (c / s).astype(np.float32)
+    cv2.cornerSubPix(img, c, (11, 11), (-1, -1), (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.01))
+    # 降分辨率输入时换算回 VIS_W x VIS_H 坐标，标定结果统一按全分辨率
+    return _canonical(c) * np.float32(VIS_W / w)
+
+
+def find_board_thermal(raw, pattern):
+    """ 热成像 uint16 -> (N, 2) 角点 (热成像像素坐标)，找不到返回 None """
+    img = cv2.resize(thermal_to_u8(raw), None, fx=THERMAL_UPSCALE, fy=THERMAL_UPSCALE, interpolation=cv2.INTER_CUBIC)
+    for src in (img, 255 - img):  # 铜板加热/冷却两种极性都试一次
+        ok, c = cv2.findChessboardCornersSB(src, pattern, flags=cv2.CALIB_CB_NORMALIZE_IMAGE)
+        if ok: return _canonical((c.reshape(-1, 2) + 0.5) / THERMAL_UPSCALE - 0.5)
+    return None
+
+
+def detect_pair(v_img, t_raw, pattern):
+    """ 子进程入口: 两路都找到棋盘才返回 (v_corners, t_corners) """
+    v = find_board_visible(v_img, pattern)
+    if v is None: return None
+    t = find_board_thermal(t_raw, pattern)
+    if t is None: return None
+    return v, t
+
+
+def coverage(views, grid=(4, 4)):
+    """ 可见光画面按 grid 分格，被至少一个视角的角点覆盖的格子比例 """
+    hit = np.zeros(grid[::-1], dtype=bool)
+    for v, _ in views:
+        gx = np.clip((v[:, 0] * grid[0] / VIS_W).astype(int), 0, grid[0] - 1)
+        gy = np.clip((v[:, 1] * grid[1] / VIS_H).astype(int), 0, grid[1] - 1)
+        hit[gy, gx] = True
+    return hit.mean()
+
+
+def is_novel(views, v, min_move=20.0):
+    """ 与已有视角的角点平均位移小于 min_move 像素就算重复 """
+    return all(np.linalg.norm(v - pv, axis=1).mean() >= min_move for pv, _ in views)
+
+
+def board_scale(v, pattern):
+    """ 可见光里相邻角点的平均间距 (px)，随棋盘距离成反比，用来给视角分深度 """
+    g = v.reshape(pattern[1], pattern[0], 2)
+    return float(np.linalg.norm(np.diff(g, axis=1), axis=2).mean())
+
+
+def depth_band(scales, band=CALIB_DEPTH_BAND):
+    """ 以某个视角的格子大小为中心、±band 范围内视角最多的那组，返回布尔掩码 """
+    s = np.asarray(scales, dtype=np.float64)
+    best = None
+    for c in s:
+        m = np.abs(s / c - 1.0) <= band
+        if best is None or m.sum() > best.sum(): best = m
+    return best
+
+
+def solve(views, pattern, band=CALIB_DEPTH_BAND, min_band=CALIB_BAND_MIN_VIEWS):
+    """
+    views: [(v_corners, t_corners), ...]
+    内参用全部视角；两路不共光心，单应只对一个深度成立，所以只用同一深度带里的视角求 H，
+    其它深度的误差 (视差) 单独报告。
+    返回 dict: K / dist (可见光内参、k1 k2)、rms (内参重投影误差 px)、
+              H (去畸变可见光 -> 热成像，同 ImageAligner 的约定)、h_err (深度带内，热成像像素)、inliers、
+              band (深度带内视角数)、depth_err [(格子大小 px, 该视角平均误差), ...] 按格子大小排序
+    深度带里视角不足 min_band 时返回 None。
+    """
+    obj = np.zeros((pattern[0] * pattern[1], 3), np.float32)
+    obj[:, :2] = np.mgrid[0:pattern[0], 0:pattern[1]].T.reshape(-1, 2)
+    flags = cv2.CALIB_ZERO_TANGENT_DIST | cv2.CALIB_FIX_K3
+    rms, K, dist, _, _ = cv2.calibrateCamera([obj] * len(views), [v.reshape(-1, 1, 2) for v, _ in views],
+                                             (VIS_W, VIS_H), None, None, flags=flags)
+
+    scales = [board_scale(v, pattern) for v, _ in views]
+    mask = depth_band(scales, band)
+    if mask.sum() < min_band: return None
+    und = [cv2.undistortPoints(v.reshape(-1, 1, 2), K, dist, P=K) for v, _ in views]
+    src = np.concatenate([u for u, m in zip(und, mask) if m])
+    dst = np.concatenate([t.reshape(-1, 1, 2) for (_, t), m in zip(views, mask) if m])
+    H, inl = cv2.findHomography(src, dst, cv2.RANSAC, 2.0)
+    if H is None: return None
+    inl = inl.ravel().astype(bool)
+    err = np.linalg.norm(cv2.perspectiveTransform(src, H) - dst, axis=2).ravel()
+    depth_err = sorted((s, float(np.linalg.norm(cv2.perspectiveTransform(u, H) - t.reshape(-1, 1, 2), axis=2).mean()))
+                       for s, u, (_, t) in zip(scales, und, views))
+    return {"K": K, "dist": dist.ravel(), "rms": float(rms), "H": H,
+            "h_err": float(err[inl].mean()), "inliers": float(inl.mean()),
+            "band": int(mask.sum()), "depth_err": depth_err}
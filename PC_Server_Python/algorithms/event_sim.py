@@ -1,15 +1,29 @@
 import cv2
 import numpy as np
 
+# DVS 事件: 坐标 + 时间戳 (us，与包头 ts 同一时间轴) + 极性 (+1 ON / -1 OFF)
+EVENT_DTYPE = np.dtype([("x", "<u2"), ("y", "<u2"), ("t", "<i8"), ("p", "i1")])
+
 
 class PseudoEventGen:
-    def __init__(self, width=1280, height=800, threshold=25):
+    def __init__(self, width=1280, height=800, threshold=25, contrast=0.4, noise_floor=0.01):
         self.w = width
         self.h = height
         # 阈值调高：防止噪点导致全屏白
         self.threshold = threshold
         self.prev_frame = None
 
+        # === DVS 模式 (v2e 模型，见 Project_Docs/模拟事件相机.md) ===
+        # L = ln(I/255 + eps)，uint8 只有 256 个取值，直接查表
+        # contrast 默认与 Edge_Pi_CPP/SimulatedEvent 的 0.40 一致
+        self.contrast = contrast
+        self.log_lut = np.log(np.arange(256, dtype=np.float32) / 255.0 + noise_floor).astype(np.float32)
+        self.log_ref = None  # 每个像素上一次触发事件时的对数亮度
+        self.log_prev = None
+        self.log_cur = None
+        self.diff = None
+        self.prev_ts = None
+
     def process(self, curr_img_raw):
         """
         [极速版] 瞬态差分事件生成
@@ -19,42 +33,98 @@ class PseudoEventGen:
 
         # 1. 极速预处理
         # 9281 的原始数据 (uint8)
-        # 真实事件相机对"对数光强"敏感，这能抵抗光照不均
-        # Log 运算比较慢，我们用近似算法：直接用 int16 做差分，避免溢出
-        curr = curr_img_raw.astype(np.int16)
+        # uint8 上直接 absdiff 就是 |Current - Previous|，不用先转 int16 再取绝对值
+        curr = curr_img_raw
 
-        if self.prev_frame is None:
-            self.prev_frame = curr
+        if self.prev_frame is None or self.prev_frame.shape != curr.shape:
+            # 输入可能是轮转缓冲，上一帧要自己留一份
+            self.prev_frame = curr.copy()
+            self.h, self.w = curr.shape[:2]  # 跟随输入尺寸 (缩小解码时比构造参数小)
             return np.zeros((self.h, self.w), dtype=np.uint8)
 
-        # 2. 计算差分 (Delta)
-        # diff = Current - Previous
-        diff = cv2.subtract(curr, self.prev_frame)
+        # 2. 计算差分 (Delta) 的幅值
+        # 正向变化 (变亮) / 负向变化 (变暗) 为了融合统一用 255
+        abs_diff = cv2.absdiff(curr, self.prev_frame)
 
         # 3. 极性阈值清洗 (Thresholding)
-        # 只有变化幅度超过阈值的像素才被认为是"事件"
-        # 正向变化 (变亮) -> 255
-        # 负向变化 (变暗) -> 255 (或者区分颜色，这里为了融合统一用255)
-
-        # 这是一个极速操作：
-        # abs(diff) > threshold
-        abs_diff = np.abs(diff)
-
         # 自适应阈值：如果画面太亮/太白，自动提高门槛
         # 简单统计一下平均变化量，如果全屏都在变（白屏），就动态提高阈值
-        mean_change = np.mean(abs_diff)
+        mean_change = cv2.mean(abs_diff)[0]
         dynamic_thresh = self.threshold + int(mean_change * 1.5)
 
         # 生成掩码 (0 或 255)
-        _, event_mask = cv2.threshold(abs_diff.astype(np.uint8), dynamic_thresh, 255, cv2.THRESH_BINARY)
+        _, event_mask = cv2.threshold(abs_diff, dynamic_thresh, 255, cv2.THRESH_BINARY)
 
         # 4. 形态学去噪 (可选，非常快)
         # 去掉孤立的噪点，只保留连续的边缘
         # kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (2, 2))
         # event_mask = cv2.morphologyEx(event_mask, cv2.MORPH_OPEN, kernel)
 
-        # 5. 更新上一帧
-        # 关键：不要用 curr，而是用 curr 更新 prev
-        self.prev_frame = curr
+        # 5. 更新上一帧 (拷进自己的缓冲，不分配)
+        np.copyto(self.prev_frame, curr)
+
+        return event_mask
+
+    def reset_events(self):
+        self.log_ref = None
+
+    def process_events(self, curr_img_raw, ts):
+        """
+        [DVS 版] 对数亮度 + 逐像素参考电平的事件流
+        两帧之间每跨过一次 ±contrast 就发一个事件，时间戳在帧间隔内按对数亮度线性插值。
+        全程向量化，返回按时间排序的 EVENT_DTYPE 结构化数组。
+        """
+        if curr_img_raw is None: return None
+        h, w = curr_img_raw.shape[:2]
+
+        if self.log_ref is None or self.log_ref.shape != (h, w):
+            # 第一帧: 只建立参考电平
+            self.log_ref = np.take(self.log_lut, curr_img_raw)
+            self.log_prev = self.log_ref.copy()
+            self.log_cur = np.empty_like(self.log_ref)
+            self.diff = np.empty_like(self.log_ref)
+            self.prev_ts = ts
+            return np.zeros(0, dtype=EVENT_DTYPE)
+
+        np.take(self.log_lut, curr_img_raw, out=self.log_cur)
+        np.subtract(self.log_cur, self.log_ref, out=self.diff)
+
+        # 只有 |ΔL| >= C 的像素才需要进一步处理
+        # (float32 累加误差下恰好跨 k*C 的情况留一点余量)
+        c = self.contrast - 1e-6
+        idx = np.flatnonzero(np.abs(self.diff) >= c)
+        if len(idx) == 0:
+            self.log_prev, self.log_cur = self.log_cur, self.log_prev
+            self.prev_ts = ts
+            return np.zeros(0, dtype=EVENT_DTYPE)
+
+        d = self.diff.ravel()[idx]
+        n = ((np.abs(d) + 1e-6) // self.contrast).astype(np.int64)  # 每个像素跨过阈值的次数
+        sgn = np.sign(d).astype(np.float32)
+        ref = self.log_ref.ravel()[idx]
+        l0 = self.log_prev.ravel()[idx]
+        l1 = self.log_cur.ravel()[idx]
+
+        # 展开成逐事件: 像素 i 重复 n_i 次，k = 1..n_i
+        rep = np.repeat(np.arange(len(idx)), n)
+        k = np.arange(len(rep)) - np.repeat(np.cumsum(n) - n, n) + 1
+
+        # 第 k 次跨越的电平 ref + s*k*C，在 [l0, l1] 上线性插值出时刻
+        level = ref[rep] + sgn[rep] * k * self.contrast
+        span = (l1 - l0)[rep]
+        frac = np.divide(level - l0[rep], span, out=np.ones_like(span), where=span != 0)
+        np.clip(frac, 0.0, 1.0, out=frac)
+
+        ev = np.empty(len(rep), dtype=EVENT_DTYPE)
+        pix = idx[rep]
+        ev["x"] = pix % w
+        ev["y"] = pix // w
+        ev["t"] = self.prev_ts + np.round(frac * (ts - self.prev_ts)).astype(np.int64)
+        ev["p"] = sgn[rep]
+        ev = ev[np.argsort(ev["t"], kind="stable")]
 
-        return event_mask
\ No newline at end of file
+        # 参考电平前进到最后一次触发的位置
+        self.log_ref.ravel()[idx] = ref + sgn * n * self.contrast
+        self.log_prev, self.log_cur = self.log_cur, self.log_prev
+        self.prev_ts = ts
+        return ev
\ No newline at end of file
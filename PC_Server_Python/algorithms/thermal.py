@@ -0,0 +1,110 @@
+# algorithms/thermal.py
+import numpy as np
+import cv2
+
+# Tiny1-C 原始值 -> 摄氏度: C = raw / 64 - 273.15
+RAW_PER_C = 64.0
+
+# 直方图按 raw >> HIST_SHIFT 分桶: 4096 桶，每桶 0.25°C
+HIST_SHIFT = 4
+HIST_BINS = 65536 >> HIST_SHIFT
+
+PALETTES = {"JET": cv2.COLORMAP_JET, "INFERNO": cv2.COLORMAP_INFERNO, "HOT": cv2.COLORMAP_HOT,
+            "TURBO": cv2.COLORMAP_TURBO, "BONE": cv2.COLORMAP_BONE, "MAGMA": cv2.COLORMAP_MAGMA}
+
+
+def raw_to_c(raw):
+    return raw / RAW_PER_C - 273.15
+
+
+class ThermalRenderer:
+    """
+    [热成像伪彩]: uint16 原始值 -> BGR 的 65536 项查找表，每帧只做一次 gather
+    AGC 窗口来自跨帧平滑的直方图，窗口变化时才重建查找表:
+      minmax     - 旧逻辑，最小/最大值 (一个热点就能把对比度压没)
+      percentile - 按 clip 百分位截断两端
+      plateau    - 平台直方图均衡: 每桶计数封顶后的累积分布做映射
+    换调色板只是换 256 项的色板 + 重建一次查找表，没有额外开销。
+    """
+
+    def __init__(self, palette="JET", agc="percentile", clip=(1.0, 99.0), plateau=0.02,
+                 min_span_c=2.0, decay=0.7, hysteresis_c=0.5, eq_interval=10):
+        self.agc = agc
+        self.clip = clip
+        self.plateau = plateau  # 每桶上限占总像素的比例
+        self.min_span = min_span_c * RAW_PER_C
+        self.decay = decay  # 直方图平滑系数，越大越稳
+        self.hysteresis = hysteresis_c * RAW_PER_C
+        self.eq_interval = eq_interval
+        self.since_build = 0
+        self.hist = None
+        self.window = None  # 当前 LUT 对应的 (lo, hi) 原始值
+        self.lut = None
+        self.rebuild_cnt = 0
+        self.set_palette(palette)
+
+    def set_palette(self, name):
+        self.palette_name = name
+        self.palette = cv2.applyColorMap(np.arange(256, dtype=np.uint8).reshape(-1, 1), PALETTES[name]).reshape(256, 3)
+        self.window = None  # 强制下一帧重建
+
+    def set_agc(self, agc, clip=None, plateau=None):
+        self.agc = agc
+        if clip is not None: self.clip = clip
+        if plateau is not None: self.plateau = plateau
+        self.window = None
+
+    def window_c(self):
+        if self.window is None: return None
+        return raw_to_c(self.window[0]), raw_to_c(self.window[1])
+
+    def _update_hist(self, raw):
+        h = np.bincount((raw >> HIST_SHIFT).ravel(), minlength=HIST_BINS).astype(np.float32)
+        if self.hist is None:
+            self.hist = h
+        else:
+            # 跨帧指数平滑，窗口不会随单帧噪声抖动
+            self.hist *= self.decay
+            self.hist += (1.0 - self.decay) * h
+
+    def _window(self, raw):
+        if self.agc == "minmax":
+            lo, hi = int(raw.min()), int(raw.max())
+        else:
+            cdf = np.cumsum(self.hist)
+            total = cdf[-1]
+            lo_b = int(np.searchsorted(cdf, total * self.clip[0] / 100.0))
+            hi_b = int(np.searchsorted(cdf, total * self.clip[1] / 100.0))
+            lo, hi = lo_b << HIST_SHIFT, ((hi_b + 1) << HIST_SHIFT) - 1
+        if hi - lo < self.min_span:
+            # 温差太小时保持旧逻辑: 至少展开 5°C，避免噪声被放大成满屏花
+            hi = lo + int(5.0 * RAW_PER_C)
+        return lo, min(hi, 65535)
+
+    def _build_lut(self, lo, hi):
+        v = np.arange(65536, dtype=np.float32)
+        if self.agc == "plateau":
+            # 窗口内封顶直方图的累积分布 -> 0..255
+            h = np.minimum(self.hist, self.plateau * self.hist.sum())
+            b0, b1 = lo >> HIST_SHIFT, hi >> HIST_SHIFT
+            cdf = np.cumsum(h[b0:b1 + 1])
+            cdf = (cdf - cdf[0]) / max(cdf[-1] - cdf[0], 1e-6)
+            bins = np.clip((v.astype(np.int64) >> HIST_SHIFT) - b0, 0, b1 - b0)
+            idx = (cdf[bins] * 255).astype(np.uint8)
+        else:
+            idx = np.clip((v - lo) * (255.0 / (hi - lo)), 0, 255).astype(np.uint8)
+        self.lut = self.palette[idx]
+        self.rebuild_cnt += 1
+        self.since_build = 0
+
+    def render(self, raw):
+        """ raw: (H, W) uint16 -> (H, W, 3) BGR """
+        if self.agc != "minmax": self._update_hist(raw)
+        lo, hi = self._window(raw)
+        self.since_build += 1
+        # 窗口移动超过迟滞量才重建；均衡模式的映射随直方图变化，隔几帧刷新一次
+        moved = self.window is None or abs(lo - self.window[0]) > self.hysteresis or abs(hi - self.window[1]) > self.hysteresis
+        if moved or (self.agc == "plateau" and self.since_build >= self.eq_interval):
+            self.window = (lo, hi)
+            self._build_lut(lo, hi)
+        return np.take(self.lut, raw, axis=0)
@@ -3,31 +3,60 @@ import numpy as np
 import cv2
 from config import VIS_W, VIS_H
 
+# 定点增益: 只量化 (G - 1)，Q0.8 存成 uint8，G 最大不能超过 1 + 255/256
+GAIN_SHIFT = 8
+
 
 class VignettingCorrector:
-    def __init__(self, strength=0.8):
+    def __init__(self, strength=0.8, fixed_point=True, out_slots=2, width=VIS_W, height=VIS_H):
         """
         基于多项式拟合的平场校正 (Flat-Field Correction)
         公式: I_corr = I_raw * G(r)
+        定点路径: I_corr = I_raw + I_raw * (G - 1)，两步都是 uint8 的 cv2 运算，
+        直接写进预分配的输出缓冲，不产生整帧临时数组；与浮点路径相差不超过 1 LSB。
+        out_slots: 输出缓冲轮转个数，下游同时持有的帧数不能超过它
+        width / height: 初始尺寸；输入尺寸变了 (缩小解码) 就按新尺寸重建增益图，r 是归一化半径，校正效果不变
         """
-        self.gain_map = self._create_gain_map(VIS_W, VIS_H, strength)
+        self.strength = strength
+        self.out_slots = out_slots
+        # 强度过大时 (G - 1) 装不进 uint8，退回浮点路径
+        self.fixed_point = fixed_point and strength * (1 << GAIN_SHIFT) <= 255
+        self._build(width, height)
+
+    def _build(self, w, h):
+        self.gain_map = self._create_gain_map(w, h, self.strength)
+        if self.fixed_point:
+            self.gain_q = np.round((self.gain_map - 1) * (1 << GAIN_SHIFT)).astype(np.uint8)
+            self.out = [np.empty((h, w), dtype=np.uint8) for _ in range(self.out_slots)]
+            self.out_idx = 0
 
     def _create_gain_map(self, w, h, k):
-        # 生成坐标网格
-        X, Y = np.meshgrid(np.arange(w), np.arange(h))
         cx, cy = w // 2, h // 2
 
-        # 计算归一化半径 r (中心为0，角落为1)
-        max_dist = np.sqrt(cx ** 2 + cy ** 2)
-        r = np.sqrt((X - cx) ** 2 + (Y - cy) ** 2) / max_dist
+        # 计算归一化半径 r^2 (中心为0，角落为1)
+        # r^2 = (dx^2 + dy^2) / max_dist^2 可分离: 行、列各算一次再广播相加，
+        # 不需要 float64 的 meshgrid，只生成一张 float32 图
+        max_dist2 = float(cx ** 2 + cy ** 2)
+        dx2 = (np.arange(w, dtype=np.float32) - cx) ** 2
+        dy2 = (np.arange(h, dtype=np.float32) - cy) ** 2
+        gain = dy2[:, None] + dx2[None, :]
 
         # 增益函数: 越靠边，增益越大
         # 这里使用简化的二次模型 G = 1 + k*r^2
-        gain = 1 + k * (r ** 2)
-        return gain.astype(np.float32)
+        gain *= k / max_dist2
+        gain += 1
+        return gain
 
     def process(self, img):
         if img is None: return None
+        if img.ndim == 2 and img.shape != self.gain_map.shape: self._build(img.shape[1], img.shape[0])
+        if self.fixed_point and img.shape == self.gain_q.shape:
+            dst = self.out[self.out_idx]
+            self.out_idx = (self.out_idx + 1) % len(self.out)
+            # dst = img * (G-1) (带舍入)，再饱和加回 img
+            cv2.multiply(img, self.gain_q, dst=dst, scale=1.0 / (1 << GAIN_SHIFT))
+            cv2.add(img, dst, dst=dst)
+            return dst
         # 转换类型进行计算: uint8 -> float32 -> uint8
         img_f = img.astype(np.float32)
         res = img_f * self.gain_map
@@ -0,0 +1,146 @@
+# =========================================================================
+# 文件名: benchmark.py
+# 描述: 无界面端到端压测 - pi_emulator 子进程推流，DataReceiver + SyncEngine 接收处理
+#       统计吞吐、丢帧率、线上时间戳 -> SyncEngine 发出信号 的延迟分位数，结果写 JSON
+# 用法: python benchmark.py --duration 10 --fps-video 120 --out bench.json
+# =========================================================================
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import subprocess
+import threading
+from collections import deque
+import numpy as np
+from PyQt6.QtCore import QCoreApplication, Qt
+from core.data_link import DataReceiver
+from core.sync_engine import SyncEngine
+from core.frame_buffer import FrameRing
+from config import VIS_W, VIS_H, THERMAL_W, THERMAL_H, SYNC_RING_VIS, SYNC_RING_THERMAL
+
+
+def git_rev():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+class Collector:
+    """ 直连 update_signal (在 SyncEngine 线程内执行)，记录每帧的 wire-to-emit 延迟 """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.lat_ms = []
+        self.sync_err_ms = []
+        self.fids = []
+        self.active = False
+
+    def on_update(self, fus, therm, evt, roi, depth, info):
+        if not self.active: return
+        now = time.time_ns() // 1000
+        with self.lock:
+            self.lat_ms.append((now - int(info["v_ts"])) / 1000.0)
+            self.fids.append(info["v_fid"])
+            if info.get("sync_err_ms") is not None: self.sync_err_ms.append(abs(info["sync_err_ms"]))
+
+
+def percentiles(x):
+    if not x: return {"p50": None, "p95": None, "p99": None, "max": None, "mean": None}
+    a = np.asarray(x)
+    p50, p95, p99 = np.percentile(a, [50, 95, 99])
+    return {"p50": float(p50), "p95": float(p95), "p99": float(p99), "max": float(a.max()), "mean": float(a.mean())}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end receive/sync benchmark")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--warmup", type=float, default=2.0, help="秒，开头这段不计入统计")
+    parser.add_argument("--fps-video", type=float, default=120.0)
+    parser.add_argument("--fps-thermal", type=float, default=25.0)
+    parser.add_argument("--width", type=int, default=VIS_W)
+    parser.add_argument("--height", type=int, default=VIS_H)
+    parser.add_argument("--port-video", type=int, default=18888)
+    parser.add_argument("--port-thermal", type=int, default=18889)
+    parser.add_argument("--source", help="录制会话目录 (传给 pi_emulator)")
+    parser.add_argument("--deque", action="store_true",
+                        help="接收端改用旧的 deque(maxlen=--queue)，只用于和 FrameRing (同 MainWindow) 对比")
+    parser.add_argument("--queue", type=int, default=4, help="--deque 时的队列长度")
+    parser.add_argument("--out", default="bench.json")
+    args = parser.parse_args()
+
+    app = QCoreApplication(sys.argv[:1])
+    if args.deque:
+        qv, qt = deque(maxlen=args.queue), deque(maxlen=args.queue)
+    else:
+        # 同 MainWindow.start 的预分配帧环 (压测分辨率更大时按压测分辨率分配)
+        qv = FrameRing(SYNC_RING_VIS, (max(VIS_H, args.height), max(VIS_W, args.width)), np.uint8)
+        qt = FrameRing(SYNC_RING_THERMAL, (THERMAL_H, THERMAL_W), np.uint16)
+    th_v = DataReceiver(args.port_video, qv, "video")
+    th_t = DataReceiver(args.port_thermal, qt, "thermal")
+    eng = SyncEngine(qv, qt)
+    col = Collector()
+    eng.update_signal.connect(col.on_update, Qt.ConnectionType.DirectConnection)
+    for t in (th_v, th_t, eng):
+        t.log_signal.connect(print)
+        t.start()
+
+    total = args.warmup + args.duration
+    cmd = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "pi_emulator.py"),
+           "--port-video", str(args.port_video), "--port-thermal", str(args.port_thermal),
+           "--fps-video", str(args.fps_video), "--fps-thermal", str(args.fps_thermal),
+           "--width", str(args.width), "--height", str(args.height), "--duration", str(total + 0.5)]
+    if args.source: cmd += ["--source", args.source]
+    emu = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+
+    # 预热: 连接、解码池、JIT 之类的开销不算
+    t_start = time.time()
+    while time.time() - t_start < args.warmup:
+        app.processEvents(); time.sleep(0.01)
+    rv0, rt0 = th_v.get_stats()["packets"], th_t.get_stats()["packets"]
+    col.active = True
+    t0 = time.time()
+    while time.time() - t0 < args.duration:
+        app.processEvents(); time.sleep(0.01)
+    col.active = False
+    elapsed = time.time() - t0
+    rv1, rt1 = th_v.get_stats()["packets"], th_t.get_stats()["packets"]
+
+    out, _ = emu.communicate(timeout=30)
+    sent = {m.group(1).lower(): int(m.group(2)) for m in re.finditer(r"\[(\w+)\] sent (\d+) frames", out)}
+    eng.stop(); th_v.stop(); th_t.stop()
+
+    emitted = len(col.lat_ms)
+    recv_v = rv1 - rv0
+    result = {
+        "commit": git_rev(),
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "config": vars(args),
+        "emulator_sent": sent,
+        "recv": {"video": recv_v, "thermal": rt1 - rt0,
+                 "video_fps": recv_v / elapsed, "thermal_fps": (rt1 - rt0) / elapsed},
+        "emit_fps": emitted / elapsed,
+        # 收到但没有被 SyncEngine 处理输出的可见光帧比例 (队列挤掉 / 解码池丢弃 / 强制取最新)
+        "drop_rate": 1.0 - emitted / recv_v if recv_v else None,
+        "latency_ms": percentiles(col.lat_ms),
+        "sync_err_ms": percentiles(col.sync_err_ms),
+        "receiver": {"video": th_v.get_stats(), "thermal": th_t.get_stats()},
+        "rings": None if args.deque else {"video": qv.get_stats(), "thermal": qt.get_stats()},
+        "stages": eng.get_profile(),
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+
+    lat = result["latency_ms"]
+    print(f"emit {result['emit_fps']:.1f} fps | recv {result['recv']['video_fps']:.1f}/{result['recv']['thermal_fps']:.1f} fps"
+          f" | drop {result['drop_rate'] if result['drop_rate'] is None else round(result['drop_rate'] * 100, 1)}%"
+          f" | latency p50/p95/p99 = {lat['p50']}/{lat['p95']}/{lat['p99']} ms -> {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,12 +5,13 @@
 # =========================================================================
 
 import socket
-import struct
 import numpy as np
 import cv2
 import time
 from collections import deque
 from PyQt6.QtCore import QThread, pyqtSignal
+from config import INGEST_MAX_PAYLOAD, TACTICAL_HOMOGRAPHY, ALIGN_HOMOGRAPHY_FILE
+from core.data_link import HEADER, HEADER_V2, MAGIC, PT_DEFAULT, PT_JPEG, parse_header, resync_offset, ThermalDecoder
 
 # --- [配置区] ---
 HOST = '0.0.0.0'
@@ -29,6 +30,7 @@ class DataReceiver(QThread):
     """
     [类功能]: 单一通道的数据接收器
     [逻辑]: 这是一个死循环线程，只负责从网线里把数据读出来，塞进队列，不处理业务。
+    [协议]: 每条连接按前 4 字节自动识别 v1 (16 字节包头) / v2 (28 字节，带魔数和 CRC，错位后可重新同步)
     """
     log_signal = pyqtSignal(str)  # 日志信号
 
@@ -38,6 +40,8 @@ class DataReceiver(QThread):
         self.queue = queue
         self.mode = mode  # "video" 或 "thermal"
         self.running = True
+        self.proto = None  # 1 / 2，每条连接重新判断
+        self.thermal = ThermalDecoder() if mode == "thermal" else None
 
     def recv_all(self, sock, count):
         """
@@ -55,6 +59,38 @@ class DataReceiver(QThread):
                 return None
         return buf
 
+    def recv_header(self, sock):
+        """
+        [工具函数]: 读一个包头，返回 (ts, size, fid, ptype)，断线返回 None
+        v2 校验失败时逐字节往后找下一个魔数，丢掉错位的字节
+        """
+        got = b''
+        if self.proto is None:
+            got = self.recv_all(sock, len(MAGIC))
+            if not got: return None
+            self.proto = 2 if got == MAGIC else 1
+        if self.proto == 1:
+            rest = self.recv_all(sock, HEADER.size - len(got))
+            if not rest: return None
+            ts, size, fid = HEADER.unpack(got + rest)
+            # v1 没有魔数，长度离谱说明已错位，只能断开重连
+            if size > INGEST_MAX_PAYLOAD: return None
+            return ts, size, fid, PT_DEFAULT
+
+        rest = self.recv_all(sock, HEADER_V2.size - len(got))
+        if not rest: return None
+        buf, lost = got + rest, 0
+        while True:
+            hdr = parse_header(buf)
+            if hdr is not None: break
+            k = resync_offset(buf)
+            more = self.recv_all(sock, k)
+            if not more: return None
+            buf = buf[k:] + more
+            lost += k
+        if lost: self.log_signal.emit(f"[{self.mode.upper()}] RESYNC: skipped {lost} B")
+        return hdr
+
     def run(self):
         # 1. 创建套接字
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -73,13 +109,15 @@ class DataReceiver(QThread):
                 # 2. 等待设备连接 (阻塞式)
                 conn, addr = sock.accept()
                 self.log_signal.emit(f"[{self.mode.upper()}] LINK ACTIVE: {addr[0]}")
+                self.proto = None
+                if self.thermal: self.thermal.ref_fid = None
 
                 while self.running:
-                    # --- 第一步：读包头 (16字节) ---
-                    # 格式: Timestamp(8) + Size(4) + FrameID(4)
-                    header = self.recv_all(conn, 16)
+                    # --- 第一步：读包头 (v1 16 字节 / v2 28 字节) ---
+                    # 格式: [Magic(4)] + Timestamp(8) + Size(4) + FrameID(4) [+ Type(2) + Flags(2) + CRC(4)]
+                    header = self.recv_header(conn)
                     if not header: break
-                    ts, size, fid = struct.unpack("=QII", header)
+                    ts, size, fid, ptype = header
 
                     # --- 第二步：读负载数据 ---
                     payload = self.recv_all(conn, size)
@@ -87,20 +125,20 @@ class DataReceiver(QThread):
 
                     # --- 第三步：初步解码 ---
                     data_item = None
-                    if self.mode == "video":
+                    if self.mode == "video" and ptype in (PT_DEFAULT, PT_JPEG):
                         # OV9281: JPEG -> 灰度图
                         # 传输JPEG是为了省带宽，这里解压成矩阵
                         frame = cv2.imdecode(np.frombuffer(payload, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
                         if frame is not None: data_item = frame
 
                     elif self.mode == "thermal":
-                        # Tiny1-C: Raw Bytes -> 温度矩阵(uint16)
-                        if size == THERMAL_SIZE:
-                            data_item = np.frombuffer(payload, dtype=np.uint16).reshape((THERMAL_H, THERMAL_W))
+                        # Tiny1-C: Raw Bytes (或无损压缩负载) -> 温度矩阵(uint16)
+                        data_item = self.thermal.decode(payload, ptype, fid)
 
                     # --- 第四步：入队 ---
                     if data_item is not None:
-                        if len(self.queue) >= MAX_QUEUE_SIZE:
+                        # FrameRing 自己覆盖最旧的槽位；deque 才需要手动挤掉 (接收线程不能替消费者出队)
+                        if isinstance(self.queue, deque) and len(self.queue) >= MAX_QUEUE_SIZE:
                             self.queue.popleft()  # 挤掉旧数据
                         self.queue.append((ts, fid, data_item))
 
@@ -132,8 +170,14 @@ class SyncEngine(QThread):
 
         # --- [关键] 标定矩阵 (Homography) ---
         # 等你把铜板拍好了，算出单应性矩阵，填在这里！
-        # 现在暂时用单位矩阵 (Identity)，假设两个相机是完全平行的 (实际上肯定不是)
-        self.H_matrix = np.eye(3, dtype=np.float32)
+        # 默认 None，简单缩放 (假设两个相机是完全平行的)
+        # TACTICAL_HOMOGRAPHY 打开时才用标定文件; 注意该矩阵是 "去畸变后" 的可见光 -> 热成像，这里不做去畸变
+        self.H_matrix = None
+        if TACTICAL_HOMOGRAPHY:
+            try:
+                self.H_matrix = np.load(ALIGN_HOMOGRAPHY_FILE).astype(np.float64)
+            except Exception:
+                pass
 
         # 预生成一个黑屏，没信号时用
         self.blank = np.zeros((THERMAL_H, THERMAL_W, 3), dtype=np.uint8)
@@ -193,8 +237,11 @@ class SyncEngine(QThread):
 
         # 2. 寻找匹配的视频帧 (简单版：取最新)
         # 实际应该遍历队列找时间戳差值最小的，这里为了代码清晰简化了
-        v_ts, v_fid, v_data = self.q_video[-1]
-        self.q_video.clear()  # 清空视频队列，防止堆积
+        if isinstance(self.q_video, deque):
+            v_ts, v_fid, v_data = self.q_video[-1]
+            self.q_video.clear()  # 清空视频队列，防止堆积
+        else:
+            v_ts, v_fid, v_data = self.q_video.latest()  # FrameRing: 取最新，之前的帧记为跳过
 
         # 3. 图像预处理
         # 3.1 热成像 -> 彩色底图
@@ -204,8 +251,10 @@ class SyncEngine(QThread):
         # 3.2 可见光 -> 空间对齐 (Warp)
         # 9281分辨率高，Tiny1C分辨率低，且视角不同
         # 必须先把可见光缩放/变形到和热成像一样大 (256x192)
-        # TODO: 以后这里要用 cv2.warpPerspective(v_data, self.H_matrix, ...)
-        v_aligned = cv2.resize(v_data, (THERMAL_W, THERMAL_H))
+        if self.H_matrix is not None:
+            v_aligned = cv2.warpPerspective(v_data, self.H_matrix, (THERMAL_W, THERMAL_H))
+        else:
+            v_aligned = cv2.resize(v_data, (THERMAL_W, THERMAL_H))
 
         # 4. 根据模式进行融合
         fused_img = None
@@ -6,6 +6,25 @@ HOST = '0.0.0.0'
 PORT_VIDEO = 8888      # OV9281
 PORT_THERMAL = 8889    # Tiny1-C
 
+# 同步: 按时间戳最近邻配对，|Δt| 超过容差 (ms) 不配对；None = 不限
+SYNC_TOLERANCE_MS = 20
+SYNC_RING_VIS = 32       # 约 0.25s @120fps
+SYNC_RING_THERMAL = 8    # 约 0.3s @25fps
+
+# 接收缓冲: recv_into 写入预分配槽位，槽位数 = 队列长度 + RECV_POOL_SPARE
+# 热成像帧是槽位上的视图，SyncEngine 的时间缓冲会持有它们，备用槽位要覆盖这部分
+RECV_ZERO_COPY = True
+RECV_POOL_SPARE = SYNC_RING_THERMAL + 4
+
+# 视频解码线程池 (cv2.imdecode 释放 GIL)，0 = 在接收线程内解码
+DECODE_WORKERS = 2
+DECODE_MAX_PENDING = 8   # 在途帧上限，超出直接丢弃，避免反压 socket
+
+# 录制: 原始负载写入 REC_DIR 下的会话目录
+REC_DIR = "recordings"
+REC_CHUNK_MB = 256       # 单个 chunk 文件上限
+REC_QUEUE = 256          # 写盘队列长度，满了丢帧 (不阻塞接收线程)
+
 # 分辨率参数
 # Tiny1-C (基准分辨率)
 THERMAL_W = 256
@@ -15,5 +34,64 @@ THERMAL_H = 192
 VIS_W = 1280
 VIS_H = 800
 
+# 热成像伪彩: 色板 (JET/INFERNO/HOT/TURBO/BONE/MAGMA)，AGC (minmax/percentile/plateau)
+THERMAL_PALETTE = "JET"
+THERMAL_AGC = "percentile"
+THERMAL_AGC_CLIP = (1.0, 99.0)   # percentile 模式两端截断的百分位
+
+# 对齐: affine = 手动平移/缩放/旋转；homography = 镜头畸变 + 单应矩阵 (下列标定文件)
+ALIGN_MODE = "affine"
+ALIGN_HOMOGRAPHY_FILE = "matrix_homography.npy"   # 去畸变可见光 -> 热成像
+ALIGN_CAMERA_FILE = "camera_matrix.npy"           # 可见光内参 (可选，缺省时不做去畸变)
+ALIGN_DIST_FILE = "dist_coeffs.npy"                # 只和真实内参一起使用
+TACTICAL_HOMOGRAPHY = False   # comms_engine (tactical_ui) 用单应矩阵 warpPerspective 代替缩放
+
 # 标定板参数 (6x7 铜板)
-CHECKERBOARD_SIZE = (6, 7)
\ No newline at end of file
+CHECKERBOARD_SIZE = (6, 7)
+
+# 自动标定: 每隔 CALIB_INTERVAL_S 抽一对帧，攒够视角且画面覆盖率达标后求解
+CALIB_INTERVAL_S = 0.5
+CALIB_MIN_VIEWS = 12
+CALIB_MAX_VIEWS = 30
+CALIB_COVERAGE = 0.6   # 可见光 4x4 分格中被角点覆盖的比例
+# 单应只对一个深度成立: 只用棋盘格大小 (≈距离) 在最多视角所在 ±CALIB_DEPTH_BAND 范围内的视角求单应
+CALIB_DEPTH_BAND = 0.15
+CALIB_BAND_MIN_VIEWS = 3
+CALIB_MAX_H_ERR = 1.5  # 该深度上单应的平均误差 (热成像像素) 超过这个就不换进 ImageAligner
+
+# 无标定物对齐微调: LOCKED 模式下低频比较两路边缘图，跟踪机械漂移
+ALIGN_REFINE = True
+REFINE_INTERVAL_S = 1.0
+REFINE_CPU_BUDGET = 0.05   # 占单核的比例上限
+REFINE_MIN_CC = 0.5        # ECC 相关系数门限
+REFINE_MAX_STEP = 40       # 单次估计超过这么多像素视为误匹配
+
+# 多进程模式: 接收、SyncEngine 各自一个进程，帧走共享内存 (main.py --mp)
+MP_MODE = False
+MP_OUT_SLOTS = 4   # 引擎 -> UI 的输出槽位数
+
+# 丢帧策略 (core/drop_policy.py): latest / fifo / window / nth
+DISPLAY_POLICY = "latest"
+POLICY_FIFO_DEPTH = 8      # fifo: 积压超过这么多帧就丢最旧的
+POLICY_WINDOW_MS = 100     # window: 比最新帧早这么多的帧算过期
+POLICY_NTH = 4             # nth: 每 N 帧处理一帧
+
+# 事件路: 独立线程逐帧做暗角校正 + 事件生成 (输入是 FrameRing 时启用)
+EVENT_THREAD = True
+EVENT_BACKLOG = 24   # fifo 深度，处理不过来时丢最旧的 (计数)
+EVENT_RING = 4       # 事件输出缓冲的帧数 (每帧一张全尺寸掩码，显示只读最新一帧)
+EVENT_DVS = False    # 同时生成 DVS 事件流 (供录制)；事件多时单帧要几十 ms，默认关
+
+# 接收后端: threads 每个端口一个 DataReceiver 线程 (单台设备) / selectors 单线程多连接 (core/ingest_server.py)
+#          / asyncio 事件循环 (core/async_ingest.py)
+INGEST_BACKEND = "threads"
+INGEST_MAX_PAYLOAD = 4 * 1024 * 1024   # 包头 data_size 上限，超过视为流已错位
+# asyncio 后端的数据路: 名字 -> (端口, 负载编码 jpeg / raw16)，加一路只需在这里加一项并给出同名队列
+INGEST_STREAMS = {"video": (PORT_VIDEO, "jpeg"), "thermal": (PORT_THERMAL, "raw16")}
+INGEST_TIMEOUT_S = 5.0   # 单次读包头/负载的超时，超时断开该连接
+
+# 可见光缩小解码: 1 / 2 / 4 / 8 固定倍数，或 "auto" 按下游登记的需求 (显示尺寸、标定等) 自动选
+VIS_DECODE_SCALE = "auto"
+
+# 显示: UI 从 SyncEngine 的最新帧信箱取帧的最高频率 (core/mailbox.py)
+UI_DISPLAY_FPS = 60
\ No newline at end of file
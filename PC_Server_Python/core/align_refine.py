@@ -0,0 +1,89 @@
+import time
+import cv2
+import numpy as np
+from collections import deque
+from PyQt6.QtCore import QThread, pyqtSignal
+from algorithms.alignment import estimate_shift
+from config import VIS_W, VIS_H, REFINE_INTERVAL_S, REFINE_CPU_BUDGET, REFINE_MIN_CC, REFINE_MAX_STEP
+
+
+class AlignRefiner(QThread):
+    """
+    [对齐微调]: 后台低频估计两路之间的残余平移，慢慢修正 ImageAligner，跟踪机械漂移
+    offer() 在 SyncEngine 线程里调用，到点且空闲时才拷贝一对帧 (同 AutoCalibrator)。
+    每次估计后按实际消耗的线程 CPU 时间推迟下一次，保证不超过 cpu_budget。
+    门限: ECC 相关系数、单步幅度、连续 3 次估计一致，任一不满足都不动变换。
+    """
+    log_signal = pyqtSignal(str)
+
+    def __init__(self, aligner, interval_s=REFINE_INTERVAL_S, cpu_budget=REFINE_CPU_BUDGET,
+                 min_cc=REFINE_MIN_CC, max_step=REFINE_MAX_STEP, gain=0.5, deadband=0.5, agree_px=3.0):
+        super().__init__()
+        self.aligner = aligner
+        self.interval_s, self.cpu_budget = interval_s, cpu_budget
+        self.min_cc, self.max_step = min_cc, max_step
+        self.gain = gain  # 每次只走估计量的一部分，单次误判影响有限
+        self.deadband = deadband
+        self.agree_px = agree_px
+        self.running = True
+        self.pending = None
+        self.next_due = 0.0
+        self.history = deque(maxlen=3)
+        self.stats = {"runs": 0, "applied": 0, "rejected": 0, "cpu_ms": 0.0}
+
+    def offer(self, v_img, t_raw):
+        """ SyncEngine 线程调用: 两路缓冲都会被复用，必须拷贝 """
+        if self.pending is not None or time.time() < self.next_due: return
+        self.pending = (v_img.copy(), t_raw.copy())
+
+    def run(self):
+        while self.running:
+            item = self.pending
+            if item is None:
+                self.msleep(50)
+                continue
+            c0 = time.thread_time()
+            try:
+                self._step(*item)
+            except Exception as e:
+                self.log_signal.emit(f"[ALIGN] refine error: {e}")
+            cpu = time.thread_time() - c0
+            self.stats["runs"] += 1
+            self.stats["cpu_ms"] += cpu * 1000.0
+            # CPU 预算: 本次耗时 / 预算比例 = 下一次之前至少要空出的时间
+            self.next_due = time.time() + max(self.interval_s, cpu / self.cpu_budget)
+            self.pending = None
+
+    def _step(self, v_img, t_raw):
+        ov = self.aligner.get_overlay(v_img.shape[1], v_img.shape[0])
+        if ov is None: return
+        x1, y1, x2, y2, map1, map2, hole = ov
+        # 按当前变换把热成像映射到可见光目标区域，再比较
+        therm = cv2.remap(t_raw, map1, map2, cv2.INTER_LINEAR)
+        valid = None if hole is None else (1 - hole)
+        est = estimate_shift(v_img[y1:y2, x1:x2], therm, valid)
+        if est is not None and v_img.shape[:2] != (VIS_H, VIS_W):
+            # 缩小解码的画面: 换算回全分辨率像素，阈值和 nudge 都按全分辨率
+            est = (est[0] * VIS_W / v_img.shape[1], est[1] * VIS_H / v_img.shape[0], est[2])
+        if est is None or est[2] < self.min_cc or np.hypot(est[0], est[1]) > self.max_step:
+            self.stats["rejected"] += 1
+            self.history.clear()
+            return
+
+        self.history.append(est[:2])
+        if len(self.history) < self.history.maxlen: return
+        h = np.array(self.history)
+        med = np.median(h, axis=0)
+        if np.abs(h - med).max() > self.agree_px:
+            self.stats["rejected"] += 1
+            return
+        self.history.clear()  # 变换改了以后旧估计不再适用
+        if np.hypot(*med) < self.deadband: return
+        dx, dy = -self.gain * med
+        self.aligner.nudge(float(dx), float(dy))
+        self.stats["applied"] += 1
+        self.log_signal.emit(f"[ALIGN] drift corrected ({dx:+.1f}, {dy:+.1f}) px, cc {est[2]:.2f}")
+
+    def stop(self):
+        self.running = False
+        self.wait()
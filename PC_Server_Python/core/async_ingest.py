@@ -0,0 +1,180 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from PyQt6.QtCore import QThread, pyqtSignal
+from config import INGEST_STREAMS, INGEST_TIMEOUT_S, INGEST_MAX_PAYLOAD, DECODE_WORKERS, DECODE_MAX_PENDING
+from core.data_link import (HEADER, HEADER_V2, MAGIC, PT_DEFAULT, DEMAND, parse_header, resync_offset, decode_video,
+                            ThermalDecoder)
+from core.recorder import SENSOR_STREAMS
+
+
+def _video_codec(demand):
+    # 倍数在每帧解码时读取，跟随下游需求变化
+    def decode(payload, ptype, fid):
+        return decode_video(payload, ptype, fid, demand.scale)
+    return decode
+
+
+def _thermal_codec(demand):
+    return ThermalDecoder().decode
+
+
+# 负载编码 -> (每条连接的解码函数工厂, 是否放进线程池)，解码函数签名 (payload, ptype, fid)
+# imdecode 耗时且释放 GIL，放线程池；热成像解码有状态 (delta16 参考帧) 必须按序，直接在事件循环里做
+CODECS = {"jpeg": (_video_codec, True), "raw16": (_thermal_codec, False)}
+
+
+class AsyncIngest(QThread):
+    """
+    [asyncio 接收]: 一个线程里跑事件循环，INGEST_STREAMS 里每一路一个 asyncio 服务
+    协议同 DataReceiver (v1/v2 自动识别，v2 可重新同步): readexactly 收包头和负载，每次读都有 wait_for 超时，
+    对端卡死超过 timeout_s 就断开。JPEG 解码交给线程池，每条连接一个投递协程按到达顺序入队，
+    队列接口 (append) 与 DataReceiver 相同，SyncEngine 不用改。
+    stop() 取消所有连接协程并关闭服务，不需要 accept 超时轮询。
+    """
+    log_signal = pyqtSignal(str)
+
+    def __init__(self, queues, streams=INGEST_STREAMS, decode_workers=DECODE_WORKERS,
+                 max_pending=DECODE_MAX_PENDING, timeout_s=INGEST_TIMEOUT_S, demand=DEMAND):
+        super().__init__()
+        self.demand = demand
+        self.queues = queues  # 名字 -> 队列，只收有队列的那几路
+        self.streams = {k: v for k, v in streams.items() if k in queues}
+        self.max_pending = max_pending
+        self.timeout_s = timeout_s
+        self.executor = ThreadPoolExecutor(max_workers=max(1, decode_workers), thread_name_prefix="decode")
+        # 事件循环在构造时就建好，stop() 在线程启动前后调用都安全
+        self.loop = asyncio.new_event_loop()
+        self.stop_event = asyncio.Event()
+        self.recorder = None
+        self.stats = {k: {"links": 0, "packets": 0, "bytes": 0, "dropped": 0, "rejected": 0, "timeouts": 0,
+                          "resync": 0, "skipped_bytes": 0}
+                      for k in self.streams}
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self._main())
+        finally:
+            self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+
+    async def _main(self):
+        servers, conns = [], set()
+        for name, (port, codec) in self.streams.items():
+            handler = self._handler(name, CODECS[codec], conns)
+            try:
+                servers.append(await asyncio.start_server(handler, '0.0.0.0', port))
+                self.log_signal.emit(f"[{name}] WAIT: {port}")
+            except OSError as e:
+                self.log_signal.emit(f"[{name}] ERR: {e}")
+        await self.stop_event.wait()
+
+        for s in servers: s.close()
+        for task in list(conns): task.cancel()
+        await asyncio.gather(*conns, return_exceptions=True)
+        for s in servers: await s.wait_closed()
+
+    def _handler(self, name, codec, conns):
+        async def handle(reader, writer):
+            task = asyncio.current_task()
+            conns.add(task)
+            try:
+                await self._serve(name, codec, reader, writer)
+            finally:
+                conns.discard(task)
+        return handle
+
+    async def _serve(self, name, codec, reader, writer):
+        decode, offload = codec[0](self.demand), codec[1]
+        q, st = self.queues[name], self.stats[name]
+        peer = writer.get_extra_info("peername")
+        st["links"] += 1
+        self.log_signal.emit(f"[{name}] LINK: {peer[0]}")
+
+        # 在途解码按提交顺序排队，投递协程依次等结果再 append，帧序与线上一致
+        pending = asyncio.Queue(self.max_pending)
+        deliver = asyncio.create_task(self._deliver(pending, q, st))
+        try:
+            try:
+                proto = None
+                while True:
+                    hdr, proto = await self._read_header(reader, proto, name)
+                    if hdr is None:
+                        self.log_signal.emit(f"[{name}] BAD SIZE")
+                        break
+                    ts, size, fid, ptype = hdr
+                    payload = await asyncio.wait_for(reader.readexactly(size), self.timeout_s)
+                    st["packets"] += 1
+                    st["bytes"] += size
+                    rec = self.recorder
+                    if rec is not None and name in SENSOR_STREAMS: rec.tap(name, ts, fid, payload, ptype)
+
+                    if pending.full():
+                        st["dropped"] += 1  # 解码跟不上，丢新帧而不是反压 socket
+                        continue
+                    if offload:
+                        pending.put_nowait((ts, fid, self.loop.run_in_executor(self.executor, decode, payload,
+                                                                               ptype, fid)))
+                    else:
+                        pending.put_nowait((ts, fid, decode(payload, ptype, fid)))
+            except (asyncio.IncompleteReadError, ConnectionError):
+                pass
+            except asyncio.TimeoutError:
+                st["timeouts"] += 1
+                self.log_signal.emit(f"[{name}] TIMEOUT: {peer[0]}")
+            # 对端正常断开: 已收到的帧解码完、入队后再收尾
+            await pending.join()
+        finally:
+            deliver.cancel()
+            await asyncio.gather(deliver, return_exceptions=True)
+            writer.close()
+            self.log_signal.emit(f"[{name}] DISCONNECTED")
+
+    async def _read_header(self, reader, proto, name):
+        """ 返回 ((ts, size, fid, ptype), proto)；v1 长度离谱返回 (None, 1)，v2 校验失败则扫描到下一个合法包头 """
+        def read(n):
+            return asyncio.wait_for(reader.readexactly(n), self.timeout_s)
+
+        got = b""
+        if proto is None:
+            got = await read(len(MAGIC))
+            proto = 2 if got == MAGIC else 1
+        if proto == 1:
+            ts, size, fid = HEADER.unpack(got + await read(HEADER.size - len(got)))
+            return ((ts, size, fid, PT_DEFAULT) if size <= INGEST_MAX_PAYLOAD else None), proto
+
+        buf, lost = bytearray(got + await read(HEADER_V2.size - len(got))), 0
+        while True:
+            hdr = parse_header(buf)
+            if hdr is not None: break
+            k = resync_offset(buf)
+            buf = buf[k:] + await read(k)
+            lost += k
+        if lost:
+            st = self.stats[name]
+            st["resync"] += 1
+            st["skipped_bytes"] += lost
+            self.log_signal.emit(f"[{name}] RESYNC: skipped {lost} B")
+        return hdr, proto
+
+    async def _deliver(self, pending, q, st):
+        while True:
+            ts, fid, data = await pending.get()
+            if asyncio.isfuture(data):
+                try:
+                    data = await data
+                except Exception:
+                    data = None
+            if data is not None:
+                q.append((ts, fid, data))
+            else:
+                st["rejected"] += 1
+            pending.task_done()
+
+    def get_stats(self):
+        return {f"{name}_{k}": v for name, st in self.stats.items() for k, v in st.items()}
+
+    def stop(self):
+        if not self.loop.is_closed(): self.loop.call_soon_threadsafe(self.stop_event.set)
+        self.wait()
+        if not self.loop.is_closed(): self.loop.close()
+        self.executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,116 @@
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from PyQt6.QtCore import QThread, pyqtSignal
+from algorithms.calibration import detect_pair, coverage, is_novel, solve
+from core.data_link import DEMAND
+from config import (VIS_W, VIS_H, CHECKERBOARD_SIZE, CALIB_INTERVAL_S, CALIB_MIN_VIEWS, CALIB_MAX_VIEWS, CALIB_COVERAGE,
+                    CALIB_MAX_H_ERR)
+
+
+class AutoCalibrator(QThread):
+    """
+    [自动标定]: 从 SyncEngine 配好对的帧里定时抽样，找棋盘 / 加热铜板角点
+    offer() 在 SyncEngine 线程里调用，只在到点且上一对处理完时拷贝一次，其余直接返回；
+    角点检测和求解都在单独的进程里做，不占 SyncEngine 的 GIL。
+    攒够视角、覆盖率达标后求内参 + 单应，单应误差在门限内才建好映射表整体换进 ImageAligner。
+    运行期间向 demand 登记全分辨率，角点要在全分辨率画面上找。
+    """
+    log_signal = pyqtSignal(str)
+
+    def __init__(self, aligner, pattern=CHECKERBOARD_SIZE, min_views=CALIB_MIN_VIEWS,
+                 max_views=CALIB_MAX_VIEWS, min_coverage=CALIB_COVERAGE, interval_s=CALIB_INTERVAL_S,
+                 max_h_err=CALIB_MAX_H_ERR, demand=DEMAND):
+        super().__init__()
+        self.demand = demand
+        self.aligner = aligner
+        self.pattern = tuple(pattern)
+        self.min_views, self.max_views = min_views, max_views
+        self.min_coverage = min_coverage
+        self.interval_s = interval_s
+        self.max_h_err = max_h_err
+        self.running = True
+        self.pending = None  # 单槽信箱: (ts, v_img, t_raw)
+        self.last_offer = 0.0
+        self.views = []
+        self.result = None
+        self.stats = {"offered": 0, "detected": 0, "accepted": 0}
+
+    def offer(self, ts, v_img, t_raw):
+        """ SyncEngine 线程调用: 热成像帧在接收槽位里会被复用，必须拷贝 """
+        now = time.time()
+        if self.pending is not None or now - self.last_offer < self.interval_s: return
+        # 切换到全分辨率之前还在路上的小尺寸帧不要
+        if v_img.shape[:2] != (VIS_H, VIS_W): return
+        self.last_offer = now
+        self.stats["offered"] += 1
+        self.pending = (ts, v_img.copy(), t_raw.copy())
+
+    def run(self):
+        self.log_signal.emit(f"[CALIB] START: board {self.pattern[0]}x{self.pattern[1]}, need {self.min_views} views")
+        self.demand.require("calib", VIS_W, VIS_H)
+        # spawn: 不把 Qt 线程状态 fork 进子进程
+        pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+        try:
+            while self.running and not self._ready():
+                item = self.pending
+                if item is None:
+                    self.msleep(20)
+                    continue
+                _, v_img, t_raw = item
+                res = self._result(pool.submit(detect_pair, v_img, t_raw, self.pattern))
+                self.pending = None
+                if res is None: continue
+                self.stats["detected"] += 1
+                if not is_novel(self.views, res[0]): continue
+                self.views.append(res)
+                self.stats["accepted"] += 1
+                self.log_signal.emit(f"[CALIB] VIEW {len(self.views)}/{self.min_views} "
+                                     f"coverage {coverage(self.views) * 100:.0f}%")
+
+            if not self._ready():
+                self.log_signal.emit("[CALIB] CANCELLED")
+                return
+            self.log_signal.emit(f"[CALIB] SOLVING ({len(self.views)} views)...")
+            r = self._result(pool.submit(solve, self.views, self.pattern))
+            if not self.running:
+                self.log_signal.emit("[CALIB] CANCELLED")
+                return
+            if r is None:
+                self.log_signal.emit("[CALIB] FAILED: homography not found (too few views at one distance?)")
+                return
+            self.result = r
+            self.log_signal.emit("[CALIB] DEPTH ERR: " + ", ".join(f"{s:.0f}px/sq {e:.2f}" for s, e in r["depth_err"]))
+            if r["h_err"] > self.max_h_err:
+                self.log_signal.emit(f"[CALIB] REJECTED: homography err {r['h_err']:.3f}px > {self.max_h_err}px")
+                return
+            # 映射表在本线程建好，ImageAligner 里只是一次赋值
+            self.aligner.set_matrices(r["H"], r["K"], r["dist"])
+            self.aligner.set_mode("homography")
+            self.log_signal.emit(f"[CALIB] DONE: intrinsics rms {r['rms']:.3f}px, "
+                                 f"homography err {r['h_err']:.3f}px ({r['inliers'] * 100:.0f}% inliers, "
+                                 f"{r['band']}/{len(self.views)} views at one distance)")
+        except Exception as e:
+            self.log_signal.emit(f"[CALIB] ERROR: {e}")
+        finally:
+            self.demand.release("calib")
+            # 不等子进程里正在跑的任务，stop() 要能马上返回
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _result(self, fut):
+        """ 轮询子进程的结果，期间 stop() 可以打断 (返回 None) """
+        while self.running:
+            try:
+                return fut.result(timeout=0.05)
+            except FutureTimeout:
+                continue
+        fut.cancel()
+        return None
+
+    def _ready(self):
+        n = len(self.views)
+        return n >= self.max_views or (n >= self.min_views and coverage(self.views) >= self.min_coverage)
+
+    def stop(self):
+        self.running = False
+        self.wait()
@@ -1,23 +1,253 @@
 import socket
 import struct
+import threading
+import zlib
 import numpy as np
 import cv2
 import time
 from PyQt6.QtCore import QThread, pyqtSignal
-from config import VIS_W, VIS_H, THERMAL_W, THERMAL_H
+from config import (VIS_W, VIS_H, THERMAL_W, THERMAL_H, RECV_ZERO_COPY, RECV_POOL_SPARE,
+                    DECODE_WORKERS, DECODE_MAX_PENDING, INGEST_MAX_PAYLOAD, VIS_DECODE_SCALE)
+from core.decode_pool import DecodePool
+from core.frame_buffer import FrameRing
+
+# 包头: Timestamp(8) + Size(4) + FrameID(4)，与 Edge_Pi_CPP/main.cpp 的 PacketHeader 对应
+HEADER = struct.Struct("=QII")
+
+# 协议 v2: 魔数 + 原三个字段 + 负载类型/标志 + CRC32 (覆盖前 24 字节)
+# 每条连接的前 4 字节是不是魔数决定用哪个版本，旧 Pi 照常按 v1 收
+MAGIC = b"4DP2"
+HEADER_V2 = struct.Struct("=4sQIIHHI")
+_V2_BODY = struct.Struct("=4sQIIHH")
+
+
+# 负载类型 (v2 包头 payload_type)，0 = 按端口默认 (视频 JPEG / 热成像 raw uint16)，v1 流一律是 0
+# 热成像的无损编码: png16 = 16 位 PNG；zlib16 = 整帧按字节拆成低/高两个平面后 zlib (关键帧)；
+# delta16 = 与上一帧 (frame_id - 1) 的回绕差分，zigzag 成小的无符号数再拆平面 + zlib，温度场帧间变化小，压缩率高
+PT_DEFAULT, PT_JPEG, PT_RAW16, PT_PNG16, PT_ZLIB16, PT_DELTA16 = range(6)
+PAYLOAD_TYPES = {PT_DEFAULT: "default", PT_JPEG: "jpeg", PT_RAW16: "raw16", PT_PNG16: "png16",
+                 PT_ZLIB16: "zlib16", PT_DELTA16: "delta16"}
+RAW_TYPES = (PT_DEFAULT, PT_RAW16)
+
+
+def pack_header(ts, size, fid, ptype=0, flags=0):
+    body = _V2_BODY.pack(MAGIC, ts, size, fid, ptype, flags)
+    return body + struct.pack("=I", zlib.crc32(body))
+
+
+def parse_header(buf, max_size=INGEST_MAX_PAYLOAD):
+    """ 校验 v2 包头，返回 (ts, size, fid, ptype)；魔数、CRC、长度任一不对返回 None """
+    magic, ts, size, fid, ptype, flags, crc = HEADER_V2.unpack_from(buf)
+    if magic != MAGIC or size > max_size: return None
+    if crc != zlib.crc32(memoryview(buf)[:_V2_BODY.size]): return None
+    return ts, size, fid, ptype
+
+
+def resync_offset(buf):
+    """ 包头校验失败后的扫描: 返回 buf 里下一个可能的包头起点 (魔数，或末尾的魔数前缀)，之前的字节丢弃 """
+    n = HEADER_V2.size
+    k = bytes(buf[:n]).find(MAGIC, 1)
+    if k > 0: return k
+    for k in range(n - len(MAGIC) + 1, n):
+        if MAGIC.startswith(bytes(buf[k:n])): return k
+    return n
+
+
+# 缩小解码: libjpeg 在 DCT 阶段直接出 1/2、1/4、1/8 尺寸，比全尺寸解码再缩放省一个数量级
+REDUCED_GRAYSCALE = {1: cv2.IMREAD_GRAYSCALE, 2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+                     4: cv2.IMREAD_REDUCED_GRAYSCALE_4, 8: cv2.IMREAD_REDUCED_GRAYSCALE_8}
+
+
+class DecodeDemand:
+    """
+    [解码分辨率需求]: 下游各自登记需要的最小可见光尺寸 (全分辨率坐标下的像素数)，
+    接收端每帧读 scale，取能满足所有登记的最大缩小倍数。没有任何登记时全分辨率解码。
+    fixed: 配置写死倍数时忽略登记。
+    """
+    SCALES = (8, 4, 2, 1)
+
+    def __init__(self, fixed=None):
+        self.fixed = fixed
+        self.needs = {}
+        self.lock = threading.Lock()
+        self.scale = fixed or 1
+
+    def require(self, name, w, h):
+        with self.lock:
+            self.needs[name] = (w, h)
+            self._update()
+
+    def release(self, name):
+        with self.lock:
+            self.needs.pop(name, None)
+            self._update()
+
+    def _update(self):
+        if self.fixed: return
+        w = max((n[0] for n in self.needs.values()), default=VIS_W)
+        h = max((n[1] for n in self.needs.values()), default=VIS_H)
+        self.scale = next((s for s in self.SCALES if VIS_W // s >= w and VIS_H // s >= h), 1)
+
+    def shape(self):
+        return VIS_H // self.scale, VIS_W // self.scale
+
+
+# 进程内共享的一份: 接收端 (DataReceiver / IngestServer / AsyncIngest / ReplaySource) 读，消费者登记
+DEMAND = DecodeDemand(None if VIS_DECODE_SCALE == "auto" else int(VIS_DECODE_SCALE))
+
+
+def decode_jpeg(payload, scale=1):
+    """ OV9281 负载: JPEG -> 灰度图 (可 1/2/4/8 缩小解码)，尺寸不对时缩放到 VIS_W x VIS_H 的对应比例 """
+    data = cv2.imdecode(np.frombuffer(payload, dtype=np.uint8), REDUCED_GRAYSCALE[scale])
+    # 尺寸校验
+    w, h = VIS_W // scale, VIS_H // scale
+    if data is not None and (data.shape[1] != w or data.shape[0] != h):
+        data = cv2.resize(data, (w, h))
+    return data
+
+
+def decode_video(payload, ptype=PT_DEFAULT, fid=None, scale=1):
+    """ 视频路只有 JPEG，其它负载类型返回 None (前三个参数与 ThermalDecoder.decode 一致) """
+    return decode_jpeg(payload, scale) if ptype in (PT_DEFAULT, PT_JPEG) else None
+
+
+def decode_thermal(payload):
+    """ Tiny1-C 负载: 原始 uint16，大小不对返回 None (视图，不拷贝) """
+    if len(payload) != THERMAL_W * THERMAL_H * 2: return None
+    return np.frombuffer(payload, dtype=np.uint16).reshape((THERMAL_H, THERMAL_W))
+
+
+class ThermalDecoder:
+    """
+    [热成像解码]: 按负载类型还原 uint16 帧，有状态 (delta16 的参考帧)，每条连接 / 每路回放一个实例
+    raw 返回负载上的视图，其余类型返回新数组。每帧解码后都留一份参考帧 (约 96KB 拷贝)，
+    delta16 只在参考帧正好是 frame_id - 1 时才解，中间丢过帧 (重新同步、录制丢帧、回放跳转)
+    就拒收，直到下一个关键帧 (raw / png16 / zlib16)。
+    """
+
+    def __init__(self):
+        self.ref = np.zeros((THERMAL_H, THERMAL_W), np.uint16)
+        self.ref_fid = None
+        self.stats = {"key_wait": 0}
+
+    def decode(self, payload, ptype=PT_DEFAULT, fid=None):
+        try:
+            data = self._decode(payload, ptype, fid)
+        except (zlib.error, cv2.error):
+            data = None
+        if data is None:
+            self.ref_fid = None
+        else:
+            self.reference(fid, data)
+        return data
+
+    def reference(self, fid, frame):
+        """ 记下参考帧 (帧直接写进 FrameRing 槽位、不经过 decode 时由接收端调用) """
+        np.copyto(self.ref, frame)
+        self.ref_fid = fid
+
+    def _decode(self, payload, ptype, fid):
+        if ptype in RAW_TYPES: return decode_thermal(payload)
+        if ptype == PT_PNG16:
+            data = cv2.imdecode(np.frombuffer(payload, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+            if data is None or data.dtype != np.uint16 or data.shape != (THERMAL_H, THERMAL_W): return None
+            return data
+        if ptype == PT_ZLIB16: return _unshuffle(zlib.decompress(payload))
+        if ptype == PT_DELTA16:
+            if fid is None or self.ref_fid is None or fid != (self.ref_fid + 1) & 0xFFFFFFFF:
+                self.stats["key_wait"] += 1
+                return None
+            z = _unshuffle(zlib.decompress(payload))
+            if z is None: return None
+            # 反 zigzag 后做 uint16 加法，自然回绕，与发送端的回绕差分互逆
+            return self.ref + ((z >> 1) ^ (0 - (z & 1)).astype(np.uint16))
+        return None
+
+
+def _shuffle(frame):
+    """ uint16 帧 -> 低字节平面 + 高字节平面 (高字节几乎不变，zlib 压得很狠) """
+    return frame.view(np.uint8).reshape(-1, 2).T.tobytes()
+
+
+def _unshuffle(raw):
+    if len(raw) != THERMAL_W * THERMAL_H * 2: return None
+    planes = np.frombuffer(raw, dtype=np.uint8).reshape(2, -1)
+    return np.ascontiguousarray(planes.T).view(np.uint16).reshape((THERMAL_H, THERMAL_W))
+
+
+def encode_thermal(frame, ptype, ref=None):
+    """ 与 ThermalDecoder 对应的编码 (模拟器 / 离线转码用)，delta16 需要上一帧 ref """
+    if ptype in RAW_TYPES: return frame.tobytes()
+    if ptype == PT_PNG16: return cv2.imencode(".png", frame)[1].tobytes()
+    if ptype == PT_ZLIB16: return zlib.compress(_shuffle(frame), 1)
+    if ptype == PT_DELTA16:
+        d = (frame - ref).view(np.int16).astype(np.int32)
+        return zlib.compress(_shuffle(((d << 1) ^ (d >> 31)).astype(np.uint16)), 1)
+    raise ValueError(f"unknown payload type {ptype}")
+
+
+class BufferPool:
+    """
+    [接收缓冲池]: 轮转复用的 bytearray 槽位
+    按包头里的 data_size 取槽，容量不够时才扩容。下游拿到的是槽位上的视图，
+    所以槽位数必须大于 "队列长度 + 正在使用的帧数"，否则还没消费的帧会被覆盖。
+    """
+
+    def __init__(self, slots, size=0):
+        self.bufs = [bytearray(size) for _ in range(slots)]
+        self.idx = 0
+        self.grow_cnt = 0
+
+    def acquire(self, size):
+        buf = self.bufs[self.idx]
+        if len(buf) < size:
+            # 旧 buffer 可能还被 np.frombuffer 视图引用，不能原地 resize，直接换新的
+            # 多留 25% 余量，JPEG 大小抖动时不会反复扩容
+            buf = bytearray(size + size // 4)
+            self.bufs[self.idx] = buf
+            self.grow_cnt += 1
+        self.idx = (self.idx + 1) % len(self.bufs)
+        return memoryview(buf)[:size]
 
 
 class DataReceiver(QThread):
     log_signal = pyqtSignal(str)
 
-    def __init__(self, port, queue, mode):
+    def __init__(self, port, queue, mode, zero_copy=RECV_ZERO_COPY, decode_workers=DECODE_WORKERS, demand=DEMAND):
         super().__init__()
         self.port = port
         self.queue = queue
         self.mode = mode  # "video" or "thermal"
+        self.demand = demand  # 视频按下游需求缩小解码
         self.running = True
         self.server_socket = None
 
+        # 零拷贝接收: 包头和负载都 recv_into 到预分配的槽位里
+        self.zero_copy = zero_copy
+        self.head_buf = bytearray(HEADER_V2.size)
+        self.head_view = memoryview(self.head_buf)
+        self.proto = None  # 1 / 2，每条连接重新判断
+        slots = (getattr(queue, "maxlen", None) or 8) + RECV_POOL_SPARE
+        init_size = THERMAL_W * THERMAL_H * 2 if mode == "thermal" else 0
+
+        # 视频解码放到线程池，socket 线程只切包 (decode_workers=0 时退回线程内解码)
+        self.decoder = None
+        if mode == "video" and decode_workers > 0:
+            self.decoder = DecodePool(queue, self.decode_video, decode_workers, DECODE_MAX_PENDING)
+            # 解码后是新数组，队列不再占用槽位；只需覆盖在途的包
+            slots = DECODE_MAX_PENDING + RECV_POOL_SPARE
+        self.pool = BufferPool(slots, init_size)
+        # 热成像 + FrameRing: 负载直接 recv_into 到环的槽位里，收完 commit 即发布
+        self.direct = mode == "thermal" and zero_copy and isinstance(queue, FrameRing)
+        self.in_ring = False
+        self.thermal = ThermalDecoder() if mode == "thermal" else None
+        self.stats = {"packets": 0, "bytes": 0, "rejected": 0, "resync": 0, "skipped_bytes": 0}
+        self.recorder = None  # SessionRecorder，挂上后旁路录制原始负载
+
+    def decode_video(self, payload):
+        # 倍数在解码时才读，下游需求变了下一帧就生效
+        return decode_jpeg(payload, self.demand.scale)
+
     def recv_all(self, sock, count):
         """ 严格按照您提供的代码逻辑 """
         buf = b''
@@ -31,6 +261,75 @@ class DataReceiver(QThread):
                 return None
         return buf
 
+    def recv_into(self, sock, view):
+        """ 零拷贝版 recv_all: 直接写进 view，读满才返回 True """
+        n, count = 0, len(view)
+        while n < count:
+            try:
+                r = sock.recv_into(view[n:], count - n)
+            except:
+                return False
+            if not r: return False
+            n += r
+        return True
+
+    def recv_header(self, sock):
+        """ 收包头，返回 (ts, size, fid, ptype)，断线返回 None
+        v2 包头校验失败时不断线，向后扫描到下一个合法包头 (中间的字节计入 skipped_bytes)；
+        v1 没有魔数无法重新同步，长度离谱只能抛 ValueError 断开 """
+        hv, got = self.head_view, 0
+        if self.proto is None:
+            if not self.recv_into(sock, hv[:len(MAGIC)]): return None
+            self.proto = 2 if hv[:len(MAGIC)] == MAGIC else 1
+            got = len(MAGIC)
+        if self.proto == 1:
+            if not self.recv_into(sock, hv[got:HEADER.size]): return None
+            ts, size, fid = HEADER.unpack_from(self.head_buf)
+            if size > INGEST_MAX_PAYLOAD: raise ValueError(f"bad size {size}")
+            return ts, size, fid, PT_DEFAULT
+
+        lost, n = 0, HEADER_V2.size
+        while True:
+            if not self.recv_into(sock, hv[got:n]): return None
+            hdr = parse_header(self.head_buf)
+            if hdr is not None: break
+            k = resync_offset(self.head_buf)
+            self.head_buf[:n - k] = self.head_buf[k:n]
+            got = n - k
+            lost += k
+        if lost:
+            self.stats["resync"] += 1
+            self.stats["skipped_bytes"] += lost
+            self.log_signal.emit(f"[{self.mode}] RESYNC: skipped {lost} B")
+        return hdr
+
+    def recv_packet(self, sock):
+        """ 收一个完整的包，返回 (ts, size, fid, ptype, payload)，断线返回 None """
+        hdr = self.recv_header(sock)
+        if hdr is None: return None
+        ts, size, fid, ptype = hdr
+        if self.zero_copy:
+            # 只有 raw 热成像能直接收进环的槽位，压缩负载要先解码
+            slot = self.queue.claim() if self.direct and ptype in RAW_TYPES else None
+            self.in_ring = slot is not None and slot.nbytes == size
+            payload = memoryview(slot).cast("B") if self.in_ring else self.pool.acquire(size)
+            if not self.recv_into(sock, payload): return None
+            if self.in_ring: self.thermal.reference(fid, slot)
+        else:
+            payload = self.recv_all(sock, size)
+            if payload is None: return None
+        return ts, size, fid, ptype, payload
+
+    def get_stats(self):
+        """ 各级计数: 接收 (packets/bytes/rejected) + 解码池 (decode_*) + 帧环 (ring_*) + 等关键帧 (key_wait) """
+        s = dict(self.stats)
+        if self.decoder:
+            for k, v in self.decoder.get_stats().items(): s[f"decode_{k}"] = v
+        if self.thermal: s.update(self.thermal.stats)
+        if isinstance(self.queue, FrameRing):
+            for k, v in self.queue.get_stats().items(): s[f"ring_{k}"] = v
+        return s
+
     def run(self):
         # === 外层死循环：掉线后自动重启服务 ===
         while self.running:
@@ -61,38 +360,54 @@ class DataReceiver(QThread):
                     # 连接成功！
                     self.log_signal.emit(f"[{self.mode}] LINK: {addr[0]}")
                     conn.settimeout(None)  # 恢复阻塞模式，全速传输
+                    self.proto = None
+                    if self.thermal: self.thermal.ref_fid = None  # 新连接的 delta16 要从关键帧开始
 
                     # 4. 数据接收循环 (内层)
                     while self.running:
                         try:
-                            # 收包头
-                            head = self.recv_all(conn, 16)
-                            if not head: break
-
-                            ts, size, fid = struct.unpack("=QII", head)
+                            # 收包头 + 数据
+                            pkt = self.recv_packet(conn)
+                            if pkt is None: break
+                            ts, size, fid, ptype, payload = pkt
 
-                            # 收数据
-                            payload = self.recv_all(conn, size)
-                            if not payload: break
+                            self.stats["packets"] += 1
+                            self.stats["bytes"] += size
+                            rec = self.recorder
+                            if rec is not None: rec.tap(self.mode, ts, fid, payload, ptype)
 
                             data = None
                             if self.mode == "video":
-                                data = cv2.imdecode(np.frombuffer(payload, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
-                                # 尺寸校验
-                                if data is not None and (data.shape[1] != VIS_W or data.shape[0] != VIS_H):
-                                    data = cv2.resize(data, (VIS_W, VIS_H))
+                                if ptype not in (PT_DEFAULT, PT_JPEG):
+                                    self.stats["rejected"] += 1
+                                    continue
+                                if self.decoder:
+                                    # 交给解码池，按序入队由重排阶段负责
+                                    self.decoder.submit(ts, fid, payload)
+                                    continue
+                                data = self.decode_video(payload)
 
                             elif self.mode == "thermal":
-                                if size == THERMAL_W * THERMAL_H * 2:
-                                    data = np.frombuffer(payload, dtype=np.uint16).reshape((THERMAL_H, THERMAL_W))
+                                if self.in_ring:
+                                    self.queue.commit(ts, fid)
+                                    continue
+                                # raw 负载在零拷贝模式下是槽位上的视图，不再复制
+                                data = self.thermal.decode(payload, ptype, fid)
 
                             if data is not None:
                                 # 存入队列
                                 self.queue.append((ts, fid, data))
+                            else:
+                                self.stats["rejected"] += 1
 
+                        except ValueError as e:
+                            # v1 流错位，只能断开重连
+                            self.log_signal.emit(f"[{self.mode}] {e}")
+                            break
                         except Exception as e:
+                            # 整包已经收完，流没有错位，丢掉这一帧继续收
                             print(f"Data Error: {e}")
-                            break  # 数据出错，断开重连
+                            self.stats["rejected"] += 1
 
                     # 客户端断开，关闭连接，回到 accept 继续等
                     conn.close()
@@ -113,4 +428,5 @@ class DataReceiver(QThread):
 
     def stop(self):
         self.running = False
-        self.wait()
\ No newline at end of file
+        self.wait()
+        if self.decoder: self.decoder.shutdown()
\ No newline at end of file
@@ -0,0 +1,78 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class DecodePool:
+    """
+    [解码流水线]: 有界线程池并行解码 + 按序发布
+    接收线程只负责切包，submit() 立即返回继续读 socket；cv2.imdecode 会释放 GIL，
+    多个 worker 能真正并行。worker 完成顺序是乱的，重排阶段按提交顺序
+    (即线上 frame_id 顺序) 依次 append 到 queue，下游看到的帧序不变。
+    """
+
+    def __init__(self, queue, decode_fn, workers=2, max_pending=8, executor=None):
+        self.queue = queue
+        self.decode_fn = decode_fn
+        self.workers = workers
+        self.max_pending = max_pending
+        # 多路共用一个线程池时由外部传入 executor，shutdown() 不关它
+        self.own_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(max_workers=workers, thread_name_prefix="decode")
+
+        self.lock = threading.Lock()
+        self.seq_in = 0  # 下一个分配的序号
+        self.seq_out = 0  # 下一个该发布的序号
+        self.done = {}  # seq -> (ts, fid, data)，等待前面的帧解完
+
+        self.stats = {"submitted": 0, "dropped": 0, "decoded": 0, "failed": 0,
+                      "published": 0, "reorder_wait": 0, "busy_ms": 0.0}
+
+    def pending(self):
+        return self.seq_in - self.seq_out
+
+    def submit(self, ts, fid, payload):
+        """ 在途帧数已满时直接丢弃新包 (不阻塞 socket)，返回是否接收 """
+        with self.lock:
+            if self.seq_in - self.seq_out >= self.max_pending:
+                self.stats["dropped"] += 1
+                return False
+            seq = self.seq_in
+            self.seq_in += 1
+            self.stats["submitted"] += 1
+        self.executor.submit(self._work, seq, ts, fid, payload)
+        return True
+
+    def _work(self, seq, ts, fid, payload):
+        t0 = time.perf_counter()
+        try:
+            data = self.decode_fn(payload)
+        except Exception:
+            data = None
+        dt = (time.perf_counter() - t0) * 1000.0
+
+        with self.lock:
+            self.stats["busy_ms"] += dt
+            self.stats["decoded" if data is not None else "failed"] += 1
+            self.done[seq] = (ts, fid, data)
+            if seq != self.seq_out: self.stats["reorder_wait"] += 1
+
+            # 重排: 把已经连续解完的帧按序发出去，解码失败的帧占位后跳过
+            while self.seq_out in self.done:
+                item = self.done.pop(self.seq_out)
+                self.seq_out += 1
+                if item[2] is not None:
+                    self.queue.append(item)
+                    self.stats["published"] += 1
+
+    def get_stats(self):
+        with self.lock:
+            s = dict(self.stats)
+        n = s["decoded"] + s["failed"]
+        s["avg_ms"] = s["busy_ms"] / n if n else 0.0
+        s["pending"] = self.pending()
+        s["workers"] = self.workers
+        return s
+
+    def shutdown(self):
+        if self.own_executor: self.executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,115 @@
+from config import POLICY_FIFO_DEPTH, POLICY_WINDOW_MS, POLICY_NTH
+
+
+class DropPolicy:
+    """
+    [丢帧策略]: 消费者自己的读游标 + 取帧规则，作用在 FrameRing / TimedRing 上
+    同一个环可以挂多个策略 (显示取最新、事件逐帧)，互不影响。
+    计数: processed 交给下游的帧 / dropped 按策略主动跳过的帧 /
+          stale 还没轮到就过期 (超出时间窗，或被生产者绕圈覆盖) 的帧
+    """
+    name = "base"
+
+    def __init__(self):
+        self.seq = None  # 下一帧要看的序号
+        self.stats = {"processed": 0, "dropped": 0, "stale": 0}
+
+    def take(self, ring):
+        """ 取下一帧 (ts, fid, data)，没有可处理的帧返回 None """
+        lo, hi = ring.seq_range()
+        if self.seq is None: self.seq = lo
+        if self.seq < lo:
+            self.stats["stale"] += lo - self.seq
+            self.seq = lo
+        if self.seq >= hi: return None
+        seq = self._pick(ring, hi)
+        if seq is None: return None
+        self.seq = seq + 1
+        self.stats["processed"] += 1
+        mark = getattr(ring, "mark_read", None)
+        if mark: mark(self.seq, self)
+        return ring.item(seq)
+
+    def _pick(self, ring, hi):
+        raise NotImplementedError
+
+    def describe(self):
+        return self.name
+
+    def get_stats(self):
+        return dict(self.stats, policy=self.describe())
+
+
+class LatestOnly(DropPolicy):
+    """ 只取最新一帧，中间的全部跳过 (显示用) """
+    name = "latest"
+
+    def _pick(self, ring, hi):
+        self.stats["dropped"] += hi - 1 - self.seq
+        return hi - 1
+
+
+class BoundedFifo(DropPolicy):
+    """ 按序逐帧处理，积压超过 depth 时丢最旧的 """
+    name = "fifo"
+
+    def __init__(self, depth=POLICY_FIFO_DEPTH):
+        super().__init__()
+        self.depth = depth
+
+    def _pick(self, ring, hi):
+        if hi - self.seq > self.depth:
+            self.stats["dropped"] += hi - self.depth - self.seq
+            self.seq = hi - self.depth
+        return self.seq
+
+    def describe(self):
+        return f"fifo:{self.depth}"
+
+
+class TimeWindow(DropPolicy):
+    """ 按序逐帧处理，比最新帧早 window_ms 以上的帧直接作废 """
+    name = "window"
+
+    def __init__(self, window_ms=POLICY_WINDOW_MS):
+        super().__init__()
+        self.window_us = window_ms * 1000
+
+    def _pick(self, ring, hi):
+        oldest_ok = ring.ts_of(hi - 1) - self.window_us
+        while self.seq < hi - 1 and ring.ts_of(self.seq) < oldest_ok:
+            self.stats["stale"] += 1
+            self.seq += 1
+        return self.seq
+
+    def describe(self):
+        return f"window:{self.window_us // 1000}ms"
+
+
+class EveryNth(DropPolicy):
+    """ 按写入序号每 n 帧取一帧 (降采样)，其余跳过 """
+    name = "nth"
+
+    def __init__(self, n=POLICY_NTH):
+        super().__init__()
+        self.n = max(1, n)
+
+    def _pick(self, ring, hi):
+        skip = -self.seq % self.n
+        if self.seq + skip >= hi:
+            # 这一批里没有要处理的，游标停在下一个要处理的序号上
+            self.stats["dropped"] += hi - self.seq
+            self.seq = hi
+            return None
+        self.stats["dropped"] += skip
+        return self.seq + skip
+
+    def describe(self):
+        return f"nth:{self.n}"
+
+
+POLICIES = {"latest": LatestOnly, "fifo": BoundedFifo, "window": TimeWindow, "nth": EveryNth}
+
+
+def make_policy(name, **kw):
+    return POLICIES[name](**kw)
@@ -0,0 +1,243 @@
+import weakref
+import numpy as np
+
+
+class TimedRing:
+    """
+    [时间索引环形缓冲]: 按时间戳有序存放 (ts, fid, data)
+    容量固定，满了覆盖最旧的一帧；Pi 端时间戳单调递增，所以查找直接二分，O(log n)。
+    """
+
+    def __init__(self, capacity=32):
+        self.cap = capacity
+        self.ts = [0] * capacity
+        self.items = [None] * capacity
+        self.head = 0  # 最旧一帧的位置
+        self.size = 0
+        self.count = 0  # 累计写入帧数，用来判断 "有没有新帧"
+
+    def __len__(self):
+        return self.size
+
+    def clear(self):
+        self.items = [None] * self.cap
+        self.head = 0
+        self.size = 0
+
+    def _pos(self, i):
+        return (self.head + i) % self.cap
+
+    def ts_at(self, i):
+        return self.ts[self._pos(i)]
+
+    def get(self, i):
+        return self.items[self._pos(i)]
+
+    def append(self, ts, fid, data):
+        if self.size and ts < self.ts_at(self.size - 1):
+            # 时间戳回退 (Pi 重启 / 换设备)，旧数据和新数据不在一个时间轴上，全部作废
+            self.clear()
+        if self.size == self.cap:
+            self.head = (self.head + 1) % self.cap
+            self.size -= 1
+        p = self._pos(self.size)
+        self.ts[p] = ts
+        self.items[p] = (ts, fid, data)
+        self.size += 1
+        self.count += 1
+
+    def seq_range(self):
+        """ 可读帧的序号范围 [lo, hi)，序号即累计写入序号 (供 DropPolicy 按序号取帧) """
+        return self.count - self.size, self.count
+
+    def item(self, seq):
+        return self.get(seq - (self.count - self.size))
+
+    def ts_of(self, seq):
+        return self.ts_at(seq - (self.count - self.size))
+
+    def drain(self, q):
+        """ 把接收队列 (deque) 里的帧全部搬进来，返回搬了几帧 """
+        n = 0
+        while q:
+            self.append(*q.popleft())
+            n += 1
+        return n
+
+    def latest(self):
+        return self.get(self.size - 1) if self.size else None
+
+    def bisect(self, ts):
+        """ 第一个 ts_at(i) >= ts 的位置 """
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.ts_at(mid) < ts:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def bracket(self, ts):
+        """ 目标时间前后的两帧 (before, after)，不存在的一侧为 None """
+        i = self.bisect(ts)
+        before = self.get(i - 1) if i > 0 else None
+        after = self.get(i) if i < self.size else None
+        return before, after
+
+    def nearest(self, ts, tolerance=None):
+        """ |Δt| 最小的一帧；超出 tolerance (同为 us) 返回 None """
+        before, after = self.bracket(ts)
+        best = before
+        if after is not None and (best is None or after[0] - ts < ts - best[0]):
+            best = after
+        if best is None: return None
+        if tolerance is not None and abs(best[0] - ts) > tolerance: return None
+        return best
+
+
+class FrameRing:
+    """
+    [预分配帧环]: 单生产者 / 单消费者，槽位在构造时一次分配好，之后每帧零分配
+    生产者: claim() 拿到下一个槽位直接往里写 (recv_into / 解码输出)，commit(ts, fid) 发布；
+            或 append((ts, fid, data)) 拷贝进槽位 (兼容 deque 的写法)。
+    消费者: latest() 最新一帧 / next() 最旧的未读帧 / nearest(ts) 按时间戳。
+    write_seq 只由生产者递增、read_seq 只由消费者推进，不需要锁。
+    另外可以有多个带自己游标的消费者 (DropPolicy，经 mark_read 报告位置)，它们的丢帧计在各自的策略里；
+    环上的 skipped 只统计上面这组内置读接口；overwritten 同 len() 按最慢的消费者算 (它还没读到就被覆盖的帧)。
+    len() 按最慢的那个消费者算未读帧数 (无损回放据此反压)。
+    正在被 claim 的那个槽位不参与读，所以可读的是最近 capacity - 1 帧。
+    返回的帧是槽位上的视图，生产者绕一圈回来就会被覆盖，需要长期持有的要自己拷贝。
+    append 也接受比槽位小的帧 (缩小解码)，紧凑地写在槽位开头，读出的视图是帧自己的尺寸。
+    """
+
+    def __init__(self, capacity, shape, dtype=np.uint8):
+        self.cap = capacity
+        self.maxlen = capacity  # 与 deque 同名，DataReceiver 按它估算在途帧数
+        self.buf = np.empty((capacity,) + tuple(shape), dtype=dtype)
+        self.ts = np.zeros(capacity, dtype=np.int64)
+        self.fid = np.zeros(capacity, dtype=np.int64)
+        self.views = [None] * capacity  # 槽位里是小尺寸帧时的视图，None = 整个槽位
+        self.write_seq = 0  # 已发布的帧数 (下一帧的序号)
+        self.read_seq = 0   # 内置读接口下一帧要读的序号
+        self.cursor_used = False  # 内置读接口用过没有
+        self.readers = {}   # 外部游标: id(消费者) -> 下一帧要读的序号，只用于 len()
+        self.base = 0       # 时间戳回退时重置，之前的帧作废
+        self.stats = {"written": 0, "overwritten": 0, "skipped": 0, "rejected": 0}
+
+    @property
+    def count(self):
+        return self.write_seq
+
+    def __len__(self):
+        """ 最慢的消费者的未读帧数 """
+        return self.write_seq - max(self._read_pos(), self._oldest())
+
+    def _read_pos(self):
+        seqs = tuple(self.readers.values())  # 其它线程可能同时在写，先整体取一份
+        if self.cursor_used or not seqs: seqs += (self.read_seq,)
+        return min(seqs)
+
+    def _oldest(self):
+        return max(self.base, self.write_seq - self.cap + 1)
+
+    def _item(self, seq):
+        p = seq % self.cap
+        v = self.views[p]
+        return int(self.ts[p]), int(self.fid[p]), self.buf[p] if v is None else v
+
+    # 与 TimedRing 相同的按序号访问接口，多个消费者可以各自带游标 (DropPolicy) 读同一个环
+    def seq_range(self):
+        return self._oldest(), self.write_seq
+
+    def item(self, seq):
+        return self._item(seq)
+
+    def ts_of(self, seq):
+        return int(self.ts[seq % self.cap])
+
+    def mark_read(self, seq, reader):
+        """ DropPolicy 读到 seq 为止: 记下这个消费者的位置 (丢帧计在策略里)，消费者被回收时自动注销 """
+        key = id(reader)
+        if key not in self.readers: weakref.finalize(reader, self.readers.pop, key, None)
+        if seq > self.readers.get(key, 0): self.readers[key] = seq
+
+    # ---- 生产者 ----
+    def claim(self):
+        p = self.write_seq % self.cap
+        self.views[p] = None  # 这个槽位此时不可读，直接复位
+        return self.buf[p]
+
+    def commit(self, ts, fid):
+        seq = self.write_seq
+        p = seq % self.cap
+        if seq > self.base and ts < self.ts[(seq - 1) % self.cap]:
+            # 时间戳回退 (Pi 重启 / 换设备)，同 TimedRing
+            self.base = seq
+        # 这个槽位上一轮的帧最慢的消费者还没读到
+        if seq - self.cap >= max(self._read_pos(), self.base): self.stats["overwritten"] += 1
+        self.ts[p], self.fid[p] = ts, fid
+        self.write_seq = seq + 1
+        self.stats["written"] += 1
+
+    def append(self, item):
+        ts, fid, data = item
+        slot = self.claim()
+        if data.shape != slot.shape:
+            if data.ndim != slot.ndim or any(a > b for a, b in zip(data.shape, slot.shape)):
+                self.stats["rejected"] += 1
+                return
+            slot = slot.reshape(-1)[:data.size].reshape(data.shape)
+            self.views[self.write_seq % self.cap] = slot
+        np.copyto(slot, data)
+        self.commit(ts, fid)
+
+    # ---- 消费者 ----
+    def latest(self):
+        self.cursor_used = True
+        if self.write_seq <= self._oldest(): return None
+        seq = self.write_seq - 1
+        self.stats["skipped"] += max(0, seq - max(self.read_seq, self._oldest()))
+        self.read_seq = seq + 1
+        return self._item(seq)
+
+    def next(self):
+        self.cursor_used = True
+        lo = self._oldest()
+        seq = max(self.read_seq, lo)
+        if seq >= self.write_seq: return None
+        self.read_seq = seq + 1
+        return self._item(seq)
+
+    def popleft(self):
+        """ deque 写法兼容: 没有帧时抛 IndexError """
+        item = self.next()
+        if item is None: raise IndexError("pop from an empty FrameRing")
+        return item
+
+    def nearest(self, ts, tolerance=None):
+        """ |Δt| 最小的一帧；超出 tolerance (us) 返回 None。选中帧之前的未读帧算作已读 """
+        self.cursor_used = True
+        lo, hi = self._oldest(), self.write_seq
+        if lo >= hi: return None
+        a, b = lo, hi
+        while a < b:
+            mid = (a + b) // 2
+            if self.ts[mid % self.cap] < ts:
+                a = mid + 1
+            else:
+                b = mid
+        best = None
+        for seq in (a - 1, a):
+            if lo <= seq < hi and (best is None or abs(int(self.ts[seq % self.cap]) - ts) < abs(int(self.ts[best % self.cap]) - ts)):
+                best = seq
+        if tolerance is not None and abs(int(self.ts[best % self.cap]) - ts) > tolerance: return None
+        if best + 1 > self.read_seq:
+            self.stats["skipped"] += max(0, best - max(self.read_seq, lo))
+            self.read_seq = best + 1
+        return self._item(best)
+
+    def get_stats(self):
+        s = dict(self.stats)
+        s["pending"] = len(self)
+        return s
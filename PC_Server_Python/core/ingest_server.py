@@ -0,0 +1,267 @@
+import socket
+import struct
+import selectors
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PyQt6.QtCore import QThread, pyqtSignal
+from config import (VIS_W, VIS_H, THERMAL_W, THERMAL_H, PORT_VIDEO, PORT_THERMAL, SYNC_RING_VIS,
+                    SYNC_RING_THERMAL, RECV_POOL_SPARE, DECODE_WORKERS, DECODE_MAX_PENDING, INGEST_MAX_PAYLOAD)
+from core.data_link import (HEADER, HEADER_V2, MAGIC, PT_DEFAULT, PT_JPEG, RAW_TYPES, parse_header, resync_offset,
+                            BufferPool, ThermalDecoder, DEMAND, decode_jpeg)
+from core.decode_pool import DecodePool
+from core.frame_buffer import FrameRing
+
+# 可选的 hello 包: 连接后第一个 16 字节 = 魔数 + 设备名 (与包头等长，不带 hello 的旧 Pi 照常工作)
+HELLO_MAGIC = b"4DHI"
+HELLO = struct.Struct("=4s12s")
+
+
+def make_ring(mode):
+    """ 新设备的默认队列 """
+    if mode == "video": return FrameRing(SYNC_RING_VIS, (VIS_H, VIS_W), np.uint8)
+    return FrameRing(SYNC_RING_THERMAL, (THERMAL_H, THERMAL_W), np.uint16)
+
+
+class Device:
+    """ 一套采集设备 (一台 Pi): 两路队列 + 视频解码池 + 计数 """
+
+    def __init__(self, dev_id, queues, executor, workers=DECODE_WORKERS, demand=DEMAND):
+        self.id = dev_id
+        self.queues = queues
+        self.demand = demand
+        self.decoder = DecodePool(queues["video"], self.decode_video, workers, DECODE_MAX_PENDING, executor)
+        self.owner = {}  # mode -> 当前连接，同一设备同一路只保留最新的连接
+        self.stats = {m: {"packets": 0, "bytes": 0, "rejected": 0, "resync": 0, "skipped_bytes": 0}
+                      for m in queues}
+
+    def decode_video(self, payload):
+        return decode_jpeg(payload, self.demand.scale)
+
+    def get_stats(self):
+        s = {}
+        for m, st in self.stats.items():
+            s.update({f"{m}_{k}": v for k, v in st.items()})
+            q = self.queues[m]
+            if isinstance(q, FrameRing): s.update({f"{m}_ring_{k}": v for k, v in q.get_stats().items()})
+        s.update({f"decode_{k}": v for k, v in self.decoder.get_stats().items()})
+        return s
+
+
+class _Conn:
+    """ 一条连接的收包状态机: 先收包头 (v1 16 字节 / v2 28 字节)，再收 data_size 字节负载，全部 recv_into """
+
+    def __init__(self, sock, addr, mode):
+        self.sock, self.addr, self.mode = sock, addr, mode
+        self.dev = None
+        self.proto = None  # 前 16 字节收齐后判断 (hello 包之后的第一个包头)
+        self.head = bytearray(HEADER_V2.size)
+        self.head_view = memoryview(self.head)
+        self.view, self.got = self.head_view[:HEADER.size], 0
+        self.pkt = None  # 收负载阶段: (ts, size, fid, ptype)
+        self.lost = 0  # v2 重新同步时已跳过的字节
+        self.in_ring = False
+        self.slot = None
+        self.thermal = ThermalDecoder() if mode == "thermal" else None
+        size = THERMAL_W * THERMAL_H * 2 if mode == "thermal" else 0
+        self.pool = BufferPool(DECODE_MAX_PENDING + RECV_POOL_SPARE, size)
+
+    def reset(self):
+        self.view = self.head_view[:HEADER_V2.size if self.proto == 2 else HEADER.size]
+        self.got, self.pkt = 0, None
+
+
+class IngestServer(QThread):
+    """
+    [多路接收]: 单线程 selectors + 非阻塞 socket，每个端口接受任意多条连接
+    设备 ID 默认是对端 IP (一台 Pi 的两路连接自然归到一起)，也可以在连接后先发 hello 包自报名字
+    (同一台机器上跑多个模拟器时用)。每台设备有自己的一对队列，第一台上线的设备用 primary 队列，
+    其余的由 queue_factory 创建，device_signal 通知 UI。
+    线程数: 本线程 + 所有设备共用的 decode_workers 个解码线程，与设备数无关。
+    """
+    log_signal = pyqtSignal(str)
+    device_signal = pyqtSignal(str)
+
+    def __init__(self, primary=None, ports=None, queue_factory=make_ring, decode_workers=DECODE_WORKERS):
+        super().__init__()
+        self.ports = ports or {"video": PORT_VIDEO, "thermal": PORT_THERMAL}
+        self.primary = primary  # (q_vis, q_therm)，给第一台设备
+        self.queue_factory = queue_factory
+        self.workers = decode_workers
+        self.executor = ThreadPoolExecutor(max_workers=decode_workers, thread_name_prefix="decode")
+        self.devices = {}
+        self.primary_id = None
+        self.running = True
+        self.recorder = None  # 只录 primary 设备
+
+    def device(self, dev_id):
+        dev = self.devices.get(dev_id)
+        if dev is None:
+            if self.primary is not None and self.primary_id is None:
+                queues = {"video": self.primary[0], "thermal": self.primary[1]}
+                self.primary_id = dev_id
+            else:
+                queues = {m: self.queue_factory(m) for m in ("video", "thermal")}
+            dev = self.devices[dev_id] = Device(dev_id, queues, self.executor, self.workers)
+            self.log_signal.emit(f"[INGEST] DEVICE: {dev_id}" + (" (primary)" if dev_id == self.primary_id else ""))
+            self.device_signal.emit(dev_id)
+        return dev
+
+    def get_stats(self):
+        return {d.id: d.get_stats() for d in list(self.devices.values())}
+
+    def run(self):
+        sel = selectors.DefaultSelector()
+        listeners = []
+        try:
+            for mode, port in self.ports.items():
+                s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                s.bind(('0.0.0.0', port))
+                s.listen(16)
+                s.setblocking(False)
+                sel.register(s, selectors.EVENT_READ, mode)
+                listeners.append(s)
+                self.log_signal.emit(f"[{mode}] WAIT: {port}")
+
+            while self.running:
+                for key, _ in sel.select(0.2):
+                    if isinstance(key.data, str):
+                        self._accept(sel, key.fileobj, key.data)
+                    else:
+                        self._read(sel, key.data)
+        except Exception as e:
+            self.log_signal.emit(f"[INGEST] ERR: {e}")
+        finally:
+            for key in list(sel.get_map().values()):
+                if isinstance(key.data, _Conn): self._close(sel, key.data, quiet=True)
+            for s in listeners: s.close()
+            sel.close()
+
+    def _accept(self, sel, lsock, mode):
+        while True:
+            try:
+                sock, addr = lsock.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            sock.setblocking(False)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sel.register(sock, selectors.EVENT_READ, _Conn(sock, addr, mode))
+
+    def _close(self, sel, c, quiet=False):
+        try:
+            sel.unregister(c.sock)
+        except (KeyError, ValueError):
+            pass
+        c.sock.close()
+        if c.dev is not None and c.dev.owner.get(c.mode) is c: del c.dev.owner[c.mode]
+        if not quiet: self.log_signal.emit(f"[{c.mode}] DISCONNECTED: {c.dev.id if c.dev else c.addr[0]}")
+
+    def _bind(self, sel, c, dev_id):
+        """ 首包确定设备；同一设备同一路的旧连接 (多半是断线没察觉) 让位给新连接 """
+        c.dev = self.device(dev_id)
+        old = c.dev.owner.get(c.mode)
+        if old is not None and old is not c: self._close(sel, old)
+        c.dev.owner[c.mode] = c
+        self.log_signal.emit(f"[{c.mode}] LINK: {c.addr[0]}:{c.addr[1]} -> {dev_id}")
+
+    def _read(self, sel, c):
+        # 读到 EAGAIN 为止，内核缓冲里的数据一次收完
+        while True:
+            try:
+                n = c.sock.recv_into(c.view[c.got:])
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                n = 0
+            if not n:
+                self._close(sel, c)
+                return
+            c.got += n
+            if c.got == len(c.view) and not self._complete(sel, c): return
+
+    def _complete(self, sel, c):
+        """ 包头或负载收满；返回 False 表示连接已关闭 """
+        if c.pkt is None:
+            if c.proto is None:
+                if c.dev is None:
+                    magic, name = HELLO.unpack_from(c.head)
+                    if magic == HELLO_MAGIC:
+                        self._bind(sel, c, name.rstrip(b"\0").decode("utf-8", "replace"))
+                        c.reset()
+                        return True
+                    self._bind(sel, c, c.addr[0])
+                c.proto = 2 if c.head[:len(MAGIC)] == MAGIC else 1
+                if c.proto == 2:
+                    # v2 包头更长，已收的 16 字节留着，接着收剩下的
+                    c.view = c.head_view[:HEADER_V2.size]
+                    return True
+
+            st = c.dev.stats[c.mode]
+            if c.proto == 2:
+                hdr = parse_header(c.head)
+                if hdr is None:
+                    # 校验失败: 丢到下一个可能的魔数处，继续收满包头再试
+                    k = resync_offset(c.head)
+                    n = HEADER_V2.size
+                    c.head[:n - k] = c.head[k:n]
+                    c.got = n - k
+                    c.lost += k
+                    return True
+                if c.lost:
+                    st["resync"] += 1
+                    st["skipped_bytes"] += c.lost
+                    self.log_signal.emit(f"[{c.mode}] RESYNC: {c.dev.id} skipped {c.lost} B")
+                    c.lost = 0
+                ts, size, fid, ptype = hdr
+            else:
+                ts, size, fid = HEADER.unpack_from(c.head)
+                ptype = PT_DEFAULT
+                if size > INGEST_MAX_PAYLOAD:
+                    # v1 没有魔数，错位后无法重新同步
+                    self.log_signal.emit(f"[{c.mode}] BAD SIZE {size} from {c.dev.id}")
+                    self._close(sel, c)
+                    return False
+            if size == 0:
+                st["rejected"] += 1
+                c.reset()
+                return True
+            q = c.dev.queues[c.mode]
+            # 只有 raw 热成像能直接收进环的槽位，压缩负载要先解码
+            direct = c.mode == "thermal" and ptype in RAW_TYPES and isinstance(q, FrameRing)
+            c.slot = q.claim() if direct else None
+            c.in_ring = c.slot is not None and c.slot.nbytes == size
+            c.view = memoryview(c.slot).cast("B") if c.in_ring else c.pool.acquire(size)
+            c.got = 0
+            c.pkt = (ts, size, fid, ptype)
+            return True
+
+        ts, size, fid, ptype = c.pkt
+        payload = c.view
+        c.reset()
+        dev, st = c.dev, c.dev.stats[c.mode]
+        st["packets"] += 1
+        st["bytes"] += size
+        rec = self.recorder
+        if rec is not None and dev.id == self.primary_id: rec.tap(c.mode, ts, fid, payload, ptype)
+
+        q = dev.queues[c.mode]
+        if c.mode == "video":
+            if ptype in (PT_DEFAULT, PT_JPEG):
+                dev.decoder.submit(ts, fid, payload)
+            else:
+                st["rejected"] += 1
+        elif c.in_ring:
+            c.thermal.reference(fid, c.slot)
+            q.commit(ts, fid)
+        else:
+            data = c.thermal.decode(payload, ptype, fid)
+            if data is not None:
+                q.append((ts, fid, data))
+            else:
+                st["rejected"] += 1
+        return True
+
+    def stop(self):
+        self.running = False
+        self.wait()
+        self.executor.shutdown(wait=True, cancel_futures=True)
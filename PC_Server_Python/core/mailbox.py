@@ -0,0 +1,37 @@
+import threading
+from PyQt6.QtCore import QObject, pyqtSignal
+
+
+class FrameMailbox(QObject):
+    """
+    [最新帧信箱]: SyncEngine -> UI 的单槽交接，代替逐帧的 queued 信号
+    put() 在引擎线程里覆盖槽位，只有槽位从空变满时才发一次 ready (排队的通知最多一个)；
+    UI 按显示节奏 take() 取走最新的一份。UI 落后时旧结果被直接覆盖 (计入 superseded)，
+    Qt 事件队列里不会堆积帧，显示延迟最多一帧。
+    """
+    ready = pyqtSignal()
+
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+        self.slot = None
+        self.stats = {"posted": 0, "taken": 0, "superseded": 0}
+
+    def put(self, item):
+        with self.lock:
+            notify = self.slot is None
+            if not notify: self.stats["superseded"] += 1
+            self.slot = item
+            self.stats["posted"] += 1
+        if notify: self.ready.emit()
+
+    def take(self):
+        """ 取走最新的一份，没有新结果返回 None """
+        with self.lock:
+            item, self.slot = self.slot, None
+            if item is not None: self.stats["taken"] += 1
+        return item
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats)
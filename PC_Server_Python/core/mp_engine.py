@@ -0,0 +1,321 @@
+import threading
+import multiprocessing
+from collections import deque
+from multiprocessing import shared_memory
+import numpy as np
+from PyQt6.QtCore import QThread, pyqtSignal, Qt
+from core.mailbox import FrameMailbox
+from config import (THERMAL_W, THERMAL_H, VIS_W, VIS_H, PORT_VIDEO, PORT_THERMAL, RECV_POOL_SPARE,
+                    MP_OUT_SLOTS)
+
+# 多进程模式:
+#   接收进程 x2 --(共享内存槽位 + 管道里的 (slot, ts, fid))--> 引擎进程
+#   引擎进程    --(共享内存槽位 + 管道里的 (slot, seq, layout, info))--> UI 进程
+# 管道里只走几十字节的描述符，帧数据只在共享内存里写一次。共享内存全部由 UI 进程创建和释放。
+
+SLOT_HEAD = 64  # 每个槽位开头放 int64 序号，后面按 64 字节对齐放数组
+QUEUE_LEN = 4   # 引擎进程里 SyncEngine 输入 deque 的长度
+
+
+def _align(n):
+    return (n + 63) & ~63
+
+
+class ShmRing:
+    """
+    [共享内存环]: slots 个定长槽位，每个槽位可放若干数组
+    write() 按顺序轮转写入，返回 (slot, seq, layout)；layout 描述每个数组的 (offset, shape, dtype)，
+    读端据此直接在共享内存上建 ndarray 视图；写端不知道读端还持有哪些槽位，会照常轮转覆盖，
+    所以读端要长期持有的帧用 take() 拷出来，拷完再用 seq 核对这期间没被覆盖。
+    """
+
+    def __init__(self, slots, slot_bytes, name=None):
+        self.slots, self.slot_bytes = slots, slot_bytes
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=slots * slot_bytes)
+        self.idx = 0
+        self.seq_cnt = 0
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def spec(self):
+        """ 传给子进程用来 attach 的参数 """
+        return self.slots, self.slot_bytes, self.shm.name
+
+    def _seq_view(self, slot):
+        return np.ndarray((1,), dtype=np.int64, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+
+    def seq(self, slot):
+        return int(self._seq_view(slot)[0])
+
+    def write(self, arrays):
+        slot = self.idx
+        self.idx = (self.idx + 1) % self.slots
+        base, off, layout = slot * self.slot_bytes, SLOT_HEAD, []
+        for a in arrays:
+            a = np.ascontiguousarray(a)
+            if off + a.nbytes > self.slot_bytes: raise ValueError("frame larger than shm slot")
+            np.ndarray(a.shape, dtype=a.dtype, buffer=self.shm.buf, offset=base + off)[...] = a
+            layout.append((off, a.shape, a.dtype.str))
+            off = _align(off + a.nbytes)
+        # 数据写完再写序号，读端看到新序号时数据一定已经就位
+        self.seq_cnt += 1
+        self._seq_view(slot)[0] = self.seq_cnt
+        return slot, self.seq_cnt, layout
+
+    def read(self, slot, layout, readonly=True):
+        base = slot * self.slot_bytes
+        out = []
+        for off, shape, dt in layout:
+            a = np.ndarray(shape, dtype=np.dtype(dt), buffer=self.shm.buf, offset=base + off)
+            if readonly: a.flags.writeable = False
+            out.append(a)
+        return out
+
+    def take(self, slot, seq, layout):
+        """ 拷出一个槽位: 拷贝前后序号都是 seq 才算完整，否则返回 None (被写端追上覆盖了) """
+        if self.seq(slot) != seq: return None
+        out = [a.copy() for a in self.read(slot, layout, readonly=False)]
+        return out if self.seq(slot) == seq else None
+
+    def close(self):
+        # 先 unlink: UI 可能还持有视图，close 会因导出的缓冲报错
+        try:
+            if self.owner: self.shm.unlink()
+            self.shm.close()
+        except Exception:
+            pass
+
+
+class ShmQueue:
+    """ 接收进程里代替 deque 交给 DataReceiver: append 即写槽位 + 发描述符 (解码池多线程调用，要加锁) """
+
+    def __init__(self, ring, conn, maxlen=QUEUE_LEN):
+        self.ring, self.conn, self.maxlen = ring, conn, maxlen
+        self.lock = threading.Lock()
+
+    def append(self, item):
+        ts, fid, data = item
+        with self.lock:
+            slot, seq, layout = self.ring.write((data,))
+            self.conn.send(("frame", slot, seq, ts, fid, layout))
+
+    def log(self, msg):
+        with self.lock:
+            self.conn.send(("log", msg))
+
+
+def _receiver_main(port, mode, ring_spec, conn):
+    """ 接收进程: 直接在主线程里跑 DataReceiver.run() """
+    from core.data_link import DataReceiver
+    ring = ShmRing(*ring_spec[:2], name=ring_spec[2])
+    q = ShmQueue(ring, conn)
+    rx = DataReceiver(port, q, mode)
+    rx.log_signal.connect(q.log, Qt.ConnectionType.DirectConnection)
+    try:
+        rx.run()
+    finally:
+        ring.close()
+
+
+def _feed(conn, ring, q, out):
+    """
+    引擎进程: 描述符 -> 从共享内存拷出 -> SyncEngine 的输入 deque
+    SyncEngine 的时间戳环会持有帧很久，接收进程却一直在轮转写槽位，所以这里拷一份 (一帧一次)，
+    拷的过程中被覆盖的帧直接丢掉并计数。
+    """
+    while True:
+        try:
+            msg = conn.recv()
+        except (EOFError, OSError):
+            return
+        if msg[0] == "frame":
+            _, slot, seq, ts, fid, layout = msg
+            arrs = ring.take(slot, seq, layout)
+            if arrs is None:
+                out.dropped += 1
+                continue
+            q.append((ts, fid, arrs[0]))
+        else:
+            out.send(msg)
+
+
+class _Publisher:
+    """ 引擎进程: update_signal 直连到这里，结果写进输出环，描述符发回 UI """
+
+    def __init__(self, ring, conn):
+        self.ring, self.conn = ring, conn
+        self.lock = threading.Lock()
+        self.eng = None
+        self.dropped = 0  # 输入槽位在拷出前被覆盖的帧数
+
+    def send(self, msg):
+        with self.lock:
+            self.conn.send(msg)
+
+    def on_update(self, fus, therm, evt, roi, depth, info):
+        info["shm_dropped"] = self.dropped
+        slot, seq, layout = self.ring.write((fus, therm, evt, roi, depth, self.eng.cache_t_raw))
+        self.send(("frame", slot, seq, layout, info))
+
+
+def _engine_main(vis_spec, therm_spec, out_spec, conn_v, conn_t, out_conn, cmd_conn):
+    from core.sync_engine import SyncEngine
+    rings = [ShmRing(*s[:2], name=s[2]) for s in (vis_spec, therm_spec, out_spec)]
+    qv, qt = deque(maxlen=QUEUE_LEN), deque(maxlen=QUEUE_LEN)
+    pub = _Publisher(rings[2], out_conn)
+    eng = SyncEngine(qv, qt)
+    pub.eng = eng
+    eng.update_signal.connect(pub.on_update, Qt.ConnectionType.DirectConnection)
+    eng.log_signal.connect(lambda m: pub.send(("log", m)), Qt.ConnectionType.DirectConnection)
+    for c, r, q in ((conn_v, rings[0], qv), (conn_t, rings[1], qt)):
+        threading.Thread(target=_feed, args=(c, r, q, pub), daemon=True).start()
+    eng.start()
+
+    # 主线程处理 UI 发来的控制命令
+    try:
+        while True:
+            try:
+                cmd = cmd_conn.recv()
+            except (EOFError, OSError):
+                break
+            if cmd[0] == "stop": break
+            try:
+                if cmd[0] == "call":
+                    r = getattr(eng, cmd[1])(*cmd[2], **cmd[3])
+                    if cmd[4]: pub.send(("reply", r))
+                elif cmd[0] == "set":
+                    setattr(eng, cmd[1], cmd[2])
+            except Exception as e:
+                pub.send(("log", f"[MP] {cmd[1]}: {e}"))
+                if cmd[0] == "call" and cmd[4]: pub.send(("reply", None))
+    finally:
+        eng.stop()
+        for r in rings: r.close()
+
+
+class EngineProcess(QThread):
+    """
+    [多进程引擎]: UI 进程里的 SyncEngine 替身，信号和常用方法与 SyncEngine 一致
+    start() 拉起两个接收进程 + 一个引擎进程，本线程只收描述符，把输出槽位拷出来发给 UI。
+    接收和计算不再和 UI 抢 GIL，UI 卡顿也不会拖慢收包。
+    录制 / 自动标定依赖同进程对象，多进程模式下不可用。
+    """
+    update_signal = pyqtSignal(np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, dict)
+    log_signal = pyqtSignal(str)
+
+    def __init__(self, port_video=PORT_VIDEO, port_thermal=PORT_THERMAL, out_slots=MP_OUT_SLOTS):
+        super().__init__()
+        self.ports = (port_video, port_thermal)
+        self.running = True
+        self._recording = False
+        self.cache_t_raw = np.zeros((THERMAL_H, THERMAL_W), dtype=np.uint16)
+        self.stats = {"frames": 0, "superseded": 0, "stale": 0}
+        self.mailbox = FrameMailbox()  # 同 SyncEngine.mailbox，UI 从这里取
+        self.reply = None
+        self.reply_evt = threading.Event()
+
+        # 输入环: 引擎进程收到描述符就拷走，槽位只需盖住管道里排队 + 解码池在途的帧
+        self.ring_vis = ShmRing(QUEUE_LEN + RECV_POOL_SPARE, _align(VIS_W * VIS_H) + SLOT_HEAD)
+        self.ring_therm = ShmRing(QUEUE_LEN + RECV_POOL_SPARE, _align(THERMAL_W * THERMAL_H * 2) + SLOT_HEAD)
+        # 输出: 融合图 / 热成像伪彩 / 事件图 / ROI / Depth / 热成像原始值
+        out_bytes = SLOT_HEAD + 2 * _align(VIS_W * VIS_H * 3) + _align(THERMAL_W * THERMAL_H * 3) \
+            + 2 * _align(120 * 120 * 3) + _align(THERMAL_W * THERMAL_H * 2)
+        self.ring_out = ShmRing(out_slots, out_bytes)
+        self.procs = []
+        self.out_conn = self.cmd_conn = None
+
+    # ---- 与 SyncEngine 相同的控制接口，转发到引擎进程 ----
+    def _call(self, name, *args, reply=False, **kwargs):
+        if self.cmd_conn is None: return None
+        self.reply_evt.clear()
+        self.cmd_conn.send(("call", name, args, kwargs, reply))
+        if reply:
+            self.reply_evt.wait(2.0)
+            return self.reply
+
+    def set_mode(self, mode): self._call("set_mode", mode)
+
+    def update_align_params(self, **kw): self._call("update_align_params", **kw)
+
+    def set_thermal_style(self, palette=None, agc=None): self._call("set_thermal_style", palette, agc)
+
+    def set_align_mode(self, mode): self._call("set_align_mode", mode)
+
+    def get_profile(self): return self._call("get_profile", reply=True)
+
+    def set_policy(self, stream, name, **kw): self._call("set_policy", stream, name, **kw)
+
+    # 解码在接收进程里，那边的 DEMAND 没人登记，多进程模式始终全分辨率解码
+    def set_display_size(self, w, h): pass
+
+    @property
+    def recording(self):
+        return self._recording
+
+    @recording.setter
+    def recording(self, v):
+        self._recording = v
+        if self.cmd_conn is not None: self.cmd_conn.send(("set", "recording", v))
+
+    def start(self):
+        ctx = multiprocessing.get_context("spawn")
+        rv, wv = ctx.Pipe(duplex=False)
+        rt, wt = ctx.Pipe(duplex=False)
+        self.out_conn, out_w = ctx.Pipe(duplex=False)
+        cmd_r, self.cmd_conn = ctx.Pipe(duplex=False)
+        self.procs = [
+            ctx.Process(target=_receiver_main, args=(self.ports[0], "video", self.ring_vis.spec(), wv), daemon=True),
+            ctx.Process(target=_receiver_main, args=(self.ports[1], "thermal", self.ring_therm.spec(), wt), daemon=True),
+            ctx.Process(target=_engine_main, args=(self.ring_vis.spec(), self.ring_therm.spec(), self.ring_out.spec(),
+                                                   rv, rt, out_w, cmd_r), daemon=True),
+        ]
+        for p in self.procs: p.start()
+        super().start()
+
+    def run(self):
+        self.log_signal.emit("[MP] ENGINE PROCESS STARTED")
+        while self.running:
+            if not self.out_conn.poll(0.05): continue
+            # 一次把管道读空，只显示最新一帧，UI 落后时不排队
+            frame = None
+            try:
+                while self.out_conn.poll():
+                    msg = self.out_conn.recv()
+                    if msg[0] == "frame":
+                        if frame is not None: self.stats["superseded"] += 1
+                        frame = msg
+                    elif msg[0] == "log":
+                        self.log_signal.emit(msg[1])
+                    elif msg[0] == "reply":
+                        self.reply = msg[1]
+                        self.reply_evt.set()
+            except (EOFError, OSError):
+                break
+            if frame is None: continue
+            _, slot, seq, layout, info = frame
+            # 拷出槽位再交给 UI: 邮箱 / HUD / cache_t_raw 会持有这些数组，引擎进程随时可能轮转回来覆盖
+            arrs = self.ring_out.take(slot, seq, layout)
+            if arrs is None:
+                self.stats["stale"] += 1
+                continue
+            fus, therm, evt, roi, depth, t_raw = arrs
+            self.cache_t_raw = t_raw
+            self.stats["frames"] += 1
+            info["ui"] = self.mailbox.get_stats()
+            self.update_signal.emit(fus, therm, evt, roi, depth, info)
+            self.mailbox.put((fus, therm, evt, roi, depth, info))
+
+    def stop(self):
+        self.running = False
+        self.wait()
+        try:
+            if self.cmd_conn is not None: self.cmd_conn.send(("stop",))
+        except OSError:
+            pass
+        for p in self.procs:
+            p.join(timeout=3.0 if p is self.procs[-1] else 0)
+            if p.is_alive(): p.terminate()
+        for r in (self.ring_vis, self.ring_therm, self.ring_out): r.close()
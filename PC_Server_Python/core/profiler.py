@@ -0,0 +1,97 @@
+import json
+import time
+import threading
+from bisect import bisect_left
+
+# 桶上界 (us)，最后一个桶收所有更慢的样本
+BUCKET_US = (50, 100, 200, 500, 1000, 2000, 3000, 5000, 8000, 12000, 20000, 33000, 50000, 100000, 250000)
+
+
+class LatencyHistogram:
+    """ 定长分桶直方图: 记录只是一次二分 + 计数，不存样本，长时间运行内存不涨 """
+
+    def __init__(self, edges=BUCKET_US):
+        self.edges = edges
+        self.counts = [0] * (len(edges) + 1)
+        self.n = 0
+        self.sum_us = 0.0
+        self.max_us = 0.0
+        self.last_us = 0.0
+
+    def add(self, us):
+        self.counts[bisect_left(self.edges, us)] += 1
+        self.n += 1
+        self.sum_us += us
+        self.last_us = us
+        if us > self.max_us: self.max_us = us
+
+    def percentile(self, q):
+        """ 按桶估计分位数 (返回所在桶的上界，最后一桶用 max) """
+        if not self.n: return None
+        target = q / 100.0 * self.n
+        acc = 0
+        for i, c in enumerate(self.counts):
+            acc += c
+            if acc >= target:
+                return self.edges[i] if i < len(self.edges) else self.max_us
+        return self.max_us
+
+    def summary(self):
+        if not self.n: return {"count": 0}
+        return {"count": self.n, "mean_ms": self.sum_us / self.n / 1000.0, "last_ms": self.last_us / 1000.0,
+                "max_ms": self.max_us / 1000.0, "p50_ms": self.percentile(50) / 1000.0,
+                "p95_ms": self.percentile(95) / 1000.0, "p99_ms": self.percentile(99) / 1000.0}
+
+
+class StageProfiler:
+    """
+    [分段计时]: 给流水线每一段挂一个直方图
+    用法: t = prof.start(); ...; t = prof.lap("vignetting", t); ...; prof.lap("total", t0)
+    snapshot() / export() 可以在其他线程调用。
+    """
+
+    def __init__(self, stages=(), edges=BUCKET_US):
+        self.edges = edges
+        self.lock = threading.Lock()
+        self.hists = {name: LatencyHistogram(edges) for name in stages}
+        self.marks = {}  # window_ms 用: 上次调用时各段的 (n, sum)
+
+    @staticmethod
+    def start():
+        return time.perf_counter_ns()
+
+    def record(self, name, us):
+        with self.lock:
+            h = self.hists.get(name)
+            if h is None:
+                h = self.hists[name] = LatencyHistogram(self.edges)
+            h.add(us)
+
+    def lap(self, name, t):
+        """ 记录从 t 到现在的耗时，返回现在的时间戳，供下一段继续用 """
+        now = time.perf_counter_ns()
+        self.record(name, (now - t) / 1000.0)
+        return now
+
+    def reset(self):
+        with self.lock:
+            for name in self.hists: self.hists[name] = LatencyHistogram(self.edges)
+            self.marks = {}
+
+    def window_ms(self):
+        """ 距上次调用以来各段的平均耗时 (ms)，精简版，适合每秒塞进 info """
+        out = {}
+        with self.lock:
+            for k, h in self.hists.items():
+                n0, s0 = self.marks.get(k, (0, 0.0))
+                if h.n > n0: out[k] = round((h.sum_us - s0) / (h.n - n0) / 1000.0, 3)
+                self.marks[k] = (h.n, h.sum_us)
+        return out
+
+    def snapshot(self):
+        with self.lock:
+            return {k: dict(h.summary(), buckets=list(h.counts)) for k, h in self.hists.items()}
+
+    def export(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"bucket_us": list(self.edges), "stages": self.snapshot()}, f, indent=2)
@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import queue
+import numpy as np
+from PyQt6.QtCore import QThread, pyqtSignal
+from algorithms.event_sim import EVENT_DTYPE
+from core.data_link import PAYLOAD_TYPES
+from config import THERMAL_W, THERMAL_H, VIS_W, VIS_H, REC_DIR, REC_CHUNK_MB, REC_QUEUE
+
+# 会话目录结构:
+#   meta.json                 分辨率、码流类型等
+#   chunk_000000.bin ...      原始负载 (JPEG / uint16 / 热成像无损编码)，只追加，满 REC_CHUNK_MB 换下一个
+#   video.idx / thermal.idx   定长索引，每路一个文件，按时间戳递增，可直接 np.memmap + 二分
+#                             flags 存线上的负载类型 (PT_*，旧会话全是 0 = 按路默认)
+#   events.idx                EventEngine 输出的 DVS 事件 (EVENT_DTYPE 原始字节)，每帧一条
+STREAMS = {"video": 0, "thermal": 1, "events": 2}
+SENSOR_STREAMS = ("video", "thermal")  # Pi 线上的两路，回放只重放这两路
+INDEX_DTYPE = np.dtype([("ts", "<u8"), ("offset", "<u8"), ("fid", "<u4"), ("size", "<u4"),
+                        ("chunk", "<u2"), ("stream", "u1"), ("flags", "u1")])
+
+
+class SessionRecorder(QThread):
+    """
+    [会话录制]: 旁路抓取接收线程收到的原始负载，不解码
+    tap() 在接收线程里调用，只做一次拷贝 + 非阻塞入队，队列满了就丢帧计数，
+    绝不拖慢 socket；真正的写盘在本线程完成。
+    """
+    log_signal = pyqtSignal(str)
+
+    def __init__(self, root=REC_DIR, chunk_mb=REC_CHUNK_MB, max_queue=REC_QUEUE):
+        super().__init__()
+        self.path = os.path.join(root, time.strftime("session_%Y%m%d_%H%M%S"))
+        self.chunk_bytes = chunk_mb * 1024 * 1024
+        self.q = queue.Queue(maxsize=max_queue)
+        self.running = True
+        self.stats = {"written": 0, "dropped": 0, "bytes": 0}
+
+        self.chunk_id = -1
+        self.chunk_file = None
+        self.chunk_pos = 0
+        self.index_files = {}
+        self.rec = np.zeros(1, dtype=INDEX_DTYPE)
+
+    def tap(self, stream, ts, fid, payload, ptype=0):
+        """ 接收线程调用: 负载所在的槽位会被复用，这里必须先拷一份；压缩负载原样存，不解码 """
+        try:
+            self.q.put_nowait((STREAMS[stream], ts, fid, bytes(payload), ptype))
+        except queue.Full:
+            self.stats["dropped"] += 1
+
+    def _next_chunk(self):
+        if self.chunk_file: self.chunk_file.close()
+        self.chunk_id += 1
+        self.chunk_file = open(os.path.join(self.path, f"chunk_{self.chunk_id:06d}.bin"), "ab")
+        self.chunk_pos = self.chunk_file.tell()
+
+    def _write(self, sid, ts, fid, payload, ptype):
+        size = len(payload)
+        if self.chunk_file is None or (self.chunk_pos and self.chunk_pos + size > self.chunk_bytes):
+            self._next_chunk()
+        self.chunk_file.write(payload)
+
+        self.rec[0] = (ts, self.chunk_pos, fid, size, self.chunk_id, sid, ptype)
+        self.index_files[sid].write(self.rec.tobytes())
+
+        self.chunk_pos += size
+        self.stats["written"] += 1
+        self.stats["bytes"] += size
+
+    def run(self):
+        os.makedirs(self.path, exist_ok=True)
+        meta = {"version": 2, "streams": STREAMS, "payload_types": PAYLOAD_TYPES, "video": {"codec": "jpeg", "w": VIS_W, "h": VIS_H},
+                "thermal": {"codec": "raw_u16", "w": THERMAL_W, "h": THERMAL_H},
+                "events": {"codec": "dvs_events", "dtype": EVENT_DTYPE.descr},
+                "created": time.time()}
+        with open(os.path.join(self.path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+        for name, sid in STREAMS.items():
+            self.index_files[sid] = open(os.path.join(self.path, f"{name}.idx"), "ab")
+
+        self.log_signal.emit(f"[REC] START: {self.path}")
+        try:
+            # 停止后把队列里剩下的写完再退出
+            while self.running or not self.q.empty():
+                try:
+                    item = self.q.get(timeout=0.2)
+                except queue.Empty:
+                    continue
+                self._write(*item)
+        except Exception as e:
+            self.log_signal.emit(f"[REC] ERR: {e}")
+        finally:
+            if self.chunk_file: self.chunk_file.close()
+            for f in self.index_files.values(): f.close()
+            self.log_signal.emit(f"[REC] STOP: {self.stats['written']} frames, {self.stats['dropped']} dropped")
+
+    def stop(self):
+        self.running = False
+        self.wait()
+
+
+class SessionReader:
+    """
+    [会话读取]: 索引用 np.memmap 映射，按时间查找是二分 (searchsorted)，不扫描
+    注意: 同一会话内时间戳假定单调递增 (Pi 中途重启会破坏这一点)。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.index = {}
+        for name in STREAMS:
+            p = os.path.join(path, f"{name}.idx")
+            n = os.path.getsize(p) // INDEX_DTYPE.itemsize if os.path.exists(p) else 0
+            # 零长度文件不能 memmap；写到一半的尾记录丢弃
+            self.index[name] = np.memmap(p, dtype=INDEX_DTYPE, mode="r", shape=(n,)) if n else np.zeros(0, INDEX_DTYPE)
+        self.chunks = {}
+
+    def __len__(self):
+        return sum(len(i) for i in self.index.values())
+
+    def count(self, stream):
+        return len(self.index[stream])
+
+    def time_range(self, stream):
+        idx = self.index[stream]
+        return (int(idx["ts"][0]), int(idx["ts"][-1])) if len(idx) else (None, None)
+
+    def find(self, stream, ts):
+        """ 时间戳 >= ts 的第一帧的序号 """
+        return int(np.searchsorted(self.index[stream]["ts"], ts, side="left"))
+
+    def _chunk(self, cid):
+        mm = self.chunks.get(cid)
+        if mm is None:
+            mm = np.memmap(os.path.join(self.path, f"chunk_{cid:06d}.bin"), dtype=np.uint8, mode="r")
+            self.chunks[cid] = mm
+        return mm
+
+    def ptype(self, stream, i):
+        """ 第 i 帧的负载类型 (PT_*) """
+        return int(self.index[stream][i]["flags"])
+
+    def read(self, stream, i):
+        """ 返回 (ts, fid, payload)，payload 是 chunk 上的 uint8 视图 """
+        rec = self.index[stream][i]
+        o, n = int(rec["offset"]), int(rec["size"])
+        return int(rec["ts"]), int(rec["fid"]), self._chunk(int(rec["chunk"]))[o:o + n]
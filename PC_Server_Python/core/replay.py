@@ -0,0 +1,167 @@
+import os
+import time
+import numpy as np
+from PyQt6.QtCore import QThread, pyqtSignal
+from core.data_link import decode_jpeg, ThermalDecoder, PT_DEFAULT, DEMAND
+from core.decode_pool import DecodePool
+from core.frame_buffer import FrameRing
+from core.recorder import SessionReader, SENSOR_STREAMS
+from config import DECODE_WORKERS, DECODE_MAX_PENDING
+
+VIDEO_EXT = (".jpg", ".jpeg", ".png")
+THERMAL_EXT = (".raw", ".bin")
+
+
+class FrameDirSource:
+    """
+    [图片目录源]: *.jpg/*.png 当作 OV9281 帧，*.raw/*.bin 当作 Tiny1-C 原始帧
+    按文件名排序，时间戳按给定帧率生成。接口和 SessionReader 一致 (count / read)。
+    """
+
+    def __init__(self, path, fps_video=120.0, fps_thermal=25.0):
+        names = sorted(os.listdir(path))
+        self.files = {"video": [os.path.join(path, n) for n in names if n.lower().endswith(VIDEO_EXT)],
+                      "thermal": [os.path.join(path, n) for n in names if n.lower().endswith(THERMAL_EXT)]}
+        self.period = {"video": 1e6 / fps_video, "thermal": 1e6 / fps_thermal}
+
+    def count(self, stream):
+        return len(self.files[stream])
+
+    def timestamps(self, stream):
+        return (np.arange(self.count(stream)) * self.period[stream]).astype(np.int64)
+
+    def ptype(self, stream, i):
+        return PT_DEFAULT
+
+    def read(self, stream, i):
+        with open(self.files[stream][i], "rb") as f:
+            return int(i * self.period[stream]), i, f.read()
+
+
+class ReplaySource(QThread):
+    """
+    [回放源]: 代替 DataReceiver，把录制会话 (或图片目录) 按原协议的 (ts, fid, data) 灌进队列
+    一个线程同时驱动两路，按时间戳合并排序后依次发出，两路之间的相对时序和现场一致。
+    speed: 1.0 = 原始时间戳节奏；其它正数 = 按倍速；<= 0 = 不等待，尽可能快
+    lossless: 队列满时等待消费而不是让 deque 挤掉旧帧 (回归测试用)
+    """
+    log_signal = pyqtSignal(str)
+
+    def __init__(self, path, q_vis, q_therm, speed=1.0, loop=False, lossless=False,
+                 decode_workers=DECODE_WORKERS, demand=DEMAND):
+        super().__init__()
+        self.demand = demand
+        self.path = path
+        self.queues = {"video": q_vis, "thermal": q_therm}
+        self.speed = speed
+        self.loop = loop
+        self.lossless = lossless
+        self.running = True
+        self.seek_req = None
+
+        if os.path.exists(os.path.join(path, "meta.json")):
+            self.src = SessionReader(path)
+            ts_of = lambda s: np.asarray(self.src.index[s]["ts"], dtype=np.int64)
+        else:
+            self.src = FrameDirSource(path)
+            ts_of = self.src.timestamps
+
+        # 合并两路的时间轴: ts 升序，同一时刻保持各路内部顺序
+        names = list(SENSOR_STREAMS)
+        ts = [ts_of(s) for s in names]
+        self.ev_ts = np.concatenate(ts)
+        self.ev_stream = np.concatenate([np.full(len(t), i, np.uint8) for i, t in enumerate(ts)])
+        self.ev_idx = np.concatenate([np.arange(len(t)) for t in ts])
+        order = np.argsort(self.ev_ts, kind="stable")
+        self.ev_ts, self.ev_stream, self.ev_idx = self.ev_ts[order], self.ev_stream[order], self.ev_idx[order]
+        self.names = names
+
+        self.decoder = DecodePool(q_vis, self.decode_video, decode_workers, DECODE_MAX_PENDING) if decode_workers > 0 else None
+        # 热成像可能是 delta16 录的: 跳转 / 循环后 frame_id 不连续，等到下一个关键帧才出图
+        self.thermal = ThermalDecoder()
+        self.stats = {"sent": 0, "loops": 0, "rejected": 0, "dropped": 0}
+
+    def __len__(self):
+        return len(self.ev_ts)
+
+    def time_range(self):
+        return (int(self.ev_ts[0]), int(self.ev_ts[-1])) if len(self.ev_ts) else (None, None)
+
+    def seek(self, ts):
+        """ 跳到 ts (us，会话时间轴) 之后的第一帧，线程安全 """
+        self.seek_req = int(np.searchsorted(self.ev_ts, ts, side="left"))
+
+    def decode_video(self, payload):
+        return decode_jpeg(payload, self.demand.scale)
+
+    def _wait_room(self, q, decoder=None):
+        """ 无损回放: 等队列有空位；走解码池时在途帧稍后也会进队列，一并算上，且在途数不能超过池的上限 """
+        while self.running:
+            pending = decoder.pending() if decoder else 0
+            if decoder and pending >= decoder.max_pending:
+                self.usleep(200)
+            # FrameRing 正在写的槽位不可读，只能存 maxlen - 1 帧
+            elif q.maxlen and len(q) + pending >= q.maxlen - isinstance(q, FrameRing):
+                self.usleep(200)
+            else:
+                return
+
+    def run(self):
+        n = len(self.ev_ts)
+        if n == 0:
+            self.log_signal.emit(f"[REPLAY] EMPTY: {self.path}")
+            return
+        self.log_signal.emit(f"[REPLAY] {self.path}: {n} frames, speed={self.speed}")
+
+        span = int(self.ev_ts[-1] - self.ev_ts[0]) + 1
+        pos, offset = 0, 0  # offset: 循环播放时把时间戳整体后移，保证下游看到的 ts 单调
+        anchor = None  # (墙钟, 会话时间戳)，重新定位后重置
+
+        while self.running:
+            if self.seek_req is not None:
+                pos, self.seek_req, anchor = self.seek_req, None, None
+            if pos >= n:
+                if not self.loop: break
+                pos, offset, anchor = 0, offset + span, None
+                self.stats["loops"] += 1
+
+            ts = int(self.ev_ts[pos]) + offset
+            if self.speed > 0:
+                now = time.perf_counter()
+                if anchor is None: anchor = (now, ts)
+                delay = anchor[0] + (ts - anchor[1]) / 1e6 / self.speed - now
+                if delay > 0: time.sleep(delay)
+
+            stream = self.names[self.ev_stream[pos]]
+            i = int(self.ev_idx[pos])
+            _, fid, payload = self.src.read(stream, i)
+            pos += 1
+
+            q = self.queues[stream]
+            if stream == "video" and self.decoder:
+                if self.lossless: self._wait_room(q, self.decoder)
+                # 在途帧已满时解码池会丢掉新帧 (非无损模式)，没收下的不算 sent
+                if not self.decoder.submit(ts, fid, payload):
+                    self.stats["dropped"] += 1
+                    continue
+            else:
+                if self.lossless: self._wait_room(q)
+                if stream == "video":
+                    data = self.decode_video(payload)
+                else:
+                    data = self.thermal.decode(payload, self.src.ptype(stream, i), fid)
+                if data is None:
+                    self.stats["rejected"] += 1
+                    continue
+                q.append((ts, fid, data))
+            self.stats["sent"] += 1
+
+        # 放完了: 等解码池里的在途帧都进队列再收尾 (stop() 会取消没解完的)
+        while self.running and self.decoder and self.decoder.pending():
+            self.usleep(200)
+        self.log_signal.emit(f"[REPLAY] DONE: {self.stats['sent']} frames")
+
+    def stop(self):
+        self.running = False
+        self.wait()
+        if self.decoder: self.decoder.shutdown()
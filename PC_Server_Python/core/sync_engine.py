@@ -6,34 +6,89 @@ from PyQt6.QtCore import QThread, pyqtSignal
 from algorithms.vignetting import VignettingCorrector
 from algorithms.event_sim import PseudoEventGen
 from algorithms.alignment import ImageAligner
-from config import THERMAL_W, THERMAL_H, VIS_W, VIS_H
+from algorithms.thermal import ThermalRenderer
+from core.frame_buffer import TimedRing, FrameRing
+from core.profiler import StageProfiler
+from core.align_refine import AlignRefiner
+from core.drop_policy import make_policy
+from core.event_engine import EventEngine
+from core.data_link import DEMAND
+from core.mailbox import FrameMailbox
+from config import (THERMAL_W, THERMAL_H, VIS_W, VIS_H, SYNC_TOLERANCE_MS, SYNC_RING_VIS, SYNC_RING_THERMAL,
+                    THERMAL_PALETTE, THERMAL_AGC, THERMAL_AGC_CLIP, ALIGN_REFINE, DISPLAY_POLICY, EVENT_THREAD)
+
+
+# run() 里依次计时的各段
+STAGES = ("dequeue", "vignetting", "events", "thermal", "warp", "blend", "emit", "total")
 
 
 class SyncEngine(QThread):
     # (Fusion, Therm, Event, ROI, Depth, Info)
+    # 只给直连 (DirectConnection) 的消费者用；UI 从 mailbox 取，跨线程不要 queued 连这个信号
     update_signal = pyqtSignal(np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, dict)
     log_signal = pyqtSignal(str)
 
-    def __init__(self, q_vis, q_therm):
+    def __init__(self, q_vis, q_therm, sync_tolerance_ms=SYNC_TOLERANCE_MS, demand=DEMAND):
         super().__init__()
         self.q_vis, self.q_therm = q_vis, q_therm
+        # 按时间戳索引的缓冲，用于最近邻配对；输入本身是 FrameRing 时直接在上面查，不再搬运
+        self.ring_vis = q_vis if isinstance(q_vis, FrameRing) else TimedRing(SYNC_RING_VIS)
+        self.ring_therm = q_therm if isinstance(q_therm, FrameRing) else TimedRing(SYNC_RING_THERMAL)
+        self.sync_tolerance_ms = sync_tolerance_ms
+        # 各路消费者的取帧策略 (各自带游标，互不影响)；显示默认只取最新
+        self.policies = {"display": make_policy(DISPLAY_POLICY)}
+        self.drop_stats = {}
+        self.cache_t_ts = None
+        self.cache_t_key = None  # 当前配对热成像帧的 (ts, fid)
         self.running = True
         self.mode = "LOCKED"
         self.checker_mode = False
+        self.recording = False
+        self.calibrator = None  # AutoCalibrator，挂上后定时抽取配好对的帧
+        # 主画面在屏幕上的像素尺寸 (UI 告知)，据此向 demand 登记可见光需要的分辨率
+        self.demand = demand
+        self.display_size = None
+        # 给 UI 的最新结果，只保留一份
+        self.mailbox = FrameMailbox()
+        self.ui_stats = {}
 
+        # 缓冲仅做计算用，不用于回溯显示
+        self.event_buffer = deque(maxlen=20)
         try:
-            self.algo_vign = VignettingCorrector()
+            # 校正结果写在轮转的预分配缓冲里，event_buffer 会持有这些帧
+            self.algo_vign = VignettingCorrector(out_slots=self.event_buffer.maxlen + 2)
             self.algo_align = ImageAligner()
             self.algo_evt = PseudoEventGen(width=VIS_W, height=VIS_H, threshold=20)
         except:
             pass
+        # 事件路: 输入是 FrameRing 时另开线程逐帧处理，显示路只取它的最新结果；
+        # deque 输入 (回放 / 压测 / 多进程) 时 TimedRing 只有本线程能读，仍在这里按显示帧处理
+        self.evt_engine = None
+        if EVENT_THREAD and isinstance(q_vis, FrameRing):
+            self.evt_engine = EventEngine(q_vis)
+            self.evt_engine.log_signal.connect(self.log_signal)
+        self.e_zero = None
 
-        self.cache_t_raw = np.zeros((THERMAL_H, THERMAL_W), dtype=np.uint16)
-        # 缓冲仅做计算用，不用于回溯显示
-        self.event_buffer = deque(maxlen=20)
+        # 锁定后在后台跟踪两路之间的机械漂移
+        self.refiner = None
+        if ALIGN_REFINE:
+            self.refiner = AlignRefiner(self.algo_align)
+            self.refiner.log_signal.connect(self.log_signal)
+
+        # 配对到的热成像拷进自己的缓冲再留着用: 接收端的槽位之后会被 recv_into 覆盖。
+        # 两块轮换，UI 拿到的上一帧在本线程写下一帧时不被改动
+        self.t_bufs = [np.zeros((THERMAL_H, THERMAL_W), dtype=np.uint16) for _ in range(2)]
+        self.cache_t_raw = self.t_bufs[0]
+        # 伪彩查找表 + AGC；同一帧热成像只渲染一次 (可见光帧率远高于热成像)
+        self.algo_therm = ThermalRenderer(THERMAL_PALETTE, THERMAL_AGC, THERMAL_AGC_CLIP)
+        self.t_color = None
+        self.t_color_src = None
         self.fps_cnt = 0;
         self.curr_fps = 0.0;
         self.fps_timer = time.time()
+        # 分段计时，info["stage_ms"] 每秒刷新一次
+        self.prof = StageProfiler(STAGES)
+        self.stage_ms = {}
 
     def set_mode(self, mode):
         self.mode = mode
@@ -53,13 +108,52 @@ class SyncEngine(QThread):
         except:
             pass
 
-    def rotate_image(self, image, angle):
-        h, w = image.shape[:2]
-        M = cv2.getRotationMatrix2D((w // 2, h // 2), angle, 1.0)
-        return cv2.warpAffine(image, M, (w, h))
+    def set_align_mode(self, mode):
+        """ affine: 手动参数；homography: 标定文件 (畸变 + 单应)，映射表按矩阵哈希缓存 """
+        self.algo_align.set_mode(mode)
+        self.log_signal.emit(f">>> ALIGN: {mode}" + ("" if self.algo_align.calib or mode == "affine" else " (no calibration, affine)"))
+
+    def set_display_size(self, w, h):
+        """ UI 线程调用: 主画面控件的物理像素尺寸，下一次每秒刷新时更新解码分辨率需求 """
+        self.display_size = (int(w), int(h))
+
+    def _update_demand(self, ov, vis_shape):
+        """
+        显示需要的可见光尺寸 (全分辨率坐标): ADJUST 显示整幅画面，就是控件尺寸；
+        LOCKED 只显示热成像覆盖的区域并放大到控件，按区域占整幅的比例放大需求
+        """
+        if self.display_size is None: return
+        w, h = self.display_size
+        if self.mode == "LOCKED" and ov is not None:
+            vh, vw = vis_shape[:2]
+            crop_w = (ov[2] - ov[0]) * VIS_W / vw
+            crop_h = (ov[3] - ov[1]) * VIS_H / vh
+            w = int(np.ceil(w * VIS_W / max(crop_w, 1.0)))
+            h = int(np.ceil(h * VIS_H / max(crop_h, 1.0)))
+        self.demand.require("display", w, h)
+
+    def set_policy(self, stream, name, **kw):
+        """ 运行中切换某一路的丢帧策略，游标沿用，不会回头重放已处理的帧 """
+        old = self.policies.get(stream)
+        p = make_policy(name, **kw)
+        if old is not None: p.seq = old.seq
+        self.policies[stream] = p
+        self.log_signal.emit(f">>> POLICY: {stream} = {p.describe()}")
+
+    def get_drop_stats(self):
+        return {k: p.get_stats() for k, p in self.policies.items()}
+
+    def set_thermal_style(self, palette=None, agc=None):
+        """ 切换伪彩色板 / AGC 模式，下一帧生效 """
+        if palette: self.algo_therm.set_palette(palette)
+        if agc: self.algo_therm.set_agc(agc)
+        self.t_color = None
+        self.log_signal.emit(f">>> THERMAL: {self.algo_therm.palette_name} / {self.algo_therm.agc}")
 
     def run(self):
         self.log_signal.emit("[CORE] ENGINE STARTED")
+        if self.refiner: self.refiner.start()
+        if self.evt_engine: self.evt_engine.start()
 
         # === 视觉优化：给黑窗口加上文字，方便区分 ===
         # 1. ROI 占位图 (带紫色边框和文字)
@@ -76,76 +170,92 @@ class SyncEngine(QThread):
 
         while self.running:
             try:
-                # 1. 获取可见光
-                if len(self.q_vis) == 0:
+                # 1. 获取可见光 (按显示策略取帧，默认永远取最新一帧)
+                # 计时从搬运 / 取帧开始，dequeue 段 = drain + 取帧 + 配对；没取到帧的空转不记
+                t0 = t = self.prof.start()
+                if self.ring_vis is not self.q_vis: self.ring_vis.drain(self.q_vis)
+                if self.ring_therm is not self.q_therm: self.ring_therm.drain(self.q_therm)
+                item = self.policies["display"].take(self.ring_vis)
+                if item is None:
                     self.msleep(1)
                     continue
+                v_ts, v_fid, v_raw = item
 
-                # 强制最新，防止跳帧
-                while len(self.q_vis) > 1: self.q_vis.popleft()
-                v_ts, _, v_raw = self.q_vis.popleft()
+                # 2. 获取热成像: 按 |Δt| 最小配对，超出容差则沿用上一次配对的帧
+                tol_us = None if self.sync_tolerance_ms is None else self.sync_tolerance_ms * 1000
+                pair = self.ring_therm.nearest(v_ts, tol_us)
+                if pair is not None and (pair[0], pair[1]) != self.cache_t_key:
+                    self.cache_t_ts, t_fid, t_raw = pair
+                    self.cache_t_key = (self.cache_t_ts, t_fid)
+                    buf = self.t_bufs[1] if self.cache_t_raw is self.t_bufs[0] else self.t_bufs[0]
+                    np.copyto(buf, t_raw)
+                    self.cache_t_raw = buf
+                sync_ok = pair is not None
+                cal = self.calibrator
+                if cal is not None and sync_ok: cal.offer(v_ts, v_raw, self.cache_t_raw)
+                # 实际融合用的两帧之间的时间差 (热成像 - 可见光)
+                sync_err_ms = None if self.cache_t_ts is None else (int(self.cache_t_ts) - int(v_ts)) / 1000.0
+                t = self.prof.lap("dequeue", t)
 
                 v_corr = self.algo_vign.process(v_raw)
-                e_mask = self.algo_evt.process(v_corr)
+                # ADJUST 模式下是手动对齐，不和用户抢
+                if self.refiner and sync_ok and self.mode == "LOCKED": self.refiner.offer(v_corr, self.cache_t_raw)
+                t = self.prof.lap("vignetting", t)
+
+                if self.evt_engine:
+                    last = self.evt_engine.last
+                    e_mask = last[2] if last is not None else np.zeros(v_corr.shape, dtype=np.uint8)
+                else:
+                    e_mask = self.algo_evt.process(v_corr)
+                    # 存入缓冲
+                    self.event_buffer.append((e_mask, v_ts, v_corr))
+                # 掩码只有 0/255，直接当绿色通道
+                if self.e_zero is None or self.e_zero.shape != e_mask.shape:
+                    self.e_zero = np.zeros_like(e_mask)
+                e_disp = cv2.merge((self.e_zero, e_mask, self.e_zero))
+                t = self.prof.lap("events", t)
 
-                # 存入缓冲
-                self.event_buffer.append((e_mask, v_ts, v_corr))
+                # 按 (ts, fid) 判断是不是同一帧: FrameRing 每次取帧都返回新的视图对象，不能比身份
+                if self.t_color is None or self.t_color_src != self.cache_t_key:
+                    self.t_color = self.algo_therm.render(self.cache_t_raw)
+                    self.t_color_src = self.cache_t_key
+                t_color = self.t_color
+                t = self.prof.lap("thermal", t)
+
+                # 3. 融合: 一次 remap 把 256x192 热成像直接映射到可见光目标区域 (映射表按对齐参数缓存)
+                # 可见光可能是缩小解码的，映射表按实际尺寸取 (对齐参数仍是全分辨率坐标)
+                ov = self.algo_align.get_overlay(v_corr.shape[1], v_corr.shape[0])
+                t_crop = None
+                if ov is not None:
+                    x1, y1, x2, y2, map1, map2, hole = ov
+                    t_crop = cv2.remap(t_color, map1, map2, cv2.INTER_LINEAR)
+                t = self.prof.lap("warp", t)
 
                 # 直接使用最新帧做背景，确保丝滑
                 v_bg = cv2.cvtColor(v_corr, cv2.COLOR_GRAY2BGR)
-                e_disp = np.zeros_like(v_bg)
-                e_disp[e_mask > 0] = [0, 255, 0]
-
-                # 2. 获取热成像
-                if len(self.q_therm) > 0:
-                    while len(self.q_therm) > 1: self.q_therm.pop()
-                    t_ts, _, t_raw = self.q_therm.pop()
-                    self.cache_t_raw = t_raw
-
-                raw_f = self.cache_t_raw.astype(np.float32)
-                temp_c = raw_f / 64.0 - 273.15
-                t_min, t_max = np.min(temp_c), np.max(temp_c)
-                if t_max - t_min < 2.0: t_max = t_min + 5.0
-                t_norm = ((temp_c - t_min) / (t_max - t_min) * 255).astype(np.uint8)
-                t_color = cv2.applyColorMap(t_norm, cv2.COLORMAP_JET)
-
-                # 3. 融合
-                tx, ty, tw, th, angle, _ = self.algo_align.get_transform_params()
-                t_scaled = cv2.resize(t_color, (tw, th))
-                t_rotated = self.rotate_image(t_scaled, angle)
-
-                x1 = max(0, tx);
-                y1 = max(0, ty)
-                x2 = min(VIS_W, tx + tw);
-                y2 = min(VIS_H, ty + th)
-                vw = x2 - x1;
-                vh = y2 - y1
-
-                final_fusion = v_bg.copy()
-
-                if vw > 0 and vh > 0:
+                final_fusion = v_bg
+
+                if t_crop is not None:
                     v_crop = v_bg[y1:y2, x1:x2]
-                    ox = x1 - tx;
-                    oy = y1 - ty
-
-                    if oy + vh <= t_rotated.shape[0] and ox + vw <= t_rotated.shape[1]:
-                        t_crop = t_rotated[oy:oy + vh, ox:ox + vw]
-
-                        if self.checker_mode:
-                            mask = ((np.indices((vh, vw))[0] // 32 + np.indices((vh, vw))[1] // 32) % 2 == 0)
-                            mask = np.dstack([mask] * 3)
-                            blend = np.where(mask, v_crop, t_crop)
-                            final_fusion[y1:y2, x1:x2] = blend
-                        else:
-                            blend = cv2.addWeighted(v_crop, 0.6, t_crop, 0.7, 0)
-                            final_fusion[y1:y2, x1:x2] = blend
-
-                        # 只有在 ADJUST 模式才画框
-                        if self.mode != "LOCKED":
-                            cv2.rectangle(final_fusion, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                        else:
-                            # LOCKED 模式自动裁切特写
-                            final_fusion = blend
+                    vh, vw = v_crop.shape[:2]
+
+                    if self.checker_mode:
+                        mask = ((np.indices((vh, vw))[0] // 32 + np.indices((vh, vw))[1] // 32) % 2 == 0)
+                        mask = np.dstack([mask] * 3)
+                        blend = np.where(mask, v_crop, t_crop)
+                    else:
+                        blend = cv2.addWeighted(v_crop, 0.6, t_crop, 0.7, 0)
+                    # 旋转后外接框的四角没有热成像，保留可见光
+                    if hole is not None: cv2.copyTo(v_crop, hole, blend)
+
+                    # 只有在 ADJUST 模式才画框
+                    if self.mode != "LOCKED":
+                        final_fusion[y1:y2, x1:x2] = blend
+                        cv2.rectangle(final_fusion, (x1, y1), (x2, y2), (0, 255, 0), 2)
+                    else:
+                        # LOCKED 模式自动裁切特写
+                        final_fusion = blend
+                t = self.prof.lap("blend", t)
 
                 # 4. 发送
                 self.fps_cnt += 1
@@ -153,15 +263,37 @@ class SyncEngine(QThread):
                     self.curr_fps = self.fps_cnt;
                     self.fps_cnt = 0;
                     self.fps_timer = time.time()
+                    self.stage_ms = self.prof.window_ms()
+                    self.drop_stats = self.get_drop_stats()
+                    self._update_demand(ov, v_corr.shape)
+                    self.ui_stats = self.mailbox.get_stats()
 
-                info = {"fps": self.curr_fps, "mode": self.mode}
+                info = {"fps": self.curr_fps, "mode": self.mode, "v_ts": v_ts, "v_fid": v_fid,
+                        "sync_err_ms": sync_err_ms, "sync_ok": sync_ok,
+                        "rec": "REC" if self.recording else "", "stage_ms": self.stage_ms,
+                        "drop": self.drop_stats, "decode_scale": self.demand.scale, "ui": self.ui_stats,
+                        "t_range": self.algo_therm.window_c()}
                 # 发送带文字的 black_roi 和 black_depth
                 self.update_signal.emit(final_fusion, t_color, e_disp, black_roi, black_depth, info)
+                self.mailbox.put((final_fusion, t_color, e_disp, black_roi, black_depth, info))
+                self.prof.lap("emit", t)
+                self.prof.lap("total", t0)
 
             except Exception as e:
                 print(f"Sync: {e}");
                 self.msleep(10)
 
+    def get_profile(self):
+        """ 各段耗时直方图快照 (可在 UI 线程调用) """
+        return self.prof.snapshot()
+
+    def export_profile(self, path):
+        self.prof.export(path)
+
     def stop(self):
         self.running = False;
-        self.wait()
\ No newline at end of file
+        self.wait()
+        self.demand.release("display")
+        if self.refiner: self.refiner.stop()
+        self.algo_align.flush()
+        if self.evt_engine: self.evt_engine.stop()
\ No newline at end of file
@@ -1,10 +1,18 @@
 # main.py
 import sys
+import argparse
 from PyQt6.QtWidgets import QApplication
 from ui.main_window import MainWindow
+from config import MP_MODE
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    window = MainWindow()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--replay", help="录制会话目录或图片目录，代替 Pi 实时数据")
+    parser.add_argument("--speed", type=float, default=1.0, help="回放倍速，<=0 为尽可能快")
+    parser.add_argument("--mp", action="store_true", help="多进程模式: 接收和 SyncEngine 放到子进程")
+    args, qt_args = parser.parse_known_args()
+
+    app = QApplication(sys.argv[:1] + qt_args)
+    window = MainWindow(args.replay, args.speed, multiprocess=args.mp or MP_MODE)
     window.show()
     sys.exit(app.exec())
\ No newline at end of file
@@ -0,0 +1,198 @@
+# =========================================================================
+# 文件名: pi_emulator.py
+# 描述: 树莓派端模拟器 - 按 Edge_Pi_CPP/main.cpp 的协议向 PC 推流
+#       PacketHeader = uint64 timestamp_us + uint32 data_size + uint32 frame_id
+#       默认发 v2 包头 (魔数 + CRC，见 core/data_link.py)，--proto 1 发旧格式
+# =========================================================================
+
+import os
+import sys
+import time
+import socket
+import argparse
+import threading
+import numpy as np
+import cv2
+from config import PORT_VIDEO, PORT_THERMAL, THERMAL_W, THERMAL_H, VIS_W, VIS_H
+from core.data_link import (HEADER, pack_header, encode_thermal, decode_thermal, ThermalDecoder,
+                            PT_DEFAULT, PT_PNG16, PT_ZLIB16, PT_DELTA16)
+from core.ingest_server import HELLO, HELLO_MAGIC
+
+
+def now_us():
+    # 与 Pi 端 gettimeofday 一致: 墙钟微秒
+    return time.time_ns() // 1000
+
+
+def synth_video(n, w, h, quality=80):
+    """ 预生成 n 帧 JPEG: 渐变背景 + 移动方块，保证有事件、有纹理 """
+    x = np.linspace(0, 255, w, dtype=np.float32)
+    base = np.tile(x, (h, 1)).astype(np.uint8)
+    frames = []
+    for i in range(n):
+        img = base.copy()
+        cx = int((i / n) * (w - 100))
+        cv2.rectangle(img, (cx, h // 3), (cx + 100, h // 3 + 100), 255, -1)
+        cv2.putText(img, f"{i:04d}", (20, h - 40), cv2.FONT_HERSHEY_SIMPLEX, 2, 0, 3)
+        frames.append(cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes())
+    return frames
+
+
+def synth_thermal(n, w=THERMAL_W, h=THERMAL_H):
+    """ 预生成 n 帧原始 uint16: 室温背景 + 移动热点 (raw = (C + 273.15) * 64) """
+    yy, xx = np.mgrid[0:h, 0:w]
+    frames = []
+    for i in range(n):
+        cx, cy = (i / n) * w, h / 2
+        temp = 22.0 + 15.0 * np.exp(-((xx - cx) ** 2 + (yy - cy) ** 2) / 200.0)
+        frames.append(((temp + 273.15) * 64).astype(np.uint16).tobytes())
+    return frames
+
+
+def recorded_frames(path, stream):
+    """ 录制会话里的一路负载；热成像统一还原成 raw，发送时再按 --thermal-codec 编码 """
+    from core.recorder import SessionReader
+    rd = SessionReader(path)
+    if stream != "thermal": return [bytes(rd.read(stream, i)[2]) for i in range(rd.count(stream))]
+    dec, frames = ThermalDecoder(), []
+    for i in range(rd.count(stream)):
+        _, fid, payload = rd.read(stream, i)
+        data = dec.decode(payload, rd.ptype(stream, i), fid)
+        if data is not None: frames.append(data.tobytes())
+    return frames
+
+
+THERMAL_CODECS = {"raw": PT_DEFAULT, "png16": PT_PNG16, "zlib16": PT_ZLIB16, "delta16": PT_DELTA16}
+
+
+def thermal_encoder(frames, codec, key_every=25):
+    """ 预编码热成像帧，返回 fid -> (ptype, payload)
+    delta16: 每 key_every 帧发一个 zlib16 关键帧，其余是与上一帧 (循环意义上) 的差分 """
+    ptype = THERMAL_CODECS[codec]
+    raw = [decode_thermal(f) for f in frames]
+    if ptype != PT_DELTA16:
+        enc = [encode_thermal(f, ptype) for f in raw]
+        return lambda fid: (ptype, enc[fid % len(enc)])
+    key = [encode_thermal(f, PT_ZLIB16) for f in raw]
+    delta = [encode_thermal(f, PT_DELTA16, raw[i - 1]) for i, f in enumerate(raw)]
+
+    def encode(fid):
+        i = fid % len(raw)
+        return (PT_ZLIB16, key[i]) if fid % key_every == 0 else (PT_DELTA16, delta[i])
+    return encode
+
+
+class StreamSender(threading.Thread):
+    """ 一路推流: 断线重连 (同 try_connect)，按固定帧率发送 """
+
+    def __init__(self, host, port, frames, fps, duration=None, name="video", device=None, proto=2, glitch=0.0,
+                 encoder=None):
+        super().__init__(daemon=True)
+        self.host, self.port = host, port
+        self.proto = proto
+        self.glitch = glitch  # 每包以这个概率在包前插一段随机字节，模拟线缆毛刺
+        self.device = device  # 连接后先发 hello 包自报设备名 (selectors 接收端按名字区分设备)
+        self.frames, self.fps, self.duration = frames, fps, duration
+        # fid -> (负载类型, 负载)，默认按原样循环发送 frames
+        self.encoder = encoder or (lambda fid: (PT_DEFAULT, frames[fid % len(frames)]))
+        self.name = name
+        self.running = True
+        self.sent = 0
+        self.bytes = 0
+        self.glitches = 0
+
+    def run(self):
+        period = 1.0 / self.fps
+        sock = None
+        fid = 0
+        t_end = time.perf_counter() + self.duration if self.duration else None
+        next_t = time.perf_counter()
+        while self.running and (t_end is None or time.perf_counter() < t_end):
+            if sock is None:
+                try:
+                    sock = socket.create_connection((self.host, self.port), timeout=2)
+                    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                    if self.device: sock.sendall(HELLO.pack(HELLO_MAGIC, self.device.encode()))
+                    print(f"[{self.name}] Connected to {self.host}:{self.port}")
+                except OSError:
+                    time.sleep(1)
+                    continue
+                next_t = time.perf_counter()
+                fresh = True  # 连接后的第一个包头决定协议版本，不能插垃圾
+
+            ptype, payload = self.encoder(fid)
+            if self.proto == 2:
+                head = pack_header(now_us(), len(payload), fid, ptype)
+            else:
+                head = HEADER.pack(now_us(), len(payload), fid)
+            if self.glitch and not fresh and np.random.random() < self.glitch:
+                head = os.urandom(np.random.randint(1, 64)) + head
+                self.glitches += 1
+            try:
+                sock.sendall(head + payload)
+                fresh = False
+            except OSError:
+                print(f"[{self.name}] Disconnected. Retrying...")
+                sock.close()
+                sock = None
+                continue
+            fid += 1
+            self.sent += 1
+            self.bytes += len(payload)
+
+            # 固定节拍发送，落后了不补发 (和 Pi 端只发最新帧一致)
+            next_t += period
+            delay = next_t - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_t = time.perf_counter()
+        if sock: sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Raspberry Pi stream emulator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port-video", type=int, default=PORT_VIDEO)
+    parser.add_argument("--port-thermal", type=int, default=PORT_THERMAL)
+    parser.add_argument("--fps-video", type=float, default=120.0)
+    parser.add_argument("--fps-thermal", type=float, default=25.0)
+    parser.add_argument("--width", type=int, default=VIS_W)
+    parser.add_argument("--height", type=int, default=VIS_H)
+    parser.add_argument("--quality", type=int, default=80, help="合成 JPEG 的质量")
+    parser.add_argument("--source", help="录制会话目录，不给则用合成帧")
+    parser.add_argument("--duration", type=float, default=None, help="秒，不给则一直发")
+    parser.add_argument("--device", help="设备名 (最多 12 字节)，连接后先发 hello 包")
+    parser.add_argument("--proto", type=int, choices=(1, 2), default=2, help="包头版本")
+    parser.add_argument("--glitch", type=float, default=0.0, help="每包插入随机垃圾字节的概率 (测试重新同步)")
+    parser.add_argument("--thermal-codec", choices=tuple(THERMAL_CODECS), default="raw", help="热成像负载编码 (需 v2)")
+    parser.add_argument("--key-every", type=int, default=25, help="delta16 的关键帧间隔")
+    args = parser.parse_args()
+    if args.proto == 1 and args.thermal_codec != "raw": parser.error("v1 包头没有负载类型，只能发 raw")
+
+    if args.source:
+        v_frames, t_frames = recorded_frames(args.source, "video"), recorded_frames(args.source, "thermal")
+    else:
+        v_frames, t_frames = synth_video(60, args.width, args.height, args.quality), synth_thermal(50)
+
+    senders = []
+    if v_frames and args.fps_video > 0:
+        senders.append(StreamSender(args.host, args.port_video, v_frames, args.fps_video, args.duration, "Video",
+                                    args.device, args.proto, args.glitch))
+    if t_frames and args.fps_thermal > 0:
+        encoder = thermal_encoder(t_frames, args.thermal_codec, args.key_every)
+        senders.append(StreamSender(args.host, args.port_thermal, t_frames, args.fps_thermal, args.duration, "Thermal",
+                                    args.device, args.proto, args.glitch, encoder))
+    for s in senders: s.start()
+    try:
+        while any(s.is_alive() for s in senders): time.sleep(0.2)
+    except KeyboardInterrupt:
+        for s in senders: s.running = False
+    for s in senders:
+        s.join()
+        print(f"[{s.name}] sent {s.sent} frames, {s.bytes / 1e6:.1f} MB, {s.glitches} glitches")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
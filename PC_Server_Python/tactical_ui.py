@@ -6,7 +6,6 @@
 
 import sys
 import time
-from collections import deque
 import numpy as np
 import cv2
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
@@ -16,7 +15,10 @@ from PyQt6.QtCore import Qt, pyqtSlot
 from PyQt6.QtGui import QImage, QPixmap, QFont, QPainter, QColor, QPen, QIcon
 
 # 导入刚才写的后端
-from comms_engine import DataReceiver, SyncEngine, PORT_VIDEO, PORT_THERMAL
+from comms_engine import DataReceiver, SyncEngine, PORT_VIDEO, PORT_THERMAL, THERMAL_W, THERMAL_H
+from core.frame_buffer import FrameRing
+from core.async_ingest import AsyncIngest
+from config import VIS_W, VIS_H, INGEST_BACKEND
 
 # --- 战术翻译字典 ---
 TRANSLATIONS = {
@@ -165,8 +167,9 @@ class TacticalTerminal(QMainWindow):
     def __init__(self):
         super().__init__()
         self.lang = "CN"  # 默认中文
-        self.q_video = deque(maxlen=100)
-        self.q_thermal = deque(maxlen=100)
+        # 预分配帧环 (可见光一帧 1MB，不再留 100 帧)；SyncEngine 用 popleft 按序取
+        self.q_video = FrameRing(8, (VIS_H, VIS_W), np.uint8)
+        self.q_thermal = FrameRing(16, (THERMAL_H, THERMAL_W), np.uint16)
         self.current_fusion = "EDGE"  # 当前融合模式
 
         self.init_ui()
@@ -260,12 +263,14 @@ class TacticalTerminal(QMainWindow):
         self.lbl_stat.style().polish(self.lbl_stat)
 
         # 启动后端线程
-        self.th_v = DataReceiver(PORT_VIDEO, self.q_video, "video")
-        self.th_t = DataReceiver(PORT_THERMAL, self.q_thermal, "thermal")
-        self.th_v.log_signal.connect(self.log)
-        self.th_t.log_signal.connect(self.log)
-        self.th_v.start()
-        self.th_t.start()
+        if INGEST_BACKEND == "asyncio":
+            self.receivers = [AsyncIngest({"video": self.q_video, "thermal": self.q_thermal})]
+        else:
+            self.receivers = [DataReceiver(PORT_VIDEO, self.q_video, "video"),
+                              DataReceiver(PORT_THERMAL, self.q_thermal, "thermal")]
+        for th in self.receivers:
+            th.log_signal.connect(self.log)
+            th.start()
 
         # 启动引擎
         self.engine = SyncEngine(self.q_video, self.q_thermal)
@@ -310,8 +315,7 @@ class TacticalTerminal(QMainWindow):
         self.lbl_sync.setText(f"{diff * 1000:.1f} ms")
 
     def closeEvent(self, event):
-        if hasattr(self, 'th_v'): self.th_v.stop()
-        if hasattr(self, 'th_t'): self.th_t.stop()
+        for th in getattr(self, 'receivers', []): th.stop()
         if hasattr(self, 'engine'): self.engine.stop()
         event.accept()
 
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 模块都按 PC_Server_Python 为根导入 (from core.xxx / from config)，同 main.py 的运行方式
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
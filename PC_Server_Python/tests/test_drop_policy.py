@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+from core.frame_buffer import FrameRing, TimedRing
+from core.drop_policy import LatestOnly, BoundedFifo, TimeWindow, EveryNth, make_policy
+
+
+def make_ring(kind, cap=16):
+    return TimedRing(cap) if kind == "timed" else FrameRing(cap, (2, 2))
+
+
+def push(ring, seqs, dt_us=10_000):
+    for i in seqs:
+        data = np.full((2, 2), i % 256, np.uint8)
+        if isinstance(ring, TimedRing): ring.append(i * dt_us, i, data)
+        else: ring.append((i * dt_us, i, data))
+
+
+def drain(policy, ring):
+    out = []
+    while True:
+        item = policy.take(ring)
+        if item is None: return out
+        out.append(item[1])
+
+
+@pytest.fixture(params=["timed", "frame"])
+def ring(request):
+    return make_ring(request.param)
+
+
+def test_latest(ring):
+    p = LatestOnly()
+    push(ring, range(5))
+    assert drain(p, ring) == [4]
+    assert p.stats == {"processed": 1, "dropped": 4, "stale": 0}
+
+
+def test_fifo_bounded(ring):
+    p = BoundedFifo(depth=3)
+    push(ring, range(6))
+    assert drain(p, ring) == [3, 4, 5]
+    assert p.stats["dropped"] == 3
+    push(ring, range(6, 8))
+    assert drain(p, ring) == [6, 7]
+
+
+def test_window_expires_old_frames(ring):
+    p = TimeWindow(window_ms=25)
+    push(ring, range(6))  # 10ms 一帧，最新 50ms
+    assert drain(p, ring) == [3, 4, 5]
+    assert p.stats["stale"] == 3
+
+
+def test_nth(ring):
+    p = EveryNth(n=3)
+    push(ring, range(4))
+    assert drain(p, ring) == [0, 3]
+    push(ring, range(4, 10))
+    assert drain(p, ring) == [6, 9]
+    assert p.stats["processed"] == 4 and p.stats["dropped"] == 6
+
+
+def test_wrap_counts_stale(ring):
+    # 消费者落后超过环容量: 被覆盖的帧记 stale，从最旧的可读帧继续
+    p = BoundedFifo(depth=100)
+    push(ring, [0])
+    assert drain(p, ring) == [0]
+    push(ring, range(1, 41))
+    lo, hi = ring.seq_range()
+    assert drain(p, ring) == list(range(lo, hi))
+    assert p.stats["stale"] == lo - 1
+
+
+def test_policies_are_independent():
+    ring = make_ring("frame")
+    disp, evt = make_policy("latest"), make_policy("fifo", depth=8)
+    push(ring, range(4))
+    assert drain(disp, ring) == [3]
+    assert drain(evt, ring) == [0, 1, 2, 3]
+    push(ring, range(4, 6))
+    assert drain(evt, ring) == [4, 5]
+    assert drain(disp, ring) == [5]
+    assert disp.stats["dropped"] == 4 and evt.stats["dropped"] == 0
@@ -0,0 +1,103 @@
+import gc
+import numpy as np
+import pytest
+from core.frame_buffer import FrameRing
+from core.drop_policy import LatestOnly
+
+
+def frame(v, shape=(2, 3)):
+    return np.full(shape, v, np.uint8)
+
+
+def push(ring, seqs):
+    for i in seqs:
+        ring.append((i * 10, i, frame(i)))
+
+
+def test_wrap_keeps_capacity_minus_one():
+    r = FrameRing(4, (2, 3))
+    push(r, range(10))
+    # 正在 claim 的槽位不可读
+    assert r.seq_range() == (7, 10)
+    assert [r.next()[1] for _ in range(3)] == [7, 8, 9]
+    assert r.next() is None
+    assert r.stats["written"] == 10
+
+
+def test_claim_commit_zero_copy():
+    r = FrameRing(3, (2, 3))
+    slot = r.claim()
+    slot[...] = 5
+    r.commit(100, 1)
+    ts, fid, data = r.latest()
+    assert (ts, fid) == (100, 1) and data.base is r.buf and (data == 5).all()
+
+
+def test_latest_counts_skipped_and_overwritten():
+    r = FrameRing(4, (2, 3))
+    push(r, range(2))
+    assert r.latest()[1] == 1
+    push(r, range(2, 9))
+    assert r.latest()[1] == 8
+    # 读到 1 以后写了 2..8: 2..4 的槽位已被 6..8 覆盖，5 所在的是下一个写入位 (不可读)；
+    # 跳过的是第一次取最新时的 0 和这次的 6、7
+    assert r.stats["overwritten"] == 3
+    assert r.stats["skipped"] == 3
+
+
+def test_overwritten_follows_slowest_reader():
+    r = FrameRing(4, (2, 3))
+    p = LatestOnly()
+    for i in range(20):
+        r.append((i, i, frame(i)))
+        if i % 2: p.take(r)
+    assert r.stats["overwritten"] == 0 and len(r) == 0
+    push(r, range(20, 30))
+    assert r.stats["overwritten"] == 6
+    assert p.take(r)[1] == 29
+
+
+def test_reader_unregistered_when_collected():
+    r = FrameRing(4, (2, 3))
+    push(r, range(3))
+    p = LatestOnly()
+    p.take(r)
+    assert len(r.readers) == 1
+    del p
+    gc.collect()
+    assert r.readers == {}
+
+
+def test_nearest_marks_earlier_frames_read():
+    r = FrameRing(8, (2, 3))
+    push(r, range(5))
+    assert r.nearest(22)[1] == 2
+    assert r.stats["skipped"] == 2
+    assert r.next()[1] == 3
+    assert r.nearest(1000, tolerance=5) is None
+
+
+def test_timestamp_regression_drops_old_frames():
+    r = FrameRing(8, (2, 3))
+    push(r, range(5))
+    r.append((3, 99, frame(0)))
+    assert r.seq_range() == (5, 6)
+    assert r.latest()[1] == 99
+
+
+def test_smaller_frames_stored_compactly():
+    r = FrameRing(3, (4, 6))
+    r.append((1, 1, frame(7, (2, 3))))
+    assert r.latest()[2].shape == (2, 3)
+    r.append((2, 2, frame(1, (5, 6))))
+    assert r.stats["rejected"] == 1
+    r.append((3, 3, frame(2, (4, 6))))
+    assert r.latest()[2].shape == (4, 6)
+
+
+def test_popleft_like_deque():
+    r = FrameRing(3, (2, 3))
+    with pytest.raises(IndexError):
+        r.popleft()
+    push(r, [1])
+    assert r.popleft()[1] == 1
@@ -0,0 +1,46 @@
+import threading
+from core.mailbox import FrameMailbox
+
+
+def test_supersede_keeps_latest():
+    mb = FrameMailbox()
+    for i in range(5):
+        mb.put(i)
+    assert mb.take() == 4
+    assert mb.take() is None
+    assert mb.get_stats() == {"posted": 5, "taken": 1, "superseded": 4}
+
+
+def test_ready_only_when_slot_was_empty():
+    mb = FrameMailbox()
+    fired = []
+    mb.ready.connect(lambda: fired.append(1))
+    mb.put("a")
+    mb.put("b")
+    assert len(fired) == 1
+    assert mb.take() == "b"
+    mb.put("c")
+    assert len(fired) == 2
+
+
+def test_concurrent_put_take_accounts_every_item():
+    mb = FrameMailbox()
+    got = []
+    done = threading.Event()
+
+    def producer():
+        for i in range(20000):
+            mb.put(i)
+        done.set()
+
+    t = threading.Thread(target=producer)
+    t.start()
+    while not done.is_set():
+        item = mb.take()
+        if item is not None: got.append(item)
+    t.join()
+    item = mb.take()
+    if item is not None: got.append(item)
+    s = mb.get_stats()
+    assert got == sorted(got) and got[-1] == 19999
+    assert s["taken"] == len(got) and s["taken"] + s["superseded"] == s["posted"] == 20000
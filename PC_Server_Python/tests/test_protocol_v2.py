@@ -0,0 +1,64 @@
+import socket
+import pytest
+from core.data_link import (HEADER, HEADER_V2, MAGIC, PT_JPEG, PT_DELTA16, pack_header, parse_header,
+                            resync_offset, DataReceiver)
+
+
+def test_header_round_trip():
+    h = pack_header(123456789, 1000, 42, PT_DELTA16)
+    assert len(h) == HEADER_V2.size and h[:4] == MAGIC
+    assert parse_header(h) == (123456789, 1000, 42, PT_DELTA16)
+
+
+@pytest.mark.parametrize("pos", [0, 5, 12, 16, 20, 25])
+def test_crc_rejects_any_corrupted_byte(pos):
+    h = bytearray(pack_header(1, 2, 3, PT_JPEG))
+    h[pos] ^= 0x40
+    assert parse_header(h) is None
+
+
+def test_size_limit():
+    h = pack_header(1, 5000, 3)
+    assert parse_header(h, max_size=4999) is None
+    assert parse_header(h, max_size=5000) is not None
+
+
+def test_resync_offset():
+    n = HEADER_V2.size
+    h = pack_header(1, 2, 3)
+    assert resync_offset(b"xyz" + h[:n - 3]) == 3
+    # 末尾只剩魔数前缀: 保留前缀，之前的丢掉
+    assert resync_offset(b"\0" * (n - 2) + MAGIC[:2]) == n - 2
+    assert resync_offset(b"\0" * n) == n
+
+
+def receiver_with(data):
+    a, b = socket.socketpair()
+    a.sendall(data)
+    a.close()
+    return DataReceiver(0, None, "video", decode_workers=0), b
+
+
+def test_recv_header_resyncs_after_garbage():
+    good = [pack_header(10 + i, 0, i) for i in range(3)]
+    bad = bytearray(good[1])
+    bad[-1] ^= 0xFF  # CRC 坏掉
+    rx, sock = receiver_with(good[0] + b"junk" + MAGIC + bytes(bad) + good[2])
+    try:
+        assert rx.recv_header(sock) == (10, 0, 0, 0)
+        assert rx.recv_header(sock) == (12, 0, 2, 0)
+        assert rx.recv_header(sock) is None
+        assert rx.proto == 2 and rx.stats["resync"] == 1
+        assert rx.stats["skipped_bytes"] == 4 + len(MAGIC) + len(bad)
+    finally:
+        sock.close()
+
+
+def test_recv_header_v1_detected():
+    rx, sock = receiver_with(HEADER.pack(7, 0, 1) + HEADER.pack(8, 0, 2))
+    try:
+        assert rx.recv_header(sock) == (7, 0, 1, 0)
+        assert rx.recv_header(sock) == (8, 0, 2, 0)
+        assert rx.proto == 1
+    finally:
+        sock.close()
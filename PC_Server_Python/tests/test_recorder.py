@@ -0,0 +1,54 @@
+import numpy as np
+from core.recorder import SessionRecorder, SessionReader
+from core.data_link import PT_JPEG, PT_ZLIB16
+
+
+def record(tmp_path, frames, chunk_mb=64):
+    rec = SessionRecorder(root=str(tmp_path), chunk_mb=chunk_mb)
+    for stream, ts, fid, payload, ptype in frames:
+        rec.tap(stream, ts, fid, payload, ptype)
+    # 不起线程: 停止标志先置上，run() 把队列写完就返回
+    rec.running = False
+    rec.run()
+    return rec
+
+
+def test_round_trip(tmp_path):
+    rng = np.random.default_rng(0)
+    frames = []
+    for i in range(5):
+        frames.append(("video", 1000 + i * 10, i, rng.bytes(100 + i), PT_JPEG))
+        frames.append(("thermal", 1005 + i * 40, 7 + i, rng.bytes(64), PT_ZLIB16))
+    rec = record(tmp_path, frames)
+    assert rec.stats["written"] == 10 and rec.stats["dropped"] == 0
+
+    rd = SessionReader(rec.path)
+    assert rd.count("video") == 5 and rd.count("thermal") == 5 and rd.count("events") == 0
+    for stream in ("video", "thermal"):
+        want = [f for f in frames if f[0] == stream]
+        for i, (_, ts, fid, payload, ptype) in enumerate(want):
+            got = rd.read(stream, i)
+            assert got[:2] == (ts, fid)
+            assert bytes(got[2]) == payload
+            assert rd.ptype(stream, i) == ptype
+    assert rd.time_range("video") == (1000, 1040)
+    assert rd.find("video", 1015) == 2
+
+
+def test_chunk_rollover(tmp_path):
+    frames = [("video", i, i, bytes([i]) * 400, PT_JPEG) for i in range(10)]
+    rec = record(tmp_path, frames, chunk_mb=1000 / (1024 * 1024))
+    rd = SessionReader(rec.path)
+    assert len({int(c) for c in rd.index["video"]["chunk"]}) > 1
+    for i in range(10):
+        assert bytes(rd.read("video", i)[2]) == bytes([i]) * 400
+
+
+def test_tap_copies_payload(tmp_path):
+    buf = bytearray(b"abcd")
+    rec = SessionRecorder(root=str(tmp_path))
+    rec.tap("video", 1, 1, memoryview(buf))
+    buf[:] = b"zzzz"  # 接收端复用槽位
+    rec.running = False
+    rec.run()
+    assert bytes(SessionReader(rec.path).read("video", 0)[2]) == b"abcd"
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+from config import THERMAL_W, THERMAL_H
+from core.data_link import (PT_DEFAULT, PT_RAW16, PT_PNG16, PT_ZLIB16, PT_DELTA16, ThermalDecoder,
+                            encode_thermal)
+
+
+def thermal(seed, lo=18000, hi=22000):
+    rng = np.random.default_rng(seed)
+    return rng.integers(lo, hi, (THERMAL_H, THERMAL_W), dtype=np.uint16)
+
+
+@pytest.mark.parametrize("ptype", [PT_DEFAULT, PT_RAW16, PT_PNG16, PT_ZLIB16])
+def test_keyframe_round_trip(ptype):
+    f = thermal(0)
+    out = ThermalDecoder().decode(encode_thermal(f, ptype), ptype, 1)
+    assert out.dtype == np.uint16 and np.array_equal(out, f)
+
+
+def test_delta_chain():
+    dec = ThermalDecoder()
+    frames = [thermal(0)]
+    for i in range(1, 5):
+        frames.append((frames[-1].astype(np.int32) + np.random.default_rng(i).integers(-40, 40, frames[0].shape))
+                      .astype(np.uint16))
+    assert np.array_equal(dec.decode(encode_thermal(frames[0], PT_ZLIB16), PT_ZLIB16, 100), frames[0])
+    for i in range(1, 5):
+        payload = encode_thermal(frames[i], PT_DELTA16, frames[i - 1])
+        assert np.array_equal(dec.decode(payload, PT_DELTA16, 100 + i), frames[i])
+    assert dec.stats["key_wait"] == 0
+
+
+def test_delta_wraps_at_0_and_65535():
+    # 差分按 uint16 回绕: 0 -> 65535 是 -1，65535 -> 0 是 +1，都要原样还原
+    a = np.zeros((THERMAL_H, THERMAL_W), np.uint16)
+    a[0, :] = 65535
+    b = a.copy()
+    b[0, :] = 0
+    b[1, :] = 65535
+    b[2, :] = 32768
+    dec = ThermalDecoder()
+    dec.decode(encode_thermal(a, PT_RAW16), PT_RAW16, 0)
+    out = dec.decode(encode_thermal(b, PT_DELTA16, a), PT_DELTA16, 1)
+    assert np.array_equal(out, b)
+
+
+def test_delta_waits_for_key_after_gap():
+    f0, f1, f2 = thermal(0), thermal(1), thermal(2)
+    dec = ThermalDecoder()
+    dec.decode(encode_thermal(f0, PT_RAW16), PT_RAW16, 10)
+    # fid 11 丢了，12 的参考帧不对
+    assert dec.decode(encode_thermal(f2, PT_DELTA16, f1), PT_DELTA16, 12) is None
+    assert dec.stats["key_wait"] == 1
+    # 拒收之后参考帧作废，连续的 delta 也要等关键帧
+    assert dec.decode(encode_thermal(f0, PT_DELTA16, f2), PT_DELTA16, 13) is None
+    assert dec.stats["key_wait"] == 2
+    assert np.array_equal(dec.decode(encode_thermal(f1, PT_ZLIB16), PT_ZLIB16, 14), f1)
+    assert np.array_equal(dec.decode(encode_thermal(f2, PT_DELTA16, f1), PT_DELTA16, 15), f2)
+
+
+def test_delta_fid_wraps_at_32_bits():
+    f0, f1 = thermal(0), thermal(1)
+    dec = ThermalDecoder()
+    dec.decode(encode_thermal(f0, PT_RAW16), PT_RAW16, 0xFFFFFFFF)
+    assert np.array_equal(dec.decode(encode_thermal(f1, PT_DELTA16, f0), PT_DELTA16, 0), f1)
+
+
+def test_corrupt_payload_rejected():
+    dec = ThermalDecoder()
+    assert dec.decode(b"not zlib", PT_ZLIB16, 1) is None
+    assert dec.decode(b"\0" * 10, PT_RAW16, 2) is None
+    assert dec.ref_fid is None
@@ -0,0 +1,44 @@
+from core.frame_buffer import TimedRing
+
+
+def fill(ring, ts_list):
+    for i, ts in enumerate(ts_list):
+        ring.append(ts, i, f"f{i}")
+
+
+def test_wrap_keeps_newest():
+    r = TimedRing(4)
+    fill(r, [10, 20, 30, 40, 50, 60])
+    assert len(r) == 4 and r.count == 6
+    assert [r.get(i)[0] for i in range(4)] == [30, 40, 50, 60]
+    assert r.seq_range() == (2, 6)
+    assert r.item(2)[0] == 30 and r.ts_of(5) == 60
+    assert r.latest()[0] == 60
+
+
+def test_nearest_and_bracket():
+    r = TimedRing(8)
+    fill(r, [100, 200, 300])
+    assert r.nearest(240)[0] == 200
+    assert r.nearest(260)[0] == 300
+    assert r.nearest(1000)[0] == 300
+    assert r.nearest(1000, tolerance=50) is None
+    assert r.bracket(50) == (None, r.get(0))
+    before, after = r.bracket(300)
+    assert before[0] == 200 and after[0] == 300
+
+
+def test_timestamp_regression_clears():
+    r = TimedRing(4)
+    fill(r, [100, 200, 300])
+    r.append(5, 9, "restart")
+    assert len(r) == 1 and r.latest()[0] == 5
+    # 序号继续累加，旧序号不再可读
+    assert r.seq_range() == (3, 4)
+
+
+def test_drain_from_deque():
+    from collections import deque
+    q = deque([(1, 0, "a"), (2, 1, "b")])
+    r = TimedRing(4)
+    assert r.drain(q) == 2 and not q and len(r) == 2
@@ -1,13 +1,23 @@
 import numpy as np
 import cv2
 import os
+import time
 from PyQt6.QtWidgets import (QMainWindow, QWidget, QHBoxLayout, QVBoxLayout, QPushButton,
                              QFrame, QGridLayout, QLabel, QTextEdit, QSizePolicy, QSlider, QMessageBox)
-from PyQt6.QtCore import Qt, pyqtSlot, QRect, pyqtSignal
-from PyQt6.QtGui import QPainter, QColor, QPen, QImage, QPixmap, QFont, QIcon
+from PyQt6.QtCore import Qt, pyqtSlot, QRect, pyqtSignal, QTimer, QEvent
+from PyQt6.QtGui import QPainter, QColor, QPen, QImage, QPicture, QFont, QIcon
 from core.data_link import DataReceiver
+from core.ingest_server import IngestServer
+from core.async_ingest import AsyncIngest
 from core.sync_engine import SyncEngine
-from config import PORT_VIDEO, PORT_THERMAL
+from core.recorder import SessionRecorder
+from core.replay import ReplaySource
+from core.auto_calib import AutoCalibrator
+from core.mp_engine import EngineProcess
+from core.frame_buffer import FrameRing
+from core.drop_policy import POLICIES
+from config import (PORT_VIDEO, PORT_THERMAL, MP_MODE, VIS_W, VIS_H, THERMAL_W, THERMAL_H,
+                    SYNC_RING_VIS, SYNC_RING_THERMAL, DISPLAY_POLICY, INGEST_BACKEND, UI_DISPLAY_FPS)
 
 TRANS = {
     "EN": {
@@ -15,7 +25,8 @@ TRANS = {
         "btn_start": "SYSTEM START", "btn_stop": "SYSTEM HALT",
         "mode_locked": "MODE: LOCKED", "mode_adjust": "MODE: ADJUST",
         "check": "CHECKER PATTERN", "rot": "ROTATION", "scale": "SCALE", "fine": "FINE",
-        "lang": "LANG: EN", "gen_4d": "GENERATE 4D MODEL",
+        "lang": "LANG: EN", "gen_4d": "GENERATE 4D MODEL", "rec": "REC", "rec_stop": "STOP REC",
+        "calib": "AUTO CALIB", "calib_stop": "STOP CALIB", "policy": "DROP",
         "hud_main": "FUSION OPTIC", "hud_sub1": "THERMAL SENSOR", "hud_sub2": "EVENT TRACKER",
         "hud_roi": "TARGET ROI", "hud_depth": "ROUGH 4D DEPTH"
     },
@@ -24,7 +35,8 @@ TRANS = {
         "btn_start": "系统启动", "btn_stop": "系统终止",
         "mode_locked": "模式: 锁定", "mode_adjust": "模式: 校准",
         "check": "棋盘对比", "rot": "旋转修正", "scale": "缩放调整", "fine": "精细微调",
-        "lang": "语言: 中文", "gen_4d": "后台生成4D模型",
+        "lang": "语言: 中文", "gen_4d": "后台生成4D模型", "rec": "录制", "rec_stop": "停止录制",
+        "calib": "自动标定", "calib_stop": "停止标定", "policy": "丢帧策略",
         "hud_main": "融合主视野", "hud_sub1": "热成像传感器", "hud_sub2": "事件流传感器",
         "hud_roi": "目标特写", "hud_depth": "实时4D预览"
     }
@@ -37,6 +49,12 @@ QSlider::handle:horizontal { background: #00ff00; border: 1px solid #00ff00; wid
 
 
 class HUDDisplay(QLabel):
+    """
+    [HUD 画面]: 帧在 OpenCV 里一次缩放到控件尺寸 (写进复用的缓冲)，BGRA 直接包成 QImage (Format_RGB32)，
+    不做 BGR->RGB、不转 QPixmap；四角框和名字录在缓存的图层里，图像区域或名字变了才重录。
+    控件不可见、或收到的还是上一帧同一个数组 (热成像没更新、ROI/Depth 占位图) 时直接跳过；
+    不可见时跳过的最后一帧留着，重新显示 (showEvent / 窗口从最小化恢复) 时补画。
+    """
     clicked = pyqtSignal(str)
     dragged = pyqtSignal(int, int)
 
@@ -57,33 +75,102 @@ class HUDDisplay(QLabel):
         self.last_mouse_pos_for_paint = None
         self.drag_start_pos = None
         self.content_type = "NONE"
+        self.src = None  # 最近一次收到的帧 (改尺寸时重新缩放用)
+        self.hidden_src = None  # 不可见时收到的最后一帧 (img, content_type)，重新显示时补画
+        self.src_bgra = None  # 原尺寸 BGRA 缓冲
+        self.bgra = None  # 缩放到控件尺寸的 BGRA 缓冲，QImage 直接包在它上面；尺寸不变就一直复用
+        self.q_img = None
+        self.layer = None  # (key, QPicture) 静态装饰图层
+        self.stats = {"rendered": 0, "same": 0, "hidden": 0}
         self.setMouseTracking(True)
         self.setAttribute(Qt.WidgetAttribute.WA_OpaquePaintEvent)
         self.setCursor(Qt.CursorShape.CrossCursor)
 
     def set_display_name(self, name):
-        self.display_name = name; self.update()
+        self.display_name = name; self.layer = None; self.update()
 
     def update_frame(self, cv_img, content_type, info=None, raw_t=None):
         try:
-            self.content_type = content_type
             if info: self.info = info
             if raw_t is not None: self.raw_thermal = raw_t
             if cv_img is None or cv_img.shape[0] < 10: return
-            if not cv_img.flags['C_CONTIGUOUS']: cv_img = np.ascontiguousarray(cv_img)
-            h, w = cv_img.shape[:2]
-            if len(cv_img.shape) == 2:
-                fmt = QImage.Format.Format_Grayscale8; bpl = w
-            else:
-                fmt = QImage.Format.Format_RGB888; cv_img = cv2.cvtColor(cv_img, cv2.COLOR_BGR2RGB); bpl = \
-                cv_img.strides[0]
-            q_img = QImage(cv_img.data, w, h, bpl, fmt)
-            self.setPixmap(QPixmap.fromImage(q_img).scaled(self.size(), Qt.AspectRatioMode.KeepAspectRatio,
-                                                           Qt.TransformationMode.FastTransformation))
-            self.update()
+            if not self.isVisible() or self.window().isMinimized():
+                self.stats["hidden"] += 1
+                self.hidden_src = (cv_img, content_type)
+                return
+            self.hidden_src = None
+            if cv_img is self.src and content_type == self.content_type:
+                self.stats["same"] += 1
+                return
+            self.content_type = content_type
+            self.src = cv_img
+            self._render()
         except:
             pass
 
+    def show_hidden(self):
+        """ 补画不可见期间跳过的最后一帧 (之后没有新帧时画面才不会停在隐藏前) """
+        if self.hidden_src is None or not self.isVisible() or self.window().isMinimized(): return
+        (self.src, self.content_type), self.hidden_src = self.hidden_src, None
+        self._render()
+
+    def showEvent(self, e):
+        super().showEvent(e)
+        # 窗口状态可能还没更新完，回到事件循环再画
+        QTimer.singleShot(0, self.show_hidden)
+
+    def _render(self):
+        """ src -> BGRA -> 按比例缩放到控件尺寸 (最近邻，同旧的 FastTransformation)，全程写复用的缓冲 """
+        img = self.src
+        h, w = img.shape[:2]
+        f = min(self.width() / w, self.height() / h)
+        tw, th = max(1, int(w * f)), max(1, int(h * f))
+        # 先补成 4 通道再缩放: 4 字节像素的最近邻缩放比 3 字节快得多
+        if self.src_bgra is None or self.src_bgra.shape[:2] != (h, w):
+            self.src_bgra = np.empty((h, w, 4), dtype=np.uint8)
+        cv2.cvtColor(img, cv2.COLOR_GRAY2BGRA if img.ndim == 2 else cv2.COLOR_BGR2BGRA, dst=self.src_bgra)
+        if self.bgra is None or self.bgra.shape[:2] != (th, tw):
+            self.bgra = np.empty((th, tw, 4), dtype=np.uint8)
+            # 小端序下 Format_RGB32 的字节顺序就是 B G R X，与 OpenCV 一致，绘制时不再逐像素转换
+            self.q_img = QImage(self.bgra.data, tw, th, self.bgra.strides[0], QImage.Format.Format_RGB32)
+        cv2.resize(self.src_bgra, (tw, th), dst=self.bgra, interpolation=cv2.INTER_NEAREST)
+        self.stats["rendered"] += 1
+        self.update()
+
+    def resizeEvent(self, e):
+        super().resizeEvent(e)
+        self.layer = None
+        if self.src is not None and self.isVisible(): self._render()
+
+    def _static_layer(self, r):
+        """
+        四角框 + 名字，按 (图像区域, 名字) 录成 QPicture 缓存，每帧只回放
+        (整窗透明 QPixmap 图层每次都要整幅混合，实测比回放这几笔还慢)
+        """
+        key = (r.x(), r.y(), r.width(), r.height(), self.display_name)
+        if self.layer is not None and self.layer[0] == key: return self.layer[1]
+        pic = QPicture()
+        p = QPainter(pic)
+        pen = QPen(self.color);
+        pen.setWidth(2);
+        p.setPen(pen)
+        l = 15
+        p.drawLine(r.left(), r.top(), r.left() + l, r.top());
+        p.drawLine(r.left(), r.top(), r.left(), r.top() + l)
+        p.drawLine(r.right(), r.top(), r.right() - l, r.top());
+        p.drawLine(r.right(), r.top(), r.right(), r.top() + l)
+        p.drawLine(r.right(), r.bottom(), r.right() - l, r.bottom());
+        p.drawLine(r.right(), r.bottom(), r.right(), r.bottom() - l)
+        p.drawLine(r.left(), r.bottom(), r.left() + l, r.bottom());
+        p.drawLine(r.left(), r.bottom(), r.left(), r.bottom() - l)
+
+        p.setPen(QColor(255, 255, 255));
+        p.setFont(QFont("Consolas", 9, QFont.Weight.Bold))
+        p.drawText(r.left() + 5, r.top() + 15, self.display_name)
+        p.end()
+        self.layer = (key, pic)
+        return pic
+
     def mousePressEvent(self, e):
         if e.button() == Qt.MouseButton.LeftButton:
             self.clicked.emit(self.name_key)
@@ -101,32 +188,17 @@ class HUDDisplay(QLabel):
     def paintEvent(self, event):
         p = QPainter(self);
         p.fillRect(self.rect(), QColor(0, 0, 0))
-        if self.pixmap() and not self.pixmap().isNull() and self.pixmap().width() > 10:
-            pix = self.pixmap()
-            x = (self.width() - pix.width()) // 2;
-            y = (self.height() - pix.height()) // 2
-            p.drawPixmap(x, y, pix)
-
-            pen = QPen(self.color);
-            pen.setWidth(2);
-            p.setPen(pen)
-            r = QRect(x, y, pix.width(), pix.height()).adjusted(0, 0, -1, -1);
-            l = 15
-            p.drawLine(r.left(), r.top(), r.left() + l, r.top());
-            p.drawLine(r.left(), r.top(), r.left(), r.top() + l)
-            p.drawLine(r.right(), r.top(), r.right() - l, r.top());
-            p.drawLine(r.right(), r.top(), r.right(), r.top() + l)
-            p.drawLine(r.right(), r.bottom(), r.right() - l, r.bottom());
-            p.drawLine(r.right(), r.bottom(), r.right(), r.bottom() - l)
-            p.drawLine(r.left(), r.bottom(), r.left() + l, r.bottom());
-            p.drawLine(r.left(), r.bottom(), r.left(), r.bottom() - l)
-
-            p.setPen(QColor(255, 255, 255));
-            p.setFont(QFont("Consolas", 9, QFont.Weight.Bold))
-            p.drawText(r.left() + 5, r.top() + 15, self.display_name)
+        img = self.q_img
+        if img is not None and img.width() > 10:
+            x = (self.width() - img.width()) // 2;
+            y = (self.height() - img.height()) // 2
+            p.drawImage(x, y, img)
+            r = QRect(x, y, img.width(), img.height()).adjusted(0, 0, -1, -1);
+            p.drawPicture(0, 0, self._static_layer(r))
 
             if self.is_main and self.info.get("rec") == "REC":
                 p.setPen(QColor(255, 0, 0));
+                p.setFont(QFont("Consolas", 9, QFont.Weight.Bold))
                 p.drawText(r.right() - 40, r.top() + 15, "● REC")
 
             if self.hover_temp is not None and hasattr(self, 'last_mouse_pos_for_paint'):
@@ -140,9 +212,14 @@ class HUDDisplay(QLabel):
 
 
 class MainWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, replay=None, replay_speed=1.0, multiprocess=MP_MODE):
         super().__init__()
         self.cur_lang = "EN"
+        # 回放模式: 用录制会话 / 图片目录代替 Pi 的实时数据
+        self.replay, self.replay_speed = replay, replay_speed
+        # 多进程模式: 接收 + 计算放到子进程，只对实时数据生效
+        self.multiprocess = multiprocess and not replay
+        self.sources = []
         if os.path.exists("images/logo.ico"): self.setWindowIcon(QIcon("images/logo.ico"))
         self.setWindowTitle(TRANS[self.cur_lang]["title"])
         self.resize(1600, 900)
@@ -229,6 +306,20 @@ class MainWindow(QMainWindow):
         ag.addWidget(self.lbl_sc, 2, 0);
         ag.addWidget(self.sld_sc, 2, 1)
 
+        self.btn_calib = QPushButton("CALIB");
+        self.btn_calib.setStyleSheet("background:#222; color:#aaa; border:none; padding:4px;")
+        self.btn_calib.clicked.connect(self.toggle_calib);
+        self.btn_calib.setEnabled(False)
+        ag.addWidget(self.btn_calib, 3, 0, 1, 2)
+
+        # 显示路的丢帧策略，点击轮换
+        self.policy = DISPLAY_POLICY
+        self.btn_policy = QPushButton("DROP");
+        self.btn_policy.setStyleSheet("background:#222; color:#aaa; border:none; padding:4px;")
+        self.btn_policy.clicked.connect(self.cycle_policy);
+        self.btn_policy.setEnabled(False)
+        ag.addWidget(self.btn_policy, 4, 0, 1, 2)
+
         dc_layout.addWidget(self.align_frame)
 
         self.log_v = QTextEdit();
@@ -257,6 +348,10 @@ class MainWindow(QMainWindow):
         self.btn_mode.setStyleSheet("background:#112211; color:#0f0; padding:6px; border:1px solid #050;")
         self.btn_mode.clicked.connect(self.toggle_mode);
         self.btn_mode.setEnabled(False)
+        self.btn_rec = QPushButton("REC");
+        self.btn_rec.setStyleSheet("background:#220000; color:#f44; padding:6px; border:1px solid #700;")
+        self.btn_rec.clicked.connect(self.toggle_record);
+        self.btn_rec.setEnabled(False)
         self.btn_lang = QPushButton("LANG");
         self.btn_lang.setStyleSheet("background:#001133; color:#0ff; padding:6px; border:1px solid #005577;")
         self.btn_lang.clicked.connect(self.toggle_lang)
@@ -266,6 +361,7 @@ class MainWindow(QMainWindow):
         self.btn_start.clicked.connect(self.start)
 
         bot_row.addWidget(self.btn_mode);
+        bot_row.addWidget(self.btn_rec);
         bot_row.addWidget(self.btn_lang);
         bot_row.addWidget(self.btn_start)
         cc_layout.addLayout(bot_row)
@@ -299,7 +395,10 @@ class MainWindow(QMainWindow):
         self.setWindowTitle(t["title"])
         self.btn_start.setText(t["btn_stop"] if hasattr(self, 'eng') and self.eng.isRunning() else t["btn_start"])
         self.btn_mode.setText(t["mode_adjust"] if "ADJUST" in self.btn_mode.text() else t["mode_locked"])
+        self.btn_rec.setText(t["rec_stop"] if getattr(self, 'rec', None) else t["rec"])
         self.btn_check.setText(t["check"]);
+        self.btn_calib.setText(t["calib_stop"] if getattr(self, 'calib', None) else t["calib"])
+        self.btn_policy.setText(f"{t['policy']}: {self.policy.upper()}")
         self.btn_lang.setText(t["lang"]);
         self.btn_gen.setText(t["gen_4d"])
         self.lbl_rot.setText(t["rot"]);
@@ -312,25 +411,43 @@ class MainWindow(QMainWindow):
 
     def start(self):
         try:
-            from collections import deque
-            self.qv = deque(maxlen=4);
-            self.qt = deque(maxlen=4)
-
-            self.th_v = DataReceiver(PORT_VIDEO, self.qv, "video");
-            self.th_t = DataReceiver(PORT_THERMAL, self.qt, "thermal");
-            self.th_v.log_signal.connect(self.log)
-            self.th_t.log_signal.connect(self.log)
-            self.th_v.start();
-            self.th_t.start()
-
-            self.eng = SyncEngine(self.qv, self.qt)
-            self.eng.update_signal.connect(self.update_displays);
+            # 预分配帧环: 接收端直接写槽位，SyncEngine 在环上按时间戳配对，丢帧有计数
+            self.qv = FrameRing(SYNC_RING_VIS, (VIS_H, VIS_W), np.uint8);
+            self.qt = FrameRing(SYNC_RING_THERMAL, (THERMAL_H, THERMAL_W), np.uint16)
+
+            if self.multiprocess:
+                self.sources = []
+            elif self.replay:
+                self.sources = [ReplaySource(self.replay, self.qv, self.qt, speed=self.replay_speed, loop=True)]
+            elif INGEST_BACKEND == "selectors":
+                # 单线程收所有连接，第一台上线的设备进 qv/qt
+                self.sources = [IngestServer((self.qv, self.qt))]
+            elif INGEST_BACKEND == "asyncio":
+                self.sources = [AsyncIngest({"video": self.qv, "thermal": self.qt})]
+            else:
+                self.th_v = DataReceiver(PORT_VIDEO, self.qv, "video");
+                self.th_t = DataReceiver(PORT_THERMAL, self.qt, "thermal");
+                self.sources = [self.th_v, self.th_t]
+            for src in self.sources:
+                src.log_signal.connect(self.log)
+                src.start()
+
+            self.eng = EngineProcess() if self.multiprocess else SyncEngine(self.qv, self.qt)
+            # 引擎只覆盖信箱里的最新结果，UI 按显示帧率来取，事件队列里不堆帧
+            self.display_timer = QTimer(self)
+            self.display_timer.setSingleShot(True)
+            self.display_timer.timeout.connect(self.pull_frame)
+            self.next_display = 0.0
+            self.eng.mailbox.ready.connect(self.schedule_display)
             self.eng.log_signal.connect(self.log)
             self.eng.start()
 
             self.btn_start.setDisabled(True);
             self.btn_mode.setEnabled(True);
-            self.btn_check.setEnabled(True)
+            self.btn_check.setEnabled(True);
+            self.btn_calib.setEnabled(not self.multiprocess);
+            self.btn_policy.setEnabled(True);
+            self.btn_rec.setEnabled(not self.replay and not self.multiprocess)
             t = TRANS[self.cur_lang]
             self.eng.set_mode("ADJUST");
             self.btn_mode.setText(t["mode_adjust"]);
@@ -356,6 +473,48 @@ class MainWindow(QMainWindow):
         self.btn_mode.setText(txt);
         self.eng.set_mode(nm)
 
+    def toggle_record(self):
+        # 录制挂在接收线程上，存的是线上原始负载
+        if getattr(self, 'rec', None):
+            for src in self.sources: src.recorder = None
+            if self.eng.evt_engine: self.eng.evt_engine.recorder = None
+            self.rec.stop(); self.rec = None
+            self.eng.recording = False
+        else:
+            self.rec = SessionRecorder()
+            self.rec.log_signal.connect(self.log)
+            self.rec.start()
+            for src in self.sources: src.recorder = self.rec
+            # 事件路逐帧输出的 DVS 事件也写进同一个会话
+            if self.eng.evt_engine: self.eng.evt_engine.recorder = self.rec
+            self.eng.recording = True
+        self.update_ui_text()
+
+    def toggle_calib(self):
+        # 标定线程从 SyncEngine 抽帧，结果直接换进 ImageAligner
+        if getattr(self, 'calib', None):
+            self.eng.calibrator = None
+            self.calib.stop(); self.calib = None
+        else:
+            self.calib = AutoCalibrator(self.eng.algo_align)
+            self.calib.log_signal.connect(self.log)
+            self.calib.finished.connect(self.on_calib_finished)
+            self.calib.start()
+            self.eng.calibrator = self.calib
+        self.update_ui_text()
+
+    def on_calib_finished(self):
+        if getattr(self, 'calib', None) and self.calib.isFinished():
+            self.eng.calibrator = None
+            self.calib = None
+            self.update_ui_text()
+
+    def cycle_policy(self):
+        names = list(POLICIES)
+        self.policy = names[(names.index(self.policy) + 1) % len(names)]
+        self.eng.set_policy("display", self.policy)
+        self.update_ui_text()
+
     def toggle_checker(self):
         self.eng.update_align_params(toggle_checker=True)
 
@@ -374,6 +533,17 @@ class MainWindow(QMainWindow):
         self.log(f"SWAP: {clicked_key} -> MAIN");
         self.update_ui_text()
 
+    def schedule_display(self):
+        """ 信箱从空变满时调用 (最多排队一个)；离上次显示不足一个显示周期就等到点再取 """
+        if self.display_timer.isActive(): return
+        self.display_timer.start(max(0, int((self.next_display - time.monotonic()) * 1000)))
+
+    def pull_frame(self):
+        item = self.eng.mailbox.take()
+        if item is None: return
+        self.next_display = time.monotonic() + 1.0 / UI_DISPLAY_FPS
+        self.update_displays(*item)
+
     @pyqtSlot(np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, dict)
     def update_displays(self, fus, raw_therm, raw_evt, roi, depth, info):
         try:
@@ -384,12 +554,31 @@ class MainWindow(QMainWindow):
                 c_type = self.win_state.get(hud_key, "NONE")
                 img = content_map.get(c_type, None)
                 raw_t_data = self.eng.cache_t_raw if c_type == "THERMAL" else None
-                getattr(self, hud_key).update_frame(img, c_type, info, raw_t_data)
+                hud = getattr(self, hud_key)
+                hud.update_frame(img, c_type, info, raw_t_data)
+                if c_type == "FUSION": self.report_display_size(hud)
         except:
             pass
 
+    def report_display_size(self, hud):
+        # 融合画面所在控件的物理像素尺寸，变了才告诉引擎 (决定可见光缩小解码的倍数)
+        dpr = hud.devicePixelRatioF()
+        size = (int(hud.width() * dpr), int(hud.height() * dpr))
+        if size != getattr(self, "display_size", None):
+            self.display_size = size
+            self.eng.set_display_size(*size)
+
+    def changeEvent(self, e):
+        super().changeEvent(e)
+        # 从最小化恢复: 子控件不一定收到 showEvent，逐个补画隐藏期间跳过的帧
+        if e.type() == QEvent.Type.WindowStateChange and not self.isMinimized():
+            for hud in self.findChildren(HUDDisplay): QTimer.singleShot(0, hud.show_hidden)
+
     def closeEvent(self, e):
         try:
-            self.eng.stop(); self.th_v.stop(); self.th_t.stop()
+            if getattr(self, 'rec', None): self.toggle_record()
+            if getattr(self, 'calib', None): self.toggle_calib()
+            self.eng.stop()
+            for src in self.sources: src.stop()
         except:
             pass
\ No newline at end of file